@@ -0,0 +1 @@
+"""Benchmarks for cmd2csv hot paths (simulated devices)."""
@@ -0,0 +1,164 @@
+"""
+模拟 pyATS 设备：不建立 SSH，按配置的延迟回放预先生成的命令输出。
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, Any, List
+import random
+import time
+
+
+class FakeParseError(Exception):
+    pass
+
+
+# 各解析引擎对应的命令；ntc 命令使用 ntc-templates 自带的模板
+GENIE_COMMAND = "show bench genie"
+NTC_COMMAND = "show ip interface brief"
+TEXTFSM_COMMAND = "show bench textfsm"
+RAW_COMMAND = "show bench raw"
+
+ENGINE_COMMANDS = {
+    "genie": GENIE_COMMAND,
+    "ntc": NTC_COMMAND,
+    "textfsm": TEXTFSM_COMMAND,
+    "raw": RAW_COMMAND,
+}
+
+TEXTFSM_TEMPLATE = """\
+Value Name (\\S+)
+Value Status (\\S+)
+Value Counter (\\d+)
+
+Start
+  ^${Name}\\s+${Status}\\s+${Counter}\\s*$$ -> Record
+"""
+
+
+def _ntc_output(n: int) -> str:
+    lines = ["Interface              IP-Address      OK? Method Status                Protocol"]
+    for i in range(n):
+        lines.append(
+            f"GigabitEthernet{i:<9} 10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256:<7} YES manual up                    up"
+        )
+    return "\n".join(lines)
+
+
+def _textfsm_output(n: int) -> str:
+    return "\n".join(f"obj{i} up {i * 7}" for i in range(n))
+
+
+def _raw_output(n: int) -> str:
+    lines = ["Name      State     Peer            Uptime"]
+    for i in range(n):
+        lines.append(f"peer{i:<5} Estab     192.0.2.{i % 256:<7} 1d{i % 24:02d}h")
+    return "\n".join(lines)
+
+
+def _genie_parsed(n: int) -> Dict[str, Any]:
+    return {
+        f"Ethernet{i}": {
+            "status": "up",
+            "counters": {"in_pkts": i * 11, "out_pkts": i * 13},
+            "mtu": 1500,
+        }
+        for i in range(n)
+    }
+
+
+@dataclass
+class CannedOutputs:
+    """每个命令的原始输出，以及 genie 命令的解析结果。"""
+    raw: Dict[str, str]
+    genie: Dict[str, Dict[str, Any]]
+
+    @classmethod
+    def build(cls, lines: int) -> "CannedOutputs":
+        return cls(
+            raw={
+                GENIE_COMMAND: "\n".join(f"Ethernet{i} is up" for i in range(lines)),
+                NTC_COMMAND: _ntc_output(lines),
+                TEXTFSM_COMMAND: _textfsm_output(lines),
+                RAW_COMMAND: _raw_output(lines),
+            },
+            genie={GENIE_COMMAND: _genie_parsed(lines)},
+        )
+
+
+@dataclass
+class FakeDevice:
+    """
+    满足 collect_from_testbed / process_one 所用接口的设备对象：
+    connect / disconnect / is_connected / execute / parse(cmd, output=...) / name / os / custom
+    """
+    name: str
+    outputs: CannedOutputs
+    latency: float = 0.0
+    connect_latency: float = 0.0
+    os: str = "iosxe"
+    custom: Dict[str, Any] = field(default_factory=dict)
+    executed: int = 0
+    connects: int = 0
+    connected: bool = False
+
+    def connect(self, **kwargs) -> None:
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        self.connects += 1
+        self.connected = True
+
+    def disconnect(self) -> None:
+        self.connected = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def execute(self, command, **kwargs):
+        # 与 Unicon 相同：命令列表一次执行，返回 command -> output
+        self.executed += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(command, list):
+            return {c: self.outputs.raw.get(c, "") for c in command}
+        return self.outputs.raw.get(command, "")
+
+    def parse(self, command: str, output: str | None = None, **kwargs) -> Dict[str, Any]:
+        parsed = self.outputs.genie.get(command)
+        if parsed is None:
+            raise FakeParseError(command)
+        return parsed
+
+
+class FakeTestbed:
+    def __init__(self, devices: List[FakeDevice]):
+        self.devices = {d.name: d for d in devices}
+
+
+def build_fake_testbed(
+    n_devices: int,
+    lines: int,
+    latency: float = 0.0,
+    connect_latency: float = 0.0,
+    sites: int = 10,
+    seed: int = 0,
+) -> FakeTestbed:
+    rnd = random.Random(seed)
+    outputs = CannedOutputs.build(lines)
+    devices = []
+    for i in range(n_devices):
+        devices.append(
+            FakeDevice(
+                name=f"bench-{i:05d}",
+                outputs=outputs,
+                latency=latency,
+                connect_latency=connect_latency,
+                custom={
+                    "site": f"site{rnd.randrange(sites)}",
+                    "role": rnd.choice(["core", "edge", "access"]),
+                    "ntc_platform": "cisco_ios",
+                },
+            )
+        )
+    # 打乱顺序，模拟 testbed 中设备无序到达
+    rnd.shuffle(devices)
+    return FakeTestbed(devices)
@@ -0,0 +1,362 @@
+"""
+采集 / 解析 / 导出热路径的基准测试。
+
+    python -m benchmarks.run --scenario fleet-1000 --save-baseline main
+    python -m benchmarks.run --scenario all --compare main
+
+每个场景在独立的子进程中运行，以便单独统计峰值 RSS。
+"""
+from __future__ import annotations
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from cmd2csv.exporter import StreamingCsvExporter, export_per_command_as_csv
+from cmd2csv.flatten import FlattenPlan
+from cmd2csv.rows import RowStore
+from cmd2csv.parser_pipeline import (
+    collect_from_testbed,
+    fallback_whitespace,
+    genie_to_rows,
+    process_one,
+)
+
+from .fake_devices import (
+    CannedOutputs,
+    ENGINE_COMMANDS,
+    GENIE_COMMAND,
+    RAW_COMMAND,
+    TEXTFSM_TEMPLATE,
+    build_fake_testbed,
+)
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+@dataclass
+class Scenario:
+    devices: int
+    lines: int
+    engines: tuple[str, ...] = ("genie", "ntc", "textfsm", "raw")
+    latency: float = 0.0          # 每条命令的模拟延迟（秒）
+    connect_latency: float = 0.0  # 每台设备的模拟连接延迟（秒）
+    workers: int = 1
+    batch: bool = False           # 每台设备的命令一次发送（collect_from_testbed batch=True）
+    repeat: int = 50              # 单阶段微基准的重复次数
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "smoke": Scenario(devices=10, lines=20, repeat=10),
+    "fleet-100": Scenario(devices=100, lines=50, latency=0.005, workers=32),
+    "fleet-100-batch": Scenario(devices=100, lines=50, latency=0.005, workers=32, batch=True),
+    "fleet-1000": Scenario(devices=1000, lines=50, latency=0.005, workers=64),
+    "fleet-10000": Scenario(devices=10000, lines=20, latency=0.002, workers=128, repeat=20),
+    "huge-output": Scenario(devices=20, lines=20000, repeat=5),
+    "genie-only": Scenario(devices=200, lines=200, engines=("genie",)),
+    "ntc-only": Scenario(devices=200, lines=200, engines=("ntc",)),
+    "textfsm-only": Scenario(devices=200, lines=200, engines=("textfsm",)),
+    "raw-only": Scenario(devices=200, lines=200, engines=("raw",)),
+}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        idx = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return ordered[idx]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pct(0.50),
+        "p90": pct(0.90),
+        "p99": pct(0.99),
+        "max": ordered[-1],
+    }
+
+
+def _time_calls(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _wrap_devices(testbed) -> Dict[str, List[float]]:
+    """在设备上记录连接到断开的耗时，得到每台设备的采集延迟。"""
+    durations: Dict[str, List[float]] = {"device": []}
+    for dev in testbed.devices.values():
+        orig_connect, orig_disconnect = dev.connect, dev.disconnect
+
+        def connect(_orig=orig_connect, _dev=dev, **kwargs):
+            _dev._bench_t0 = time.perf_counter()
+            return _orig(**kwargs)
+
+        def disconnect(_orig=orig_disconnect, _dev=dev):
+            _orig()
+            durations["device"].append(time.perf_counter() - _dev._bench_t0)
+
+        dev.connect, dev.disconnect = connect, disconnect
+    return durations
+
+
+def run_scenario(name: str, sc: Scenario) -> Dict[str, Any]:
+    commands = [ENGINE_COMMANDS[e] for e in sc.engines]
+    outputs = CannedOutputs.build(sc.lines)
+    stages: Dict[str, Dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory(prefix="cmd2csv-bench-") as tmp:
+        templates_dir = Path(tmp) / "templates"
+        templates_dir.mkdir()
+        (templates_dir / "cisco_ios__show_bench_textfsm.textfsm").write_text(TEXTFSM_TEMPLATE)
+
+        testbed = build_fake_testbed(
+            sc.devices,
+            sc.lines,
+            latency=sc.latency,
+            connect_latency=sc.connect_latency,
+        )
+        device_durations = _wrap_devices(testbed)
+
+        # 端到端：采集 + 流式导出
+        exporter = StreamingCsvExporter(str(Path(tmp) / "out"))
+        t0 = time.perf_counter()
+        collect_from_testbed(
+            testbed,
+            [],
+            commands,
+            templates_dir=str(templates_dir),
+            workers=sc.workers,
+            sink=exporter,
+            batch=sc.batch,
+        )
+        t1 = time.perf_counter()
+        written = exporter.close()
+        t2 = time.perf_counter()
+
+        rows = 0
+        out_bytes = 0
+        for path in written:
+            out_bytes += path.stat().st_size
+            with path.open(encoding="utf-8") as f:
+                rows += sum(1 for _ in f) - 1
+
+        stages["device"] = percentiles(device_durations["device"])
+
+        # 单阶段：每个引擎的 process_one（不含模拟延迟）
+        sample_dev = next(iter(testbed.devices.values()))
+        sample_dev.latency = 0.0
+        dev_meta = {
+            "timestamp": "bench",
+            "hostname": sample_dev.name,
+            "site": sample_dev.custom["site"],
+            "role": sample_dev.custom["role"],
+            "os": sample_dev.os,
+        }
+        sample_rows: Dict[str, RowStore] = {}
+        for engine in sc.engines:
+            cmd = ENGINE_COMMANDS[engine]
+            stages[f"process_one[{engine}]"] = percentiles(_time_calls(
+                lambda cmd=cmd: process_one(
+                    sample_dev, dev_meta, "cisco_ios", cmd, templates_dir=str(templates_dir)
+                ),
+                sc.repeat,
+            ))
+            entity_name, rows_ = process_one(
+                sample_dev, dev_meta, "cisco_ios", cmd, templates_dir=str(templates_dir)
+            )
+            sample_rows[entity_name] = rows_
+
+        if "genie" in sc.engines:
+            parsed = outputs.genie[GENIE_COMMAND]
+            plan = FlattenPlan()  # 与采集时一样复用同一份展平计划
+            stages["genie_to_rows"] = percentiles(
+                _time_calls(lambda: genie_to_rows(parsed, plan), sc.repeat)
+            )
+        if "raw" in sc.engines:
+            raw = outputs.raw[RAW_COMMAND]
+            stages["fallback_whitespace"] = percentiles(
+                _time_calls(lambda: fallback_whitespace(raw, "cisco_ios", RAW_COMMAND), sc.repeat)
+            )
+
+        # 导出：用样本设备的行复制出至多 100 台设备的数据（大输出时按行数缩减）
+        n_export = max(1, min(sc.devices, 100, 20000 // max(1, sc.lines)))
+        entities = {
+            name_: RowStore(rows_.with_meta(hostname=f"bench-{i:05d}") for i in range(n_export))
+            for name_, rows_ in sample_rows.items()
+        }
+        export_dir = str(Path(tmp) / "export")
+        stages["export_per_command_as_csv"] = percentiles(_time_calls(
+            lambda: export_per_command_as_csv(entities, export_dir),
+            max(1, sc.repeat // 10),
+        ))
+
+    total = t1 - t0
+    return {
+        "scenario": name,
+        "config": asdict(sc),
+        "collect_seconds": total,
+        "export_close_seconds": t2 - t1,
+        "devices_per_second": sc.devices / total if total else 0.0,
+        "rows_per_second": rows / (t2 - t0) if t2 > t0 else 0.0,
+        "rows": rows,
+        "output_bytes": out_bytes,
+        "stages": stages,
+        # Linux 下 ru_maxrss 单位为 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_isolated(name: str, sc: Scenario) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(run_scenario, name, sc).result()
+
+
+def save_baseline(label: str, results: List[Dict[str, Any]]) -> Path:
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    path = BASELINE_DIR / f"{label}.json"
+    existing: Dict[str, Any] = {}
+    if path.exists():
+        existing = json.loads(path.read_text())
+    existing.setdefault("results", {})
+    existing["python"] = platform.python_version()
+    existing["machine"] = platform.machine()
+    for r in results:
+        existing["results"][r["scenario"]] = r
+    path.write_text(json.dumps(existing, indent=2, sort_keys=True))
+    return path
+
+
+def compare(label: str, results: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """返回回归描述；吞吐下降或 p50 / 峰值内存上升超过 threshold 视为回归。"""
+    path = BASELINE_DIR / f"{label}.json"
+    base = json.loads(path.read_text())["results"]
+    regressions: List[str] = []
+
+    for r in results:
+        b = base.get(r["scenario"])
+        if b is None:
+            continue
+        name = r["scenario"]
+
+        for key in ("devices_per_second", "rows_per_second"):
+            if b[key] and r[key] < b[key] * (1 - threshold):
+                regressions.append(f"{name}: {key} {b[key]:.1f} -> {r[key]:.1f}")
+
+        if b["peak_rss_mb"] and r["peak_rss_mb"] > b["peak_rss_mb"] * (1 + threshold):
+            regressions.append(
+                f"{name}: peak_rss_mb {b['peak_rss_mb']:.1f} -> {r['peak_rss_mb']:.1f}"
+            )
+
+        for stage, stats in r["stages"].items():
+            old = b["stages"].get(stage, {}).get("p50")
+            if old and stats["p50"] > old * (1 + threshold):
+                regressions.append(
+                    f"{name}: {stage} p50 {old * 1e3:.3f}ms -> {stats['p50'] * 1e3:.3f}ms"
+                )
+    return regressions
+
+
+def format_result(r: Dict[str, Any]) -> str:
+    lines = [
+        f"== {r['scenario']} ==",
+        f"  collect: {r['collect_seconds']:.3f}s  export close: {r['export_close_seconds']:.3f}s",
+        f"  throughput: {r['devices_per_second']:.1f} devices/s, {r['rows_per_second']:.0f} rows/s",
+        f"  rows: {r['rows']}  output: {r['output_bytes'] / 1e6:.2f} MB  peak RSS: {r['peak_rss_mb']:.1f} MB",
+    ]
+    for stage, s in r["stages"].items():
+        if not s:
+            continue
+        lines.append(
+            f"  {stage:<28} p50 {s['p50'] * 1e3:9.3f}ms  p90 {s['p90'] * 1e3:9.3f}ms"
+            f"  p99 {s['p99'] * 1e3:9.3f}ms  (n={s['count']})"
+        )
+    return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="benchmarks.run",
+        description="Benchmark cmd2csv collection, parsing and export with simulated devices.",
+    )
+    p.add_argument(
+        "--scenario",
+        action="append",
+        default=None,
+        help=f"Scenario name, repeatable, or 'all' (choices: {', '.join(SCENARIOS)})",
+    )
+    p.add_argument("--devices", type=int, default=None, help="Override device count")
+    p.add_argument("--lines", type=int, default=None, help="Override output lines per command")
+    p.add_argument("--latency", type=float, default=None, help="Override per-command latency (s)")
+    p.add_argument("--workers", type=int, default=None, help="Override collection workers")
+    p.add_argument("--batch", action="store_true", help="Force batched command execution")
+    p.add_argument("--save-baseline", default=None, help="Save results under this baseline label")
+    p.add_argument("--compare", default=None, help="Compare against this baseline label")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative change treated as a regression (default: 0.10)",
+    )
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    return p
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+
+    names = args.scenario or ["smoke"]
+    if "all" in names:
+        names = list(SCENARIOS)
+
+    results = []
+    for name in names:
+        sc = SCENARIOS[name]
+        overrides = {
+            k: v for k, v in (
+                ("devices", args.devices),
+                ("lines", args.lines),
+                ("latency", args.latency),
+                ("workers", args.workers),
+                ("batch", args.batch or None),
+            ) if v is not None
+        }
+        sc = Scenario(**{**asdict(sc), **overrides})
+        r = run_isolated(name, sc)
+        results.append(r)
+        if not args.json:
+            print(format_result(r), flush=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        path = save_baseline(args.save_baseline, results)
+        print(f"baseline saved: {path}", file=sys.stderr)
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+CLI 启动耗时基准（python -X importtime）。
+
+    python -m benchmarks.startup --save-baseline main
+    python -m benchmarks.startup --compare main
+
+每个目标在新的解释器中运行若干次，统计墙钟时间和导入耗时（importtime 的 self 时间之和），
+并检查重量级依赖（genie / pyats / unicon / ntc_templates / textfsm / requests）
+没有在启动时被导入。
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Any, List
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from .run import BASELINE_DIR
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 名称 -> 在新解释器中执行的代码
+TARGETS: Dict[str, str] = {
+    "import-cli": "import cmd2csv.cli",
+    "help": "import sys; sys.argv = ['cmd2csv', '--help']\n"
+            "import cmd2csv.cli\n"
+            "try:\n    cmd2csv.cli.main()\nexcept SystemExit:\n    pass",
+    "import-exporter": "import cmd2csv.exporter",
+    "import-daemon": "import cmd2csv.daemon",
+}
+
+# 这些模块只应在对应引擎 / testbed 后端首次使用时导入
+HEAVY_MODULES = ("genie", "pyats", "unicon", "ntc_templates", "textfsm", "requests", "asyncssh")
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """返回 顶层包 -> 自身导入耗时之和（微秒）；按 self 时间汇总，不会重复计算。"""
+    out: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|")
+            us = int(self_us)
+        except ValueError:
+            continue
+        top = name.strip().split(".")[0]
+        out[top] = out.get(top, 0) + us
+    return out
+
+
+def measure(name: str, code: str, runs: int) -> Dict[str, Any]:
+    walls: List[float] = []
+    imports: Dict[str, int] = {}
+    loaded: set[str] = set()
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        walls.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{proc.stderr[-2000:]}")
+        imports = parse_importtime(proc.stderr)
+        loaded.update(m for m in imports if m in HEAVY_MODULES)
+
+    total_us = sum(imports.values())
+    top = sorted(imports.items(), key=lambda kv: kv[1], reverse=True)[:8]
+    return {
+        "target": name,
+        "runs": runs,
+        "wall_p50": statistics.median(walls),
+        "wall_min": min(walls),
+        "import_ms": total_us / 1e3,
+        "top_imports_ms": {k: v / 1e3 for k, v in top},
+        "heavy_loaded": sorted(loaded),
+    }
+
+
+def format_result(r: Dict[str, Any]) -> str:
+    lines = [
+        f"== {r['target']} ==",
+        f"  wall p50 {r['wall_p50'] * 1e3:.1f}ms  min {r['wall_min'] * 1e3:.1f}ms  "
+        f"imports {r['import_ms']:.1f}ms  (n={r['runs']})",
+        "  top: " + ", ".join(f"{k} {v:.1f}ms" for k, v in r["top_imports_ms"].items()),
+    ]
+    if r["heavy_loaded"]:
+        lines.append(f"  heavy modules loaded at startup: {', '.join(r['heavy_loaded'])}")
+    return "\n".join(lines)
+
+
+def baseline_path(label: str) -> Path:
+    return BASELINE_DIR / f"startup-{label}.json"
+
+
+def save_baseline(label: str, results: List[Dict[str, Any]]) -> Path:
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    path = baseline_path(label)
+    payload = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {r["target"]: r for r in results},
+    }
+    path.write_text(json.dumps(payload, indent=2, sort_keys=True))
+    return path
+
+
+def compare(label: str, results: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """墙钟 p50 或导入耗时上升超过 threshold，或启动时导入了重量级模块，视为回归。"""
+    base = json.loads(baseline_path(label).read_text())["results"]
+    regressions: List[str] = []
+    for r in results:
+        name = r["target"]
+        if r["heavy_loaded"]:
+            regressions.append(f"{name}: imports {', '.join(r['heavy_loaded'])} at startup")
+        b = base.get(name)
+        if b is None:
+            continue
+        for key in ("wall_p50", "import_ms"):
+            if b[key] and r[key] > b[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {b[key]:.3f} -> {r[key]:.3f}")
+    return regressions
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="benchmarks.startup",
+        description="Measure cmd2csv CLI startup time with python -X importtime.",
+    )
+    p.add_argument(
+        "--target",
+        action="append",
+        default=None,
+        help=f"Target, repeatable (choices: {', '.join(TARGETS)}; default: all)",
+    )
+    p.add_argument("--runs", type=int, default=5, help="Interpreter launches per target (default: 5)")
+    p.add_argument("--save-baseline", default=None, help="Save results under this baseline label")
+    p.add_argument("--compare", default=None, help="Compare against this baseline label")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Relative slowdown treated as a regression (default: 0.25)",
+    )
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    return p
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    names = args.target or list(TARGETS)
+
+    results = []
+    for name in names:
+        r = measure(name, TARGETS[name], args.runs)
+        results.append(r)
+        if not args.json:
+            print(format_result(r), flush=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        path = save_baseline(args.save_baseline, results)
+        print(f"baseline saved: {path}", file=sys.stderr)
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
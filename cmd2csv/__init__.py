@@ -3,7 +3,27 @@
 __all__ = [
     "cli",
     "ndb_client",
+    "inventory_cache",
     "devices",
     "parser_pipeline",
     "exporter",
+    "template_registry",
+    "capture_store",
+    "reparse",
+    "metrics",
+    "routing",
+    "parse_stage",
+    "async_collect",
+    "session_pool",
+    "daemon",
+    "snapshot",
+    "engines",
+    "engine_genie",
+    "engine_ntc",
+    "engine_textfsm",
+    "flatten",
+    "fixed_width",
+    "health",
+    "scheduling",
+    "rows",
 ]
@@ -0,0 +1,476 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, AsyncIterator, Iterable
+from concurrent.futures import Executor
+from datetime import datetime
+import asyncio
+import functools
+import threading
+import time
+
+from .devices import ClassifiedDevice, offline_device, parser_tokens
+from .metrics import NULL_METRICS
+from .parser_pipeline import (
+    batch_chunks,
+    batch_outputs,
+    count_parsed,
+    normalize_command,
+    parse_raw_output,
+    stamp_rows,
+)
+from .rows import RowStore
+from .scheduling import SESSION_KEY
+
+
+class Transport:
+    """
+    异步采集的传输接口。一个实例对应一台设备的一个会话。
+    """
+
+    # Genie 输出模式解析用的设备对象；None 时使用 offline_device
+    device = None
+    # 超时后会话状态不可信，不再发送命令
+    abandoned = False
+
+    def abandon(self) -> None:
+        """connect / execute 超时后调用。"""
+        self.abandoned = True
+
+    async def connect(self, timeout: float | None = None) -> None:
+        raise NotImplementedError
+
+    async def execute(self, command: str, timeout: float | None = None) -> str:
+        raise NotImplementedError
+
+    async def execute_batch(self, commands: List[str], timeout: float | None = None) -> List[str]:
+        """一次执行多条命令，按顺序返回各命令输出；默认逐条 execute。"""
+        return [await self.execute(cmd, timeout) for cmd in commands]
+
+    async def close(self) -> None:
+        raise NotImplementedError
+
+
+class UniconTransport(Transport):
+    """
+    pyATS / Unicon 设备适配器：阻塞调用放到线程池执行。
+
+    asyncio.wait_for 超时不会停止线程中的 Unicon 调用；abandon() 之后不再
+    发起新调用，close() 推迟到仍在运行的调用返回后由该线程断开。
+    """
+
+    def __init__(self, device, executor: Executor | None = None, setup_commands: Iterable[str] = ()):
+        self.device = device
+        self.executor = executor
+        self.setup_commands = list(setup_commands)
+        self._lock = threading.Lock()
+        self._running = False
+        self._close_pending = False
+        self._closed = False
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("session closed")
+            self._running = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running = False
+                close = self._close_pending
+            if close:
+                self._disconnect()
+
+    def _disconnect(self) -> None:
+        try:
+            self.device.disconnect()
+        except Exception:
+            pass
+
+    async def _call(self, fn, *args, **kwargs):
+        if self.abandoned:
+            raise RuntimeError("session abandoned after a timeout")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self._run, fn, *args, **kwargs))
+
+    async def connect(self, timeout: float | None = None) -> None:
+        kwargs: dict[str, Any] = {"log_stdout": False}
+        if timeout is not None:
+            kwargs["connection_timeout"] = timeout
+        await self._call(self.device.connect, **kwargs)
+        for cmd in self.setup_commands:
+            await self._call(self.device.execute, cmd)
+
+    async def execute(self, command: str, timeout: float | None = None) -> str:
+        if timeout is not None:
+            return await self._call(self.device.execute, command, timeout=timeout)
+        return await self._call(self.device.execute, command)
+
+    async def execute_batch(self, commands: List[str], timeout: float | None = None) -> List[str]:
+        unique = list(dict.fromkeys(commands))
+        combined = batch_outputs(unique, await self.execute(unique, timeout))
+        return [combined.get(cmd, "") for cmd in commands]
+
+    async def close(self) -> None:
+        if self.abandoned:
+            with self._lock:
+                self._close_pending = self._running
+                self._closed = not self._running
+            if self._closed:
+                self._disconnect()
+            return
+        await self._call(self.device.disconnect)
+
+
+class AsyncSSHTransport(Transport):
+    """
+    原生 asyncio SSH（asyncssh，可选依赖），每条命令一个 exec 通道，
+    不占用线程。
+
+    exec 通道之间不共享终端状态，也不分配 pty（输出不分页），因此没有
+    setup_commands（terminal length 0 等）。
+
+    默认按 known_hosts（None 为 ~/.ssh/known_hosts）校验主机密钥；
+    verify_host_keys=False 时不校验，只应在受控的管理网络中使用。
+    """
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        port: int = 22,
+        known_hosts: str | None = None,
+        verify_host_keys: bool = True,
+    ):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.known_hosts = known_hosts
+        self.verify_host_keys = verify_host_keys
+        self._conn = None
+
+    async def connect(self, timeout: float | None = None) -> None:
+        import asyncssh
+
+        kwargs: dict[str, Any] = {}
+        if not self.verify_host_keys:
+            kwargs["known_hosts"] = None
+        elif self.known_hosts:
+            kwargs["known_hosts"] = self.known_hosts
+        self._conn = await asyncssh.connect(
+            self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            connect_timeout=timeout,
+            **kwargs,
+        )
+
+    async def execute(self, command: str, timeout: float | None = None) -> str:
+        result = await self._conn.run(command, timeout=timeout)
+        return result.stdout or ""
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            await self._conn.wait_closed()
+            self._conn = None
+
+
+class FakeTransport(Transport):
+    """内存中的假传输，按命令回放固定输出，用于测试和基准。"""
+
+    def __init__(self, outputs: Dict[str, str], latency: float = 0.0, connect_latency: float = 0.0):
+        self.outputs = outputs
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.executed: list[str] = []
+
+    async def connect(self, timeout: float | None = None) -> None:
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+
+    async def execute(self, command: str, timeout: float | None = None) -> str:
+        self.executed.append(command)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.outputs.get(command, "")
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class Target:
+    hostname: str
+    pyats_os: str
+    ntc_platform: str
+    transport: Transport
+    site: str = ""
+    role: str = ""
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def targets_from_testbed(
+    testbed,
+    hostnames: List[str],
+    executor: Executor | None = None,
+    setup_commands: Iterable[str] = (),
+) -> List[Target]:
+    wanted = set(hostnames)
+    targets = []
+    for name in testbed.devices:
+        if wanted and name not in wanted:
+            continue
+        dev = testbed.devices[name]
+        targets.append(Target(
+            hostname=dev.name,
+            pyats_os=dev.os,
+            ntc_platform=dev.custom.get("ntc_platform", dev.os),
+            transport=UniconTransport(dev, executor, setup_commands),
+            site=dev.custom.get("site", ""),
+            role=dev.custom.get("role", ""),
+        ))
+    return targets
+
+
+def targets_from_devices(
+    devices: List[ClassifiedDevice],
+    username: str,
+    password: str,
+    known_hosts: str | None = None,
+    verify_host_keys: bool = True,
+) -> List[Target]:
+    """直接用 NDB 设备信息构造 asyncssh 目标，无需 load_testbed。"""
+    return [
+        Target(
+            hostname=d.hostname,
+            pyats_os=d.pyats_os,
+            ntc_platform=d.ntc_platform,
+            transport=AsyncSSHTransport(
+                d.mgmt_ip, username, password,
+                known_hosts=known_hosts, verify_host_keys=verify_host_keys,
+            ),
+            site=d.site or "",
+            role=d.role or "",
+        )
+        for d in devices
+    ]
+
+
+async def iter_collect(
+    targets: List[Target],
+    commands: List[str],
+    templates_dir: str | None = None,
+    concurrency: int = 500,
+    group_by: str | None = None,
+    group_limits: Dict[str, int] | None = None,
+    default_group_limit: int | None = None,
+    connect_timeout: float | None = None,
+    command_timeout: float | None = None,
+    parse_executor: Executor | None = None,
+    batch: bool = False,
+    capture=None,
+    metrics=NULL_METRICS,
+    router=None,
+    history=None,
+    breaker=None,
+    failures=None,
+    batch_size: int = 0,
+) -> AsyncIterator[tuple[str, List[Dict[str, Any]]]]:
+    """
+    asyncio 采集引擎：按完成顺序异步产出 (entity_name, rows)，每台设备每条命令一项。
+
+    - concurrency: 全局同时在线的会话数上限
+    - group_by="site" / "role": 每组再用 group_limits[组名]（或 default_group_limit）限流
+    - command_timeout: 每条命令的截止时间（asyncio.wait_for）；超时后该设备的会话
+      不再使用，剩余命令不再发送
+    - 解析在 parse_executor（默认线程池）中执行，不阻塞事件循环
+    - batch=True 时每台设备的全部命令通过一次 execute_batch 执行，batch_size > 0 时
+      每次至多 batch_size 条
+    - history（DurationHistory）记录每条命令和会话开销的耗时；targets 按给定顺序启动
+    - breaker（CircuitBreaker）/ failures（FailureLog）与 collect_from_testbed 相同：
+      单条命令失败只记录，熔断后跳过剩余命令；指定 failures 时单台设备失败
+      只记录，其余设备继续采集，否则异常中断整次采集
+    """
+    ts = datetime.utcnow().isoformat()
+    global_sem = asyncio.Semaphore(concurrency)
+    group_sems: dict[str, asyncio.Semaphore] = {}
+    group_limits = group_limits or {}
+
+    def group_sem(target: Target) -> asyncio.Semaphore | None:
+        if not group_by:
+            return None
+        group = getattr(target, group_by, "") or ""
+        limit = group_limits.get(group, default_group_limit)
+        if not limit:
+            return None
+        sem = group_sems.get(group)
+        if sem is None:
+            sem = group_sems[group] = asyncio.Semaphore(limit)
+        return sem
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    done = object()
+    loop = asyncio.get_running_loop()
+
+    def skip(hostname: str, stage: str, error, command: str = "") -> None:
+        metrics.failure(stage, error, hostname=hostname, **({"command": command} if command else {}))
+        if failures is not None:
+            failures.add(hostname, stage, error, command=command)
+
+    async def run_target(target: Target) -> None:
+        if breaker is not None and not breaker.allow(target.hostname):
+            skip(target.hostname, "circuit_open", "circuit open")
+            return
+        # 先取组信号量再取全局信号量：等待组名额的设备不占用全局名额
+        gsem = group_sem(target)
+        if gsem is not None:
+            await gsem.acquire()
+        try:
+            async with global_sem:
+                await collect_target(target)
+        except Exception:
+            # 已在 collect_target 中记入 failures；其余设备继续采集
+            if failures is None:
+                raise
+        finally:
+            if gsem is not None:
+                gsem.release()
+
+    async def bounded(t: Transport, aw, timeout: float | None):
+        try:
+            return await asyncio.wait_for(aw, timeout)
+        except asyncio.TimeoutError:
+            t.abandon()
+            raise
+
+    async def collect_target(target: Target) -> None:
+        dev_meta = {
+            "timestamp": ts,
+            "hostname": target.hostname,
+            "site": target.site,
+            "role": target.role,
+            "os": target.pyats_os,
+        }
+        device = target.transport.device or offline_device(target.pyats_os)
+        t = target.transport
+        t0 = time.perf_counter()
+        durations: dict[str, float] = {}
+        stage, current = "connect", ""
+        try:
+            try:
+                with metrics.timer("connect", hostname=target.hostname):
+                    await bounded(t, t.connect(connect_timeout), connect_timeout)
+            except Exception as exc:
+                metrics.failure("connect", exc, hostname=target.hostname)
+                raise
+
+            stage = "command"
+            try:
+                if batch:
+                    t_batch = time.perf_counter()
+                    try:
+                        raw_outputs = []
+                        for chunk in batch_chunks(commands, batch_size):
+                            with metrics.timer("execute_batch", hostname=target.hostname):
+                                timeout = command_timeout * len(chunk) if command_timeout else None
+                                raw_outputs += await bounded(t, t.execute_batch(chunk, command_timeout), timeout)
+                    except Exception as exc:
+                        current = "; ".join(commands)
+                        metrics.failure("command", exc, hostname=target.hostname, command=current)
+                        raise
+                    share = (time.perf_counter() - t_batch) / max(1, len(commands))
+
+                for i, cmd in enumerate(commands):
+                    if breaker is not None and breaker.tripped(target.hostname):
+                        # 熔断：剩余命令不再发送
+                        skip(target.hostname, "circuit_open", "circuit open", command="; ".join(commands[i:]))
+                        break
+                    current = cmd
+                    t_cmd = time.perf_counter()
+                    try:
+                        if batch:
+                            raw_output = raw_outputs[i]
+                        else:
+                            with metrics.timer("execute", hostname=target.hostname, command=cmd):
+                                raw_output = await bounded(t, t.execute(cmd, command_timeout), command_timeout)
+                        if capture is not None:
+                            capture.save(
+                                dev_meta, target.ntc_platform, cmd, normalize_command(cmd), raw_output,
+                                parser_tokens(device),
+                            )
+                        parse_engine, rows = await loop.run_in_executor(
+                            parse_executor,
+                            functools.partial(
+                                parse_raw_output, device, target.ntc_platform, cmd, raw_output,
+                                templates_dir=templates_dir, metrics=metrics, router=router,
+                            ),
+                        )
+                    except Exception as exc:
+                        metrics.failure("command", exc, hostname=target.hostname, command=cmd)
+                        # 超时的会话不再继续发送命令
+                        if breaker is None or t.abandoned:
+                            raise
+                        # 与线程引擎相同：记录后继续下一条命令，直到熔断器打开
+                        breaker.failure(target.hostname)
+                        if failures is not None:
+                            failures.add(target.hostname, "command", exc, command=cmd)
+                        continue
+                    if breaker is not None:
+                        breaker.success(target.hostname)
+                    count_parsed(metrics, parse_engine, cmd, rows)
+                    cmd_norm = normalize_command(cmd)
+                    seconds = time.perf_counter() - t_cmd + (share if batch else 0.0)
+                    durations[cmd_norm] = durations.get(cmd_norm, 0.0) + seconds
+                    await queue.put((cmd_norm, stamp_rows(dev_meta, cmd, parse_engine, rows)))
+            finally:
+                await t.close()
+        except Exception as exc:
+            if failures is not None:
+                failures.add(target.hostname, stage, exc, command=current)
+            if breaker is not None:
+                breaker.failure(target.hostname)
+            raise
+
+        if history is not None:
+            for cmd_norm, seconds in durations.items():
+                history.record(target.hostname, cmd_norm, seconds)
+            history.record(target.hostname, SESSION_KEY, max(0.0, time.perf_counter() - t0 - sum(durations.values())))
+
+    async def run_all() -> None:
+        try:
+            await asyncio.gather(*(run_target(t) for t in targets))
+        finally:
+            await queue.put(done)
+
+    runner = asyncio.ensure_future(run_all())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        await runner  # 传播采集中的异常
+    finally:
+        if not runner.done():
+            runner.cancel()
+
+
+def collect_async(targets: List[Target], commands: List[str], sink=None, **kwargs) -> Dict[str, RowStore]:
+    """
+    同步入口：运行 iter_collect 并把结果送给 sink（与 collect_from_testbed 相同约定）。
+    """
+    entities: dict[str, RowStore] = {}
+
+    async def main() -> None:
+        async for entity_name, rows in iter_collect(targets, commands, **kwargs):
+            if sink is not None:
+                sink.add_rows(entity_name, rows)
+            else:
+                entities.setdefault(entity_name, RowStore()).add(rows)
+
+    asyncio.run(main())
+    return entities
@@ -0,0 +1,96 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Any, Iterator, List, Tuple
+from datetime import datetime
+from pathlib import Path
+import gzip
+import json
+import threading
+
+
+@dataclass
+class Capture:
+    hostname: str
+    ntc_platform: str
+    command: str
+    dev_meta: Dict[str, Any]
+    path: Path
+    # 设备的解析器 token，见 devices.parser_tokens
+    tokens: Tuple[Tuple[str, str], ...] = ()
+
+    def read(self) -> str:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            return f.read()
+
+
+class CaptureStore:
+    """
+    原始输出存档：<root>/<run_id>/<hostname>/<normalized_command>.txt.gz
+
+    每台设备目录下的 manifest.jsonl 记录命令、平台、设备元数据和解析器 token，
+    供 reparse 在不连接设备的情况下选择与在线解析相同的解析器。
+    """
+
+    MANIFEST = "manifest.jsonl"
+
+    def __init__(self, root: str, run_id: str | None = None, compresslevel: int = 6):
+        self.root = Path(root)
+        self.run_id = run_id or datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        self.run_dir = self.root / self.run_id
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+
+    def save(
+        self,
+        dev_meta: Dict[str, Any],
+        ntc_platform: str,
+        command: str,
+        entity_name: str,
+        raw_output: str,
+        tokens: Tuple[Tuple[str, str], ...] = (),
+    ) -> Path:
+        host_dir = self.run_dir / dev_meta["hostname"]
+        host_dir.mkdir(parents=True, exist_ok=True)
+
+        path = host_dir / f"{entity_name}.txt.gz"
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=self.compresslevel) as f:
+            f.write(raw_output)
+
+        record = {
+            "command": command,
+            "ntc_platform": ntc_platform,
+            "file": path.name,
+            "dev_meta": dev_meta,
+            "parser_tokens": [list(t) for t in tokens],
+        }
+        with self._lock, (host_dir / self.MANIFEST).open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        return path
+
+
+def list_runs(root: str) -> List[str]:
+    root_path = Path(root)
+    if not root_path.is_dir():
+        return []
+    return sorted(p.name for p in root_path.iterdir() if p.is_dir())
+
+
+def list_hosts(root: str, run_id: str) -> List[Path]:
+    run_dir = Path(root) / run_id
+    return sorted(p for p in run_dir.iterdir() if (p / CaptureStore.MANIFEST).exists())
+
+
+def iter_host_captures(host_dir: Path) -> Iterator[Capture]:
+    with (host_dir / CaptureStore.MANIFEST).open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            yield Capture(
+                hostname=rec["dev_meta"]["hostname"],
+                ntc_platform=rec["ntc_platform"],
+                command=rec["command"],
+                dev_meta=rec["dev_meta"],
+                path=host_dir / rec["file"],
+                tokens=tuple(tuple(t) for t in rec.get("parser_tokens", ())),
+            )
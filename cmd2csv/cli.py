@@ -1,11 +1,25 @@
 from __future__ import annotations
 import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from typing import List
 
 from .ndb_client import NdbClient
+from .inventory_cache import InventoryCache, CachedNdbClient
 from .devices import classify_device, build_testbed_from_devices
-from .parser_pipeline import collect_from_testbed
-from .exporter import export_per_command_as_csv
+from .parser_pipeline import collect_from_testbed, normalize_command
+from .flatten import set_explode_depth
+from .exporter import StreamingCsvExporter, PartitionedCsvExporter, PARTITION_FIELDS
+from .snapshot import DeltaExporter, parse_key_columns
+from .template_registry import get_registry
+from .capture_store import CaptureStore
+from .metrics import RunMetrics, NULL_METRICS
+from .routing import EngineRouter
+from .health import FAILURES_CSV, CircuitBreaker, FailureLog, precheck
+from .scheduling import DurationHistory, Scheduler
 
 
 def parse_comma_list(s: str | None) -> List[str]:
@@ -31,14 +45,30 @@ def build_arg_parser() -> argparse.ArgumentParser:
     )
     p.add_argument(
         "--ndb-url",
-        required=True,
+        default=None,
         help="NDB base URL, e.g. https://ndb.example.com/api",
     )
     p.add_argument(
         "--ndb-token",
-        required=True,
+        default=None,
         help="NDB API token",
     )
+    p.add_argument(
+        "--inventory-cache",
+        default=None,
+        help="Path of a local JSON cache of NDB device records",
+    )
+    p.add_argument(
+        "--inventory-ttl",
+        type=float,
+        default=300.0,
+        help="Seconds before a cached device record is revalidated (default: 300)",
+    )
+    p.add_argument(
+        "--offline-inventory",
+        action="store_true",
+        help="Only use --inventory-cache, never contact NDB",
+    )
     p.add_argument(
         "--username",
         required=True,
@@ -54,37 +84,458 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=None,
         help="Optional TextFSM templates directory (for auto lookup)",
     )
+    p.add_argument(
+        "--genie-explode",
+        type=int,
+        default=None,
+        help="Levels of dynamic keys (interfaces, VRFs, addresses, ...) in Genie output "
+             "exploded into rows; deeper levels become columns (default: all, 0: one row)",
+    )
     p.add_argument(
         "--output-dir",
         default="output",
         help="Output directory for CSV files",
     )
+    p.add_argument(
+        "--partition-by",
+        default=None,
+        help=f"Partitioned layout command=<cmd>/<field>=<value>/part-N.csv; comma separated "
+             f"fields from {', '.join(PARTITION_FIELDS)}, e.g. site,date",
+    )
+    p.add_argument(
+        "--max-rows-per-file",
+        type=int,
+        default=None,
+        help="With --partition-by, start a new part file after this many rows (default: 1000000)",
+    )
+    p.add_argument(
+        "--append",
+        action="store_true",
+        help="With --partition-by, add part files instead of replacing the partitions written",
+    )
+    p.add_argument(
+        "--export-workers",
+        type=int,
+        default=None,
+        help="With --partition-by, partitions written concurrently (default: 4)",
+    )
+    p.add_argument(
+        "--delta-dir",
+        default=None,
+        help="Snapshot directory; write only rows added/changed/removed since the last run",
+    )
+    p.add_argument(
+        "--delta-format",
+        choices=DeltaExporter.MODES,
+        default="changelog",
+        help="changelog: one <cmd>.changes.csv with a change column; "
+             "split: <cmd>.added/.changed/.removed.csv (default: changelog)",
+    )
+    p.add_argument(
+        "--delta-key",
+        action="append",
+        default=None,
+        help='Row key columns for a command, e.g. "show ip int brief=intf" (repeatable)',
+    )
+    p.add_argument(
+        "--capture-dir",
+        default=None,
+        help="Store compressed raw command outputs here for `cmd2csv reparse`",
+    )
+    p.add_argument(
+        "--run-id",
+        default=None,
+        help="Capture run id (default: UTC timestamp)",
+    )
+    p.add_argument(
+        "--routing-table",
+        default=None,
+        help="Persistent parse-engine routing table (JSON); inspect with `cmd2csv routes`",
+    )
+    p.add_argument(
+        "--run-report",
+        default=None,
+        help="Write a JSON run report (per-stage timings, counters, failures) to this path",
+    )
+    p.add_argument(
+        "--prom-textfile",
+        default=None,
+        help="Write Prometheus textfile-collector metrics to this path (*.prom)",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of devices to collect from concurrently (default: 1, serial)",
+    )
+    p.add_argument(
+        "--engine",
+        choices=("threads", "asyncio"),
+        default="threads",
+        help="Collection engine (default: threads)",
+    )
+    p.add_argument(
+        "--transport",
+        choices=("unicon", "asyncssh"),
+        default="unicon",
+        help="Transport for --engine asyncio (default: unicon, run in a thread pool)",
+    )
+    p.add_argument(
+        "--known-hosts",
+        default=None,
+        help="known_hosts file for --transport asyncssh (default: ~/.ssh/known_hosts)",
+    )
+    p.add_argument(
+        "--no-host-key-check",
+        action="store_true",
+        help="With --transport asyncssh, accept any host key (disables MITM protection)",
+    )
+    p.add_argument(
+        "--group-by",
+        choices=("site", "role"),
+        default=None,
+        help="Cap concurrent sessions per site or role (with --group-limit)",
+    )
+    p.add_argument(
+        "--group-limit",
+        type=int,
+        default=None,
+        help="Max concurrent sessions per --group-by group",
+    )
+    p.add_argument(
+        "--history",
+        default=None,
+        help="Per-device, per-command duration history (JSON). Devices expected to take "
+             "longest start first, and predicted vs actual makespan is reported",
+    )
+    p.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Parse outputs in this many worker processes instead of the collector threads "
+             "(default: 0, parse inline)",
+    )
+    p.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send each device's whole command list in one execute call",
+    )
+    p.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="With --batch, send at most this many commands per execute call (default: all)",
+    )
+    p.add_argument(
+        "--setup-commands",
+        default=None,
+        help='Comma separated commands run once per session, e.g. "terminal length 0"',
+    )
+    p.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=None,
+        help="Per-device connection timeout in seconds",
+    )
+    p.add_argument(
+        "--command-timeout",
+        type=float,
+        default=None,
+        help="Per-command execution timeout in seconds",
+    )
+    p.add_argument(
+        "--precheck-timeout",
+        type=float,
+        default=None,
+        help="Probe TCP/22 on every management address concurrently with this timeout and "
+             "skip unreachable devices before connecting (default: off)",
+    )
+    p.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=0,
+        help="Keep sending commands to a device after a failed one, until this many consecutive "
+             "failures open its circuit (default: 0, off)",
+    )
+    p.add_argument(
+        "--failures-csv",
+        default=None,
+        help="Write this run's per-device failures here, even when nothing failed "
+             f"(default: <output-dir>/{FAILURES_CSV}, only when something failed)",
+    )
     return p
 
 
-def main():
+def main(argv: List[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "reparse":
+        from .reparse import main as reparse_main
+        return reparse_main(argv[1:])
+    if argv and argv[0] == "routes":
+        from .routing import main as routes_main
+        return routes_main(argv[1:])
+    if argv and argv[0] == "daemon":
+        from .daemon import main as daemon_main
+        return daemon_main(argv[1:])
+    if argv and argv[0] == "submit":
+        from .daemon import submit_main
+        return submit_main(argv[1:])
+
     parser = build_arg_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    check_args(parser, args)
 
-    hostnames = parse_comma_list(args.hosts)
-    commands = parse_comma_list(args.commands)
+    metrics = RunMetrics() if (args.run_report or args.prom_textfile) else NULL_METRICS
+    try:
+        run(parser, args, metrics)
+    finally:
+        if args.run_report:
+            metrics.write_json(args.run_report)
+        if args.prom_textfile:
+            metrics.write_prometheus(args.prom_textfile)
+
+
+def check_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """只对某个主选项生效的选项，单独出现时直接报错而不是静默忽略。"""
+    if not args.partition_by:
+        for flag, value in (
+            ("--append", args.append),
+            ("--max-rows-per-file", args.max_rows_per_file is not None),
+            ("--export-workers", args.export_workers is not None),
+        ):
+            if value:
+                parser.error(f"{flag} requires --partition-by")
+    if args.group_limit is not None and not args.group_by:
+        parser.error("--group-limit requires --group-by")
+    if args.batch_size is not None:
+        if not args.batch:
+            parser.error("--batch-size requires --batch")
+        if args.batch_size < 1:
+            parser.error("--batch-size must be at least 1")
 
+
+def build_ndb(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    if args.offline_inventory:
+        if not args.inventory_cache:
+            parser.error("--offline-inventory requires --inventory-cache")
+        return CachedNdbClient(None, InventoryCache(args.inventory_cache), offline=True)
+
+    if not args.ndb_url or not args.ndb_token:
+        parser.error("--ndb-url and --ndb-token are required")
     ndb = NdbClient(args.ndb_url, args.ndb_token)
-    raw_devices = ndb.fetch_devices_by_names(hostnames)
-    classified = [classify_device(d) for d in raw_devices]
+    if args.inventory_cache:
+        ndb = CachedNdbClient(ndb, InventoryCache(args.inventory_cache, ttl=args.inventory_ttl))
+    return ndb
 
-    testbed = build_testbed_from_devices(
-        classified, username=args.username, password=args.password
-    )
 
-    entities = collect_from_testbed(
-        testbed=testbed,
-        hostnames=hostnames,
-        commands=commands,
+def make_exporter(parser: argparse.ArgumentParser, args: argparse.Namespace, metrics, failures=None):
+    if args.partition_by:
+        if args.delta_dir:
+            parser.error("--partition-by cannot be combined with --delta-dir")
+        fields = parse_comma_list(args.partition_by)
+        unknown = [f for f in fields if f not in PARTITION_FIELDS]
+        if unknown:
+            parser.error(f"--partition-by: unknown field(s) {', '.join(unknown)}")
+        return PartitionedCsvExporter(
+            args.output_dir,
+            partition_by=fields,
+            max_rows=1_000_000 if args.max_rows_per_file is None else args.max_rows_per_file,
+            writers=4 if args.export_workers is None else args.export_workers,
+            append=args.append,
+            metrics=metrics,
+        )
+    if not args.delta_dir:
+        return StreamingCsvExporter(args.output_dir, metrics=metrics)
+    try:
+        key_columns = parse_key_columns(args.delta_key or [])
+    except ValueError as exc:
+        parser.error(str(exc))
+    return DeltaExporter(
+        args.output_dir,
+        args.delta_dir,
+        mode=args.delta_format,
+        key_columns=key_columns,
         templates_dir=args.templates_dir,
+        metrics=metrics,
+        failures=failures,
     )
 
-    export_per_command_as_csv(entities, args.output_dir)
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace, metrics) -> None:
+    hostnames = parse_comma_list(args.hosts)
+    commands = parse_comma_list(args.commands)
+    if args.genie_explode is not None:
+        set_explode_depth(args.genie_explode)
+
+    if args.templates_dir:
+        # 启动时索引模板目录一次
+        get_registry(args.templates_dir)
+
+    ndb = build_ndb(parser, args)
+    with metrics.timer("ndb_fetch"):
+        raw_devices = ndb.fetch_devices_by_names(hostnames)
+    metrics.inc("inventory_devices", len(raw_devices))
+
+    with metrics.timer("classify"):
+        classified = [classify_device(d) for d in raw_devices]
+
+    capture = CaptureStore(args.capture_dir, args.run_id) if args.capture_dir else None
+    router = EngineRouter(args.routing_table) if args.routing_table else None
+    # 预检、熔断或 --failures-csv 任一开启时，单台设备失败只记录；否则与以前一样中断运行
+    failures = FailureLog() if (args.precheck_timeout or args.breaker_threshold > 0 or args.failures_csv) else None
+    history = DurationHistory(args.history) if args.history else None
+    scheduler = None
+    if history is not None or (args.group_by and args.engine == "threads"):
+        scheduler = Scheduler(history, group_by=args.group_by, default_group_limit=args.group_limit)
+    try:
+        if args.engine == "asyncio":
+            run_async(parser, args, classified, hostnames, commands, capture, metrics, router, failures, scheduler)
+        else:
+            run_threads(parser, args, classified, hostnames, commands, capture, metrics, router, failures, scheduler)
+    finally:
+        if failures is not None and (args.failures_csv or failures):
+            failures.write_csv(args.failures_csv or os.path.join(args.output_dir, FAILURES_CSV))
+    if failures:
+        print(f"{len(failures.hostnames())} device(s) failed, see the failures CSV", file=sys.stderr)
+    if history is not None:
+        history.save()
+        report = scheduler.report()
+        predicted = report["predicted_makespan"]
+        print(
+            f"makespan: predicted {'n/a' if predicted is None else f'{predicted:.1f}s'}, "
+            f"actual {report['actual_makespan']:.1f}s ({report['devices']} devices, "
+            f"{report['workers']} workers)",
+            file=sys.stderr,
+        )
+    if router is not None:
+        router.save()
+
+
+def run_threads(parser, args, classified, hostnames, commands, capture, metrics, router, failures, scheduler) -> None:
+    """线程池采集引擎：预检、熔断和失败记录在 collect_from_testbed 中处理。"""
+    with metrics.timer("build_testbed"):
+        testbed = build_testbed_from_devices(
+            classified, username=args.username, password=args.password
+        )
+
+    parse_stage = None
+    if args.parse_workers > 0:
+        from .parse_stage import ParseStage
+
+        parse_stage = ParseStage(
+            args.parse_workers,
+            templates_dir=args.templates_dir,
+            metrics=metrics,
+            router=router,
+        )
+
+    # 每台设备采集完即写入溢写文件，结束时生成各命令的 CSV
+    with make_exporter(parser, args, metrics, failures) as exporter:
+        with metrics.timer("collect"), (parse_stage or nullcontext()):
+            collect_from_testbed(
+                testbed=testbed,
+                hostnames=hostnames,
+                commands=commands,
+                templates_dir=args.templates_dir,
+                workers=args.workers,
+                connect_timeout=args.connect_timeout,
+                command_timeout=args.command_timeout,
+                sink=exporter,
+                capture=capture,
+                metrics=metrics,
+                router=router,
+                parse_stage=parse_stage,
+                batch=args.batch,
+                batch_size=args.batch_size or 0,
+                setup_commands=parse_comma_list(args.setup_commands),
+                precheck_timeout=args.precheck_timeout or None,
+                breaker=CircuitBreaker(args.breaker_threshold) if args.breaker_threshold > 0 else None,
+                failures=failures,
+                scheduler=scheduler,
+            )
+
+
+def run_async(parser, args, classified, hostnames, commands, capture, metrics, router, failures, scheduler) -> None:
+    """
+    asyncio 采集引擎：--transport unicon 时 Unicon 调用在线程池中执行。
+    与线程引擎相同地预检、熔断并记录失败；指定 failures 时单台设备失败不中断整次运行。
+    """
+    from .async_collect import collect_async, targets_from_devices, targets_from_testbed
+
+    breaker = CircuitBreaker(args.breaker_threshold) if args.breaker_threshold > 0 else None
+    if args.precheck_timeout:
+        addresses = {d.hostname: (d.mgmt_ip, 22) for d in classified if d.mgmt_ip}
+        dead = precheck(addresses, timeout=args.precheck_timeout, metrics=metrics)
+        for name, exc in dead.items():
+            metrics.failure("precheck", exc, hostname=name)
+            failures.add(name, "precheck", exc, address="%s:%d" % addresses[name])
+            if breaker is not None:
+                breaker.failure(name)
+        classified = [d for d in classified if d.hostname not in dead]
+        hostnames = [h for h in hostnames if h not in dead]
+
+    executor = None
+    setup_commands = parse_comma_list(args.setup_commands)
+    if args.transport == "asyncssh":
+        if setup_commands:
+            print("--setup-commands is ignored with --transport asyncssh "
+                  "(each command runs in its own exec channel without a pty)", file=sys.stderr)
+        targets = targets_from_devices(
+            classified, args.username, args.password,
+            known_hosts=args.known_hosts,
+            verify_host_keys=not args.no_host_key_check,
+        )
+    else:
+        with metrics.timer("build_testbed"):
+            testbed = build_testbed_from_devices(
+                classified, username=args.username, password=args.password
+            )
+        executor = ThreadPoolExecutor(max_workers=max(1, args.workers))
+        targets = targets_from_testbed(testbed, hostnames, executor, setup_commands)
+
+    if scheduler is not None:
+        # asyncio 引擎按组限流由信号量完成，调度器只决定启动顺序
+        groups = {t.hostname: getattr(t, args.group_by) for t in targets} if args.group_by else None
+        order = scheduler.plan(
+            [t.hostname for t in targets],
+            [normalize_command(c) for c in commands],
+            max(1, args.workers),
+            groups,
+        )
+        rank = {name: i for i, name in enumerate(order)}
+        targets.sort(key=lambda t: rank[t.hostname])
+
+    t0 = time.perf_counter()
+    try:
+        with make_exporter(parser, args, metrics, failures) as exporter:
+            with metrics.timer("collect"):
+                collect_async(
+                    targets,
+                    commands,
+                    sink=exporter,
+                    templates_dir=args.templates_dir,
+                    concurrency=max(1, args.workers),
+                    group_by=args.group_by,
+                    default_group_limit=args.group_limit,
+                    connect_timeout=args.connect_timeout,
+                    command_timeout=args.command_timeout,
+                    capture=capture,
+                    metrics=metrics,
+                    router=router,
+                    batch=args.batch,
+                    batch_size=args.batch_size or 0,
+                    history=scheduler.history if scheduler is not None else None,
+                    breaker=breaker,
+                    failures=failures,
+                )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if scheduler is not None:
+            scheduler.actual = time.perf_counter() - t0
+            metrics.observe("makespan", scheduler.actual)
+            if scheduler.predicted is not None:
+                metrics.observe("makespan_predicted", scheduler.predicted)
 
 
 if __name__ == "__main__":
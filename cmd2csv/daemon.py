@@ -0,0 +1,699 @@
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, Any, List
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from .devices import ClassifiedDevice, classify_device, build_testbed_from_devices
+from .parser_pipeline import collect_from_testbed
+from .flatten import set_explode_depth
+from .exporter import StreamingCsvExporter
+from .snapshot import DeltaExporter, parse_key_columns
+from .template_registry import get_registry
+from .capture_store import CaptureStore
+from .metrics import RunMetrics
+from .routing import EngineRouter
+from .session_pool import SessionPool
+from .health import FAILURES_CSV, CircuitBreaker, FailureLog
+from .scheduling import DurationHistory, Scheduler
+
+
+# daemon / submit 默认从这个环境变量读取 API token（避免出现在进程列表中）
+TOKEN_ENV = "CMD2CSV_DAEMON_TOKEN"
+
+# 作业的 run_id 只能是单个路径分量
+_RUN_ID = re.compile(r"[A-Za-z0-9._-]+\Z")
+
+
+def _as_list(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [x.strip() for x in value if x and x.strip()]
+
+
+def is_loopback(host: str) -> bool:
+    """HOST 是否只在本机可达（空字符串表示所有地址，不算回环）。"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def check_token(expected: str | None, presented: str | None) -> bool:
+    """未配置 token 时放行；否则做常量时间比较。"""
+    if not expected:
+        return True
+    if not isinstance(presented, str):
+        return False
+    return hmac.compare_digest(presented.encode("utf-8"), expected.encode("utf-8"))
+
+
+class CollectorService:
+    """
+    常驻采集服务：Genie/模板只加载一次，设备对象和登录会话在多次作业间保持。
+
+    - 设备表按 hostname 缓存，超过 inventory_ttl 秒的记录在下次作业时向 NDB 刷新；
+      管理地址或平台变化时重建该设备并丢弃旧会话
+    - 作业可并发执行，同一台设备的会话同一时刻只借给一个作业
+    - 熔断器跨作业保留：连续失败的设备在冷却期内直接跳过，失败明细写入
+      作业输出目录的 _failures.csv（只在有失败时写出）
+    - 指定 history（DurationHistory）时按历史耗时安排采集顺序，作业结束后保存
+    - 作业中的 output_dir / capture_dir / delta_dir 相对 data_root 解析，
+      不能指向 data_root 之外
+    """
+
+    def __init__(
+        self,
+        ndb,
+        username: str,
+        password: str,
+        pool: SessionPool,
+        templates_dir: str | None = None,
+        workers: int = 8,
+        connect_timeout: float | None = None,
+        command_timeout: float | None = None,
+        inventory_ttl: float = 300.0,
+        router: EngineRouter | None = None,
+        batch: bool = False,
+        batch_size: int = 0,
+        setup_commands: List[str] = (),
+        precheck_timeout: float | None = 1.0,
+        breaker: CircuitBreaker | None = None,
+        history: DurationHistory | None = None,
+        data_root: str = ".",
+    ):
+        self.ndb = ndb
+        self.username = username
+        self.password = password
+        self.pool = pool
+        self.templates_dir = templates_dir
+        self.workers = workers
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.inventory_ttl = inventory_ttl
+        self.router = router
+        self.batch = batch
+        self.batch_size = batch_size
+        self.setup_commands = list(setup_commands)
+        self.precheck_timeout = precheck_timeout
+        self.breaker = breaker
+        self.history = history
+        self.data_root = os.path.realpath(data_root)
+        self._lock = threading.Lock()
+        # hostname -> (ClassifiedDevice, Device, 刷新时间)
+        self._devices: dict[str, tuple[ClassifiedDevice, Any, float]] = {}
+        self.jobs = 0
+
+        if templates_dir:
+            get_registry(templates_dir)
+
+    def devices_for(self, hostnames: List[str], metrics) -> Dict[str, Any]:
+        # NDB 查询和 testbed 构建不持锁，避免阻塞其他作业和 stats
+        now = time.time()
+        with self._lock:
+            stale = [
+                h for h in dict.fromkeys(hostnames)
+                if h not in self._devices or now - self._devices[h][2] >= self.inventory_ttl
+            ]
+        dropped: list[str] = []
+        if stale:
+            with metrics.timer("ndb_fetch"):
+                raw_devices = self.ndb.fetch_devices_by_names(stale)
+            classified = {d.hostname: d for d in map(classify_device, raw_devices)}
+
+            changed = []
+            with self._lock:
+                for h in stale:
+                    c = classified.get(h)
+                    old = self._devices.get(h)
+                    if c is None:
+                        # NDB 中已不存在
+                        if old is not None:
+                            del self._devices[h]
+                            dropped.append(h)
+                    elif old is not None and old[0] == c:
+                        self._devices[h] = (c, old[1], now)
+                    else:
+                        changed.append(c)
+
+            if changed:
+                with metrics.timer("build_testbed"):
+                    testbed = build_testbed_from_devices(
+                        changed, username=self.username, password=self.password
+                    )
+                with self._lock:
+                    for c in changed:
+                        if c.hostname in self._devices:
+                            dropped.append(c.hostname)
+                        self._devices[c.hostname] = (c, testbed.devices[c.hostname], now)
+
+        for h in dropped:
+            self.pool.drop(h)
+        with self._lock:
+            return {h: self._devices[h][1] for h in hostnames if h in self._devices}
+
+    def resolve_path(self, path: str) -> str:
+        """作业给出的路径 -> data_root 下的绝对路径（先解析符号链接再检查）。"""
+        resolved = os.path.realpath(os.path.join(self.data_root, path))
+        if os.path.commonpath([self.data_root, resolved]) != self.data_root:
+            raise ValueError(f"path outside the daemon data root: {path}")
+        return resolved
+
+    @staticmethod
+    def check_run_id(run_id) -> str | None:
+        """run_id 会成为 capture_dir 下的目录名，只接受单个安全的路径分量。"""
+        if run_id is None or run_id == "":
+            return None
+        run_id = str(run_id)
+        if not _RUN_ID.match(run_id) or run_id in (".", ".."):
+            raise ValueError(f"invalid run_id: {run_id!r}")
+        return run_id
+
+    def collect(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        hostnames = _as_list(request.get("hosts"))
+        commands = _as_list(request.get("commands"))
+        if not hostnames or not commands:
+            raise ValueError("hosts and commands are required")
+        output_dir = self.resolve_path(request.get("output_dir") or "output")
+        capture_dir = self.resolve_path(request["capture_dir"]) if request.get("capture_dir") else None
+        delta_dir = self.resolve_path(request["delta_dir"]) if request.get("delta_dir") else None
+        run_id = self.check_run_id(request.get("run_id"))
+
+        metrics = RunMetrics()
+        t0 = time.perf_counter()
+        devices = self.devices_for(hostnames, metrics)
+        capture = CaptureStore(capture_dir, run_id) if capture_dir else None
+
+        failures = FailureLog()
+        if delta_dir:
+            exporter = DeltaExporter(
+                output_dir,
+                delta_dir,
+                mode=request.get("delta_format") or "changelog",
+                key_columns=parse_key_columns(request.get("delta_key") or []),
+                templates_dir=self.templates_dir,
+                metrics=metrics,
+                failures=failures,
+            )
+        else:
+            exporter = StreamingCsvExporter(output_dir, metrics=metrics)
+        scheduler = Scheduler(self.history) if self.history is not None else None
+        try:
+            with metrics.timer("collect"):
+                collect_from_testbed(
+                    testbed=SimpleNamespace(devices=devices),
+                    hostnames=hostnames,
+                    commands=commands,
+                    templates_dir=self.templates_dir,
+                    workers=int(request.get("workers") or self.workers),
+                    connect_timeout=self.connect_timeout,
+                    command_timeout=self.command_timeout,
+                    sink=exporter,
+                    capture=capture,
+                    metrics=metrics,
+                    router=self.router,
+                    sessions=self.pool,
+                    batch=bool(request.get("batch", self.batch)),
+                    batch_size=int(request.get("batch_size") or self.batch_size),
+                    setup_commands=self.setup_commands,
+                    precheck_timeout=self.precheck_timeout,
+                    breaker=self.breaker,
+                    failures=failures,
+                    scheduler=scheduler,
+                )
+        except BaseException:
+            exporter.discard()
+            raise
+        files = exporter.close()
+        if failures:
+            files.append(failures.write_csv(os.path.join(output_dir, FAILURES_CSV)))
+        if self.router is not None:
+            self.router.save()
+        if self.history is not None:
+            self.history.save()
+        with self._lock:
+            self.jobs += 1
+
+        return {
+            "ok": True,
+            "files": [str(p) for p in files],
+            "missing_hosts": [h for h in hostnames if h not in devices],
+            "failed_hosts": failures.hostnames(),
+            "seconds": round(time.perf_counter() - t0, 3),
+            "stages": metrics.stage_summary(),
+            "failures": metrics.failures,
+            "schedule": scheduler.report() if scheduler is not None else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            known = len(self._devices)
+            jobs = self.jobs
+        open_circuits = self.breaker.open_hosts() if self.breaker is not None else []
+        return {"ok": True, "devices": known, "jobs": jobs, "open_circuits": open_circuits, **self.pool.stats()}
+
+    def reload(self) -> Dict[str, Any]:
+        """清空设备表并断开全部会话，下次作业重新从 NDB 获取。"""
+        with self._lock:
+            hostnames = list(self._devices)
+            self._devices.clear()
+        for h in hostnames:
+            self.pool.drop(h)
+        return {"ok": True, "dropped": len(hostnames)}
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op", "collect")
+        try:
+            if op == "collect":
+                return self.collect(request)
+            if op == "stats":
+                return self.stats()
+            if op == "evict":
+                return {"ok": True, "evicted": self.pool.evict_idle(now=float("inf"))}
+            if op == "reload":
+                return self.reload()
+            raise ValueError(f"unknown op: {op}")
+        except Exception as exc:
+            return {"ok": False, "error": str(exc), "type": type(exc).__name__}
+
+
+class _UnixHandler(socketserver.StreamRequestHandler):
+    """
+    每行一个 JSON 请求，每行一个 JSON 响应。socket 文件权限为 0600；
+    配置了 token 时请求还须带 "token" 字段。
+    """
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as exc:
+                response = {"ok": False, "error": f"invalid JSON: {exc}"}
+            else:
+                if not isinstance(request, dict):
+                    response = {"ok": False, "error": "request must be a JSON object"}
+                elif not check_token(self.server.token, request.pop("token", None)):
+                    response = {"ok": False, "error": "invalid token"}
+                else:
+                    response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response, default=str).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs 提交采集作业；GET /stats 查看会话池；POST /evict、/reload。
+    配置了 token 时每个请求须带 Authorization: Bearer <token>，否则返回 401。
+    """
+
+    ROUTES = {"/jobs": "collect", "/stats": "stats", "/evict": "evict", "/reload": "reload"}
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        scheme, _, presented = (self.headers.get("Authorization") or "").partition(" ")
+        if check_token(self.server.token, presented.strip() if scheme.lower() == "bearer" else None):
+            return True
+        self._reply(401, {"ok": False, "error": "invalid token"})
+        return False
+
+    def _dispatch(self, request: Dict[str, Any]) -> None:
+        op = self.ROUTES.get(self.path.split("?", 1)[0])
+        if op is None:
+            self._reply(404, {"ok": False, "error": f"no route {self.path}"})
+            return
+        response = self.server.service.handle({**request, "op": op})
+        self._reply(200 if response.get("ok") else 400, response)
+
+    def do_GET(self) -> None:
+        if self._authorized():
+            self._dispatch({})
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as exc:
+            self._reply(400, {"ok": False, "error": f"invalid JSON: {exc}"})
+            return
+        if not isinstance(request, dict):
+            self._reply(400, {"ok": False, "error": "request must be a JSON object"})
+            return
+        self._dispatch(request)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def make_server(
+    service: CollectorService,
+    socket_path: str | None = None,
+    http: str | None = None,
+    token: str | None = None,
+):
+    """
+    不带 token 时 HTTP 只允许监听回环地址：能连上 daemon 的客户端
+    都可以用它保存的凭据在全部设备上执行命令。
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixServer(socket_path, _UnixHandler)
+        os.chmod(socket_path, 0o600)
+    else:
+        host, _, port = http.rpartition(":")
+        host = host or "127.0.0.1"
+        if not token and not is_loopback(host):
+            raise ValueError(f"refusing to listen on non-loopback address {host!r} without a token")
+        server = ThreadingHTTPServer((host.strip("[]"), int(port)), _HttpHandler)
+        server.daemon_threads = True
+    server.service = service
+    server.token = token
+    return server
+
+
+def submit(
+    request: Dict[str, Any],
+    socket_path: str | None = None,
+    url: str | None = None,
+    timeout: float | None = None,
+    token: str | None = None,
+) -> Dict[str, Any]:
+    """向 daemon 提交一个请求并返回响应。"""
+    if socket_path:
+        if token:
+            request = {**request, "token": token}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(socket_path)
+            with s.makefile("rwb") as f:
+                f.write(json.dumps(request).encode("utf-8") + b"\n")
+                f.flush()
+                return json.loads(f.readline())
+
+    op = request.get("op", "collect")
+    path = "/jobs" if op == "collect" else f"/{op}"
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    req = urllib.request.Request(
+        url.rstrip("/") + path,
+        data=json.dumps(request).encode("utf-8"),
+        headers=headers,
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as exc:
+        return json.loads(exc.read())
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="cmd2csv daemon",
+        description="Run a long-lived collector that keeps device sessions warm between jobs.",
+    )
+    listen = p.add_mutually_exclusive_group(required=True)
+    listen.add_argument(
+        "--socket",
+        default=None,
+        help="Listen on this Unix socket path (one JSON request per line)",
+    )
+    listen.add_argument(
+        "--http",
+        default=None,
+        help="Listen for HTTP on HOST:PORT, e.g. 127.0.0.1:8765 "
+             "(a non-loopback HOST requires --token)",
+    )
+    p.add_argument(
+        "--token",
+        default=os.environ.get(TOKEN_ENV),
+        help=f"API token clients must present (default: ${TOKEN_ENV})",
+    )
+    p.add_argument(
+        "--data-root",
+        default=".",
+        help="Jobs' output, capture and delta directories must lie under this directory; "
+             "relative paths are resolved against it (default: current directory)",
+    )
+    p.add_argument("--ndb-url", default=None, help="NDB base URL")
+    p.add_argument("--ndb-token", default=None, help="NDB API token")
+    p.add_argument(
+        "--inventory-cache",
+        default=None,
+        help="Path of a local JSON cache of NDB device records",
+    )
+    p.add_argument(
+        "--offline-inventory",
+        action="store_true",
+        help="Only use --inventory-cache, never contact NDB",
+    )
+    p.add_argument(
+        "--inventory-ttl",
+        type=float,
+        default=300.0,
+        help="Seconds before a device record is refreshed from NDB (default: 300)",
+    )
+    p.add_argument("--username", required=True, help="Device login username")
+    p.add_argument("--password", required=True, help="Device login password")
+    p.add_argument(
+        "--templates-dir",
+        default=None,
+        help="Optional TextFSM templates directory (for auto lookup)",
+    )
+    p.add_argument(
+        "--genie-explode",
+        type=int,
+        default=None,
+        help="Levels of dynamic keys (interfaces, VRFs, addresses, ...) in Genie output "
+             "exploded into rows; deeper levels become columns (default: all, 0: one row)",
+    )
+    p.add_argument(
+        "--routing-table",
+        default=None,
+        help="Persistent parse-engine routing table (JSON)",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Devices collected concurrently per job (default: 8)",
+    )
+    p.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=300.0,
+        help="Disconnect sessions idle for this many seconds (default: 300)",
+    )
+    p.add_argument(
+        "--health-interval",
+        type=float,
+        default=60.0,
+        help="Health-check a reused session if unchecked for this many seconds (default: 60)",
+    )
+    p.add_argument(
+        "--health-command",
+        default=None,
+        help="Command run as the health check, in addition to the connection state",
+    )
+    p.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send each device's whole command list in one execute call (jobs may override)",
+    )
+    p.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="With --batch, at most this many commands per execute call (default: 0, all)",
+    )
+    p.add_argument(
+        "--setup-commands",
+        default=None,
+        help="Comma separated commands run once when a session is opened",
+    )
+    p.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=None,
+        help="Per-device connection timeout in seconds",
+    )
+    p.add_argument(
+        "--command-timeout",
+        type=float,
+        default=None,
+        help="Per-command execution timeout in seconds",
+    )
+    p.add_argument(
+        "--history",
+        default=None,
+        help="Per-device, per-command duration history (JSON); longest devices start first",
+    )
+    p.add_argument(
+        "--precheck-timeout",
+        type=float,
+        default=1.0,
+        help="Probe TCP/22 on every management address before a job connects (default: 1.0, 0: disable)",
+    )
+    p.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=3,
+        help="Skip a device after this many consecutive failures (default: 3, 0: disable)",
+    )
+    p.add_argument(
+        "--breaker-cooldown",
+        type=float,
+        default=300.0,
+        help="Seconds before a skipped device is tried again (default: 300)",
+    )
+    return p
+
+
+def main(argv: List[str] | None = None):
+    from .cli import build_ndb
+
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.genie_explode is not None:
+        set_explode_depth(args.genie_explode)
+
+    pool = SessionPool(
+        idle_timeout=args.idle_timeout,
+        health_interval=args.health_interval,
+        health_command=args.health_command,
+    )
+    service = CollectorService(
+        build_ndb(parser, args),
+        args.username,
+        args.password,
+        pool,
+        templates_dir=args.templates_dir,
+        workers=args.workers,
+        connect_timeout=args.connect_timeout,
+        command_timeout=args.command_timeout,
+        inventory_ttl=args.inventory_ttl,
+        router=EngineRouter(args.routing_table) if args.routing_table else None,
+        batch=args.batch,
+        batch_size=args.batch_size,
+        setup_commands=_as_list(args.setup_commands),
+        precheck_timeout=args.precheck_timeout or None,
+        breaker=(
+            CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
+            if args.breaker_threshold > 0 else None
+        ),
+        history=DurationHistory(args.history) if args.history else None,
+        data_root=args.data_root,
+    )
+    try:
+        server = make_server(service, socket_path=args.socket, http=args.http, token=args.token)
+    except ValueError as exc:
+        parser.error(str(exc))
+    pool.start()
+    print(f"cmd2csv daemon listening on {args.socket or args.http}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+def build_submit_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="cmd2csv submit",
+        description="Submit a collection job to a running `cmd2csv daemon`.",
+    )
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument("--socket", default=None, help="Daemon Unix socket path")
+    target.add_argument("--url", default=None, help="Daemon HTTP URL, e.g. http://127.0.0.1:8765")
+    p.add_argument(
+        "--token",
+        default=os.environ.get(TOKEN_ENV),
+        help=f"API token of the daemon (default: ${TOKEN_ENV})",
+    )
+    p.add_argument(
+        "--op",
+        choices=("collect", "stats", "evict", "reload"),
+        default="collect",
+        help="Request type (default: collect)",
+    )
+    p.add_argument("--hosts", default=None, help="Comma separated hostnames")
+    p.add_argument("--commands", default=None, help="Comma separated commands")
+    p.add_argument(
+        "--output-dir",
+        default="output",
+        help="Output directory for CSV files, relative to the daemon's --data-root",
+    )
+    p.add_argument("--capture-dir", default=None, help="Store raw outputs here (under --data-root)")
+    p.add_argument("--delta-dir", default=None, help="Snapshot directory for delta output (under --data-root)")
+    p.add_argument(
+        "--delta-format",
+        choices=DeltaExporter.MODES,
+        default="changelog",
+        help="Delta output layout (default: changelog)",
+    )
+    p.add_argument("--delta-key", action="append", default=None, help="COMMAND=col[+col] (repeatable)")
+    p.add_argument("--timeout", type=float, default=None, help="Seconds to wait for the reply")
+    return p
+
+
+def submit_main(argv: List[str] | None = None):
+    args = build_submit_arg_parser().parse_args(argv)
+    request: dict[str, Any] = {"op": args.op}
+    if args.op == "collect":
+        request.update(
+            hosts=_as_list(args.hosts),
+            commands=_as_list(args.commands),
+            output_dir=args.output_dir,
+        )
+        if args.capture_dir:
+            request["capture_dir"] = args.capture_dir
+        if args.delta_dir:
+            request.update(
+                delta_dir=args.delta_dir,
+                delta_format=args.delta_format,
+                delta_key=args.delta_key or [],
+            )
+    response = submit(request, socket_path=args.socket, url=args.url, timeout=args.timeout, token=args.token)
+    print(json.dumps(response, indent=2, default=str))
+    if not response.get("ok"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List
+from collections.abc import Mapping
 from dataclasses import dataclass
-from genie.testbed import load as load_testbed
+from functools import lru_cache
+import threading
 
+from .engines import TESTBED_BACKENDS, OFFLINE_DEVICES
 from .ndb_client import NdbDevice
 
 
@@ -40,10 +43,18 @@ OS_MAP: Dict[tuple[str, str], Dict[str, str]] = {
 }
 
 
-def classify_device(d: NdbDevice) -> ClassifiedDevice:
-    key = (d.vendor.lower(), d.os.lower())
-    info = OS_MAP.get(key)
+@lru_cache(maxsize=None)
+def _platform(vendor: str, os_name: str) -> tuple[str, str] | None:
+    """(vendor, os) 原样大小写 -> (pyats_os, ntc_platform)，每种写法只查一次 OS_MAP。"""
+    info = OS_MAP.get((vendor.lower(), os_name.lower()))
     if not info:
+        return None
+    return info["pyats_os"], info["ntc_platform"]
+
+
+def classify_device(d: NdbDevice) -> ClassifiedDevice:
+    platform = _platform(d.vendor, d.os)
+    if platform is None:
         raise ValueError(f"Unknown device type: vendor={d.vendor}, os={d.os}")
 
     return ClassifiedDevice(
@@ -54,15 +65,138 @@ def classify_device(d: NdbDevice) -> ClassifiedDevice:
         model=d.model,
         site=d.site,
         role=d.role,
-        pyats_os=info["pyats_os"],
-        ntc_platform=info["ntc_platform"],
+        pyats_os=platform[0],
+        ntc_platform=platform[1],
     )
 
 
-def build_testbed_from_devices(devices: List[ClassifiedDevice], username: str, password: str):
+def device_definition(d: ClassifiedDevice) -> Dict[str, Any]:
+    return {
+        "os": d.pyats_os,
+        "type": "router",
+        "connections": {
+            "defaults": {
+                "class": "unicon.Unicon",
+            },
+            "cli": {
+                "protocol": "ssh",
+                "ip": d.mgmt_ip,
+            },
+        },
+        "custom": {
+            "site": d.site or "",
+            "role": d.role or "",
+            "vendor": d.vendor,
+            "model": d.model or "",
+            "ntc_platform": d.ntc_platform,
+        },
+    }
+
+
+def testbed_definition(devices: List[ClassifiedDevice]) -> Dict[str, Dict[str, Any]]:
+    """hostname -> 设备定义（不含凭据）。"""
+    return {d.hostname: device_definition(d) for d in devices}
+
+
+class LazyDevices(Mapping):
+    """hostname -> Device；遍历 hostname 不创建 Device，按名称访问时才创建。"""
+
+    def __init__(self, testbed: "LazyTestbed"):
+        self._testbed = testbed
+
+    def __getitem__(self, name: str):
+        return self._testbed.device(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._testbed.definition)
+
+    def __len__(self) -> int:
+        return len(self._testbed.definition)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._testbed.definition
+
+
+class LazyTestbed:
     """
-    动态构造 pyATS testbed（内存）
+    与 Genie testbed 用法相同（testbed.devices[name]），但 Device 在首次访问时才由
+    backend 逐台加载。Genie 一次加载整个 testbed 的耗时随设备数超线性增长，
+    被过滤掉或不可达的设备也不必创建。
+
+    backend 每次加载只含一台设备的 testbed，随后把 Device 移到共享的 self.testbed
+    中，所以所有 Device 的 device.testbed 是同一个对象（凭据也在这里）。
+    """
+
+    def __init__(
+        self,
+        definition: Dict[str, Dict[str, Any]],
+        username: str,
+        password: str,
+        backend: str = "genie",
+        name: str = "from_ndb",
+    ):
+        self.name = name
+        self.definition = definition
+        self.backend = backend
+        self._credentials = {"default": {"username": username, "password": password}}
+        self._lock = threading.Lock()
+        self._devices: dict[str, Any] = {}
+        self._testbed = None
+        self.devices = LazyDevices(self)
+
+    def _load(self, devices: Dict[str, Dict[str, Any]]):
+        return TESTBED_BACKENDS.get(self.backend)(
+            {"testbed": {"name": self.name, "credentials": self._credentials}, "devices": devices}
+        )
+
+    @property
+    def testbed(self):
+        """所有已创建 Device 所属的 testbed（首次访问时创建，不含设备）。"""
+        if self._testbed is None:
+            with self._lock:
+                if self._testbed is None:
+                    self._testbed = self._load({})
+        return self._testbed
+
+    def device(self, name: str):
+        dev = self._devices.get(name)
+        if dev is not None:
+            return dev
+        spec = self.definition[name]
+        testbed = self.testbed
+        with self._lock:
+            dev = self._devices.get(name)
+            if dev is None:
+                single = self._load({name: spec})
+                dev = single.devices[name]
+                single.remove_device(dev)
+                testbed.add_device(dev)
+                self._devices[name] = dev
+        return dev
+
+    @property
+    def materialized(self) -> int:
+        return len(self._devices)
+
+
+def build_testbed_from_devices(
+    devices: List[ClassifiedDevice],
+    username: str,
+    password: str,
+    backend: str = "genie",
+    lazy: bool = True,
+):
+    """
+    动态构造 pyATS testbed（内存）。backend 为 engines.TESTBED_BACKENDS 中的名称，
+    其模块（genie.testbed）在这里首次调用时才导入。
+
+    lazy=True（默认）返回 LazyTestbed，Device 在访问时逐台创建；
+    lazy=False 时一次加载整个 testbed。
     """
+    definition = testbed_definition(devices)
+    if lazy:
+        return LazyTestbed(definition, username, password, backend=backend)
+
     tb: Dict[str, Any] = {
         "testbed": {
             "name": "from_ndb",
@@ -73,29 +207,35 @@ def build_testbed_from_devices(devices: List[ClassifiedDevice], username: str, p
                 }
             },
         },
-        "devices": {},
+        "devices": definition,
     }
+    return TESTBED_BACKENDS.get(backend)(tb)
 
-    for d in devices:
-        tb["devices"][d.hostname] = {
-            "os": d.pyats_os,
-            "type": "router",
-            "connections": {
-                "defaults": {
-                    "class": "unicon.Unicon",
-                },
-                "cli": {
-                    "protocol": "ssh",
-                    "ip": d.mgmt_ip,
-                },
-            },
-            "custom": {
-                "site": d.site or "",
-                "role": d.role or "",
-                "vendor": d.vendor,
-                "model": d.model or "",
-                "ntc_platform": d.ntc_platform,
-            },
-        }
 
-    return load_testbed(tb)
+# Genie 选择解析器时依次参考的设备属性（genie.libs.parser 的 token 顺序）
+PARSER_TOKENS = (
+    "origin", "os", "platform", "model", "submodel", "pid",
+    "chassis_type", "version", "os_flavor", "revision",
+)
+
+
+def parser_tokens(device) -> tuple[tuple[str, str], ...]:
+    """设备上已设置的解析器 token，如 (("os", "iosxe"), ("platform", "cat9k"))。"""
+    tokens = []
+    for attr in PARSER_TOKENS:
+        value = getattr(device, attr, None)
+        if isinstance(value, str) and value:
+            tokens.append((attr, value))
+    return tuple(tokens)
+
+
+@lru_cache(maxsize=None)
+def offline_device(pyats_os: str, tokens: tuple[tuple[str, str], ...] = ()):
+    """
+    不连接的 Genie Device，仅用于输出模式解析 device.parse(cmd, output=...)。
+    tokens 取自真实设备的 parser_tokens()，使 platform / model 相关的解析器
+    与在线解析时选择的相同。
+    """
+    attrs = dict(tokens)
+    attrs["os"] = pyats_os
+    return OFFLINE_DEVICES.get("genie")(f"offline_{pyats_os}", **attrs)
@@ -0,0 +1,21 @@
+from __future__ import annotations
+from typing import Dict, List, Any
+
+from .flatten import plan_for
+from .parser_pipeline import genie_to_rows
+
+
+def try_genie_parse(device, command: str, raw_output: str) -> List[Dict[str, Any]] | None:
+    """
+    Genie 输出模式：只解析已采集的文本，不会再次在设备上执行命令。
+    """
+    try:
+        parsed = device.parse(command, output=raw_output)
+    except Exception:  # 含 SchemaEmptyParserError
+        return None
+    return genie_to_rows(parsed, plan_for(device, command))
+
+
+# 注册为 engines.PARSE_ENGINES["genie"]；本模块在首次使用该引擎时才导入
+def parse(device, ntc_platform, command, raw_output, templates_dir):
+    return try_genie_parse(device, command, raw_output)
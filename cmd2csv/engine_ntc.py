@@ -0,0 +1,30 @@
+from __future__ import annotations
+from typing import Dict, List, Any
+
+from ntc_templates.parse import parse_output
+
+from .template_registry import ntc_template, ntc_template_paths
+
+
+def try_ntc_parse(ntc_platform: str, command: str, raw_output: str) -> List[Dict[str, Any]] | None:
+    try:
+        # index 查找走 LRU；查不到模板时不必再调用 parse_output
+        if not ntc_template_paths(ntc_platform, command):
+            return None
+        tmpl = ntc_template(ntc_platform, command)
+        if tmpl is not None:
+            rows = tmpl.parse(raw_output)
+        else:
+            rows = parse_output(
+                platform=ntc_platform,
+                command=command,
+                data=raw_output,
+            )
+        return rows or None
+    except Exception:
+        return None
+
+
+# 注册为 engines.PARSE_ENGINES["ntc"]；本模块（及 ntc_templates）在首次使用该引擎时才导入
+def parse(device, ntc_platform, command, raw_output, templates_dir):
+    return try_ntc_parse(ntc_platform, command, raw_output)
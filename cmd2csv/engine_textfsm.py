@@ -0,0 +1,20 @@
+from __future__ import annotations
+from typing import Dict, List, Any
+
+from .parser_pipeline import normalize_command
+from .template_registry import get_registry
+
+
+def try_textfsm_auto(templates_dir: str, ntc_platform: str, command: str, raw_output: str) -> List[Dict[str, Any]] | None:
+    tmpl = get_registry(templates_dir).get(ntc_platform, normalize_command(command))
+    if tmpl is None:
+        return None
+
+    return tmpl.parse(raw_output) or None
+
+
+# 注册为 engines.PARSE_ENGINES["textfsm"]；本模块在首次使用该引擎时才导入
+def parse(device, ntc_platform, command, raw_output, templates_dir):
+    if not templates_dir:
+        return None
+    return try_textfsm_auto(templates_dir, ntc_platform, command, raw_output)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Union
+import importlib
+import threading
+
+Target = Union[str, Callable]
+
+
+class LazyRegistry:
+    """
+    名称 -> 实现 的注册表。实现可以写成 "module:attribute" 字符串，
+    首次 get() 时才 import，模块只在真正用到该引擎时加载。
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._targets: dict[str, Target] = {}
+        self._loaded: dict[str, Callable] = {}
+
+    def register(self, name: str, target: Target) -> None:
+        with self._lock:
+            self._targets[name] = target
+            self._loaded.pop(name, None)
+
+    def get(self, name: str) -> Callable:
+        fn = self._loaded.get(name)
+        if fn is not None:
+            return fn
+        try:
+            target = self._targets[name]
+        except KeyError:
+            raise ValueError(f"unknown {self.kind}: {name}") from None
+        if isinstance(target, str):
+            module_name, _, attr = target.partition(":")
+            fn = getattr(importlib.import_module(module_name), attr)
+        else:
+            fn = target
+        with self._lock:
+            self._loaded[name] = fn
+        return fn
+
+    def names(self) -> List[str]:
+        return list(self._targets)
+
+    def loaded(self) -> Dict[str, bool]:
+        return {name: name in self._loaded for name in self._targets}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._targets
+
+
+# 解析引擎：fn(device, ntc_platform, command, raw_output, templates_dir) -> rows | None
+PARSE_ENGINES = LazyRegistry("parse engine")
+PARSE_ENGINES.register("genie", "cmd2csv.engine_genie:parse")
+PARSE_ENGINES.register("ntc", "cmd2csv.engine_ntc:parse")
+PARSE_ENGINES.register("textfsm", "cmd2csv.engine_textfsm:parse")
+
+# testbed 后端：fn(testbed_dict) -> testbed（带 .devices）
+TESTBED_BACKENDS = LazyRegistry("testbed backend")
+TESTBED_BACKENDS.register("genie", "genie.testbed:load")
+
+# 离线设备：fn(name, os=...) -> 可做输出模式解析的 Device
+OFFLINE_DEVICES = LazyRegistry("offline device factory")
+OFFLINE_DEVICES.register("genie", "genie.conf.base:Device")
+
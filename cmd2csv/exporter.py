@@ -1,7 +1,16 @@
 from __future__ import annotations
-from typing import Dict, List
+from typing import Dict, Any, List, Iterable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import csv
+import os
+import pickle
+import re
+import shutil
+import tempfile
+
+from .metrics import NULL_METRICS
+from .rows import RowBlock, RowStore, row_blocks, row_keys, write_rows
 
 META_FIELDS = [
     "hostname",      # 第一列
@@ -11,9 +20,17 @@ META_FIELDS = [
     "timestamp",
     "command",
     "parse_engine",
+    "change",        # 增量模式（DeltaExporter）
 ]
 
 
+def build_fieldnames(all_keys: Iterable[str]) -> List[str]:
+    all_keys = set(all_keys)
+    meta_fields = [f for f in META_FIELDS if f in all_keys]
+    other_fields = sorted(k for k in all_keys if k not in meta_fields)
+    return meta_fields + other_fields
+
+
 def export_per_command_as_csv(
     entities: Dict[str, List[dict]],
     output_dir: str,
@@ -25,21 +42,382 @@ def export_per_command_as_csv(
         if not rows:
             continue
 
-        all_keys = set()
-        for r in rows:
-            all_keys.update(r.keys())
-
-        meta_fields = [f for f in META_FIELDS if f in all_keys]
-        other_fields = sorted(k for k in all_keys if k not in meta_fields)
+        fieldnames = build_fieldnames(row_keys(rows))
 
-        fieldnames = meta_fields + other_fields
-
-        # 按 hostname 排序，保证一个设备的行聚在一起
-        rows_sorted = sorted(rows, key=lambda r: r.get("hostname", ""))
+        # 按 hostname 排序，保证一个设备的行聚在一起；
+        # 每块只属于一台设备时整块排序（稳定排序，结果与逐行排序相同）
+        blocks = row_blocks(rows)
+        if all(isinstance(b, RowBlock) and b.uniform("hostname") for b in blocks):
+            rows_sorted = RowStore(sorted(blocks, key=lambda b: b.hostname))
+        else:
+            rows_sorted = sorted(rows, key=lambda r: r.get("hostname", ""))
 
         csv_path = output_path / f"{cmd_name}.csv"
         with csv_path.open("w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=fieldnames)
+            w = csv.DictWriter(f, fieldnames=fieldnames, restval="")
             w.writeheader()
-            for r in rows_sorted:
-                w.writerow({k: r.get(k, "") for k in fieldnames})
+            write_rows(w, rows_sorted, fieldnames)
+
+
+class _SpillEntity:
+    """单个命令的溢写文件：每个设备块 pickle 一次，记录 (hostname, 序号, offset)。"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fh = path.open("wb")
+        self.keys: set[str] = set()
+        self.blocks: list[tuple[str, int, int]] = []
+        self.rows = 0
+
+    def add(self, hostname: str, rows: List[dict]) -> None:
+        self.keys |= row_keys(rows)
+        offset = self.fh.tell()
+        pickle.dump(rows, self.fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks.append((hostname, len(self.blocks), offset))
+        self.rows += len(rows)
+
+
+class StreamingCsvExporter:
+    """
+    流式 CSV 导出：collect_from_testbed 每采完一台设备就调用 add_rows，
+    行数据立即溢写到 output_dir 下的临时文件，内存中只保留列名集合和块索引。
+
+    close() 时按 hostname 排序各设备块、用最终列名逐块写出 CSV，
+    因此后出现的新列也能正确写入表头，输出与 export_per_command_as_csv 一致。
+    """
+
+    def __init__(self, output_dir: str, metrics=NULL_METRICS):
+        self.metrics = metrics
+        self.output_path = Path(output_dir)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        self._spill_dir = tempfile.TemporaryDirectory(
+            prefix=".cmd2csv-spill-", dir=self.output_path
+        )
+        self._entities: dict[str, _SpillEntity] = {}
+
+    def add_rows(self, entity_name: str, rows: List[dict]) -> None:
+        if not rows:
+            return
+        spill = self._entities.get(entity_name)
+        if spill is None:
+            spill = _SpillEntity(Path(self._spill_dir.name) / f"{entity_name}.pkl")
+            self._entities[entity_name] = spill
+
+        for block in row_blocks(rows):
+            # stamp_rows 的块只属于一台设备，整块溢写
+            if isinstance(block, RowBlock) and block.uniform("hostname"):
+                spill.add(block.hostname, block)
+                continue
+            # 一次调用通常是一台设备的全部行；按 hostname 连续段切块
+            start = 0
+            for i in range(1, len(block) + 1):
+                if i == len(block) or block[i].get("hostname", "") != block[start].get("hostname", ""):
+                    spill.add(block[start].get("hostname", ""), block[start:i])
+                    start = i
+
+    def _write_entity(self, entity_name: str, spill: _SpillEntity) -> Path:
+        spill.fh.close()
+        fieldnames = build_fieldnames(spill.keys)
+        csv_path = self.output_path / f"{entity_name}.csv"
+        tmp_path = csv_path.with_name(csv_path.name + ".tmp")
+
+        with spill.path.open("rb") as src, tmp_path.open("w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+            w.writeheader()
+            for _, _, offset in sorted(spill.blocks):
+                src.seek(offset)
+                write_rows(w, pickle.load(src), fieldnames)
+
+        os.replace(tmp_path, csv_path)
+        if self.metrics.enabled:
+            self.metrics.inc("rows_written", spill.rows, command=entity_name)
+            self.metrics.inc("bytes_written", csv_path.stat().st_size, command=entity_name)
+        return csv_path
+
+    def close(self) -> List[Path]:
+        written: list[Path] = []
+        try:
+            for entity_name, spill in self._entities.items():
+                with self.metrics.timer("export", command=entity_name):
+                    written.append(self._write_entity(entity_name, spill))
+        finally:
+            self.discard()
+        return written
+
+    def discard(self) -> None:
+        for spill in self._entities.values():
+            spill.fh.close()
+        self._entities.clear()
+        self._spill_dir.cleanup()
+
+    def __enter__(self) -> "StreamingCsvExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+PARTITION_FIELDS = ("site", "role", "os", "hostname", "date")
+EMPTY_PARTITION = "__empty__"
+
+
+def partition_value(row: Dict[str, Any], field: str) -> str:
+    if field == "date":
+        value = str(row.get("timestamp", ""))[:10]
+    else:
+        value = str(row.get(field, "") or "")
+    if not value:
+        return EMPTY_PARTITION
+    # 目录名中不能出现路径分隔符
+    return re.sub(r"[\\/\x00]+", "_", value).strip(".") or EMPTY_PARTITION
+
+
+class _PartitionSpill:
+    """一个命令的溢写文件；块按 (分区, hostname, 序号) 索引，列名按分区收集。"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fh = path.open("wb")
+        self.keys: dict[tuple[str, ...], set[str]] = {}
+        self.blocks: dict[tuple[str, ...], list[tuple[str, int, int, int]]] = {}
+        self.seq = 0
+
+    def add(self, part: tuple[str, ...], hostname: str, rows: List[dict]) -> None:
+        self.keys.setdefault(part, set()).update(row_keys(rows))
+        offset = self.fh.tell()
+        pickle.dump(rows, self.fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks.setdefault(part, []).append((hostname, self.seq, offset, len(rows)))
+        self.seq += 1
+
+
+class PartitionedCsvExporter:
+    """
+    分区输出：<output_dir>/command=<cmd>/<field>=<value>/.../part-N.csv
+
+    - partition_by: 分区字段，取自 PARTITION_FIELDS（date 取 timestamp 的日期部分）
+    - max_rows: 每个 part 文件的最大行数
+    - 各分区在 close() 时由 writers 个线程并发写出
+    - 每个 part 先写临时文件，完成后再改名提交，读者不会看到写了一半的文件
+    - append=False（默认）时分区的全部 part 先写入同级的临时目录，完成后整个目录
+      换入：读者看到的是旧的一组或新的一组 part 文件，不会混在一起
+      （两次 rename 之间分区目录短暂不存在）；未写入的分区保持不变
+    - append=True 时用 os.link 占用下一个未使用的 part-N.csv 名称（目标已存在时失败，
+      不会覆盖），已有数据保留，并发的运行之间也不会互相覆盖
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        partition_by: Iterable[str] = ("site", "date"),
+        max_rows: int = 1_000_000,
+        writers: int = 4,
+        append: bool = False,
+        metrics=NULL_METRICS,
+    ):
+        self.partition_by = tuple(partition_by)
+        unknown = [f for f in self.partition_by if f not in PARTITION_FIELDS]
+        if unknown:
+            raise ValueError(f"unknown partition field(s): {', '.join(unknown)}")
+        if max_rows < 1:
+            raise ValueError("max_rows must be >= 1")
+        self.max_rows = max_rows
+        self.writers = max(1, writers)
+        self.append = append
+        self.metrics = metrics
+        self.output_path = Path(output_dir)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        self._spill_dir = tempfile.TemporaryDirectory(
+            prefix=".cmd2csv-spill-", dir=self.output_path
+        )
+        self._entities: dict[str, _PartitionSpill] = {}
+
+    def _partition(self, row: Dict[str, Any]) -> tuple[str, ...]:
+        return tuple(partition_value(row, f) for f in self.partition_by)
+
+    def partition_dir(self, entity_name: str, part: tuple[str, ...]) -> Path:
+        path = self.output_path / f"command={entity_name}"
+        for field, value in zip(self.partition_by, part):
+            path = path / f"{field}={value}"
+        return path
+
+    def add_rows(self, entity_name: str, rows: List[dict]) -> None:
+        if not rows:
+            return
+        spill = self._entities.get(entity_name)
+        if spill is None:
+            spill = _PartitionSpill(Path(self._spill_dir.name) / f"{entity_name}.pkl")
+            self._entities[entity_name] = spill
+
+        for block in row_blocks(rows):
+            # hostname 和分区字段都只在元数据中时，分区由元数据决定，整块溢写
+            if isinstance(block, RowBlock) and block.uniform("hostname") and all(
+                block.uniform("timestamp" if f == "date" else f) for f in self.partition_by
+            ):
+                spill.add(self._partition(block.meta), block.hostname, block)
+                continue
+            # 按 (hostname, 分区) 连续段切块
+            start = 0
+            start_key = (block[0].get("hostname", ""), self._partition(block[0]))
+            for i in range(1, len(block) + 1):
+                key = None if i == len(block) else (block[i].get("hostname", ""), self._partition(block[i]))
+                if key != start_key:
+                    spill.add(start_key[1], start_key[0], block[start:i])
+                    start, start_key = i, key
+
+    def _commit(self, tmp_path: Path, directory: Path, number: int) -> tuple[Path, int]:
+        """把临时文件以 part-N.csv 名称提交，返回 (文件, 下一个 N)。"""
+        if not self.append:
+            final = directory / f"part-{number}.csv"
+            os.replace(tmp_path, final)
+            return final, number + 1
+        # 追加：名称已被占用（其它运行刚写入）时递增 N
+        while True:
+            final = directory / f"part-{number}.csv"
+            try:
+                os.link(tmp_path, final)
+            except FileExistsError:
+                number += 1
+                continue
+            os.unlink(tmp_path)
+            return final, number + 1
+
+    @staticmethod
+    def _existing_parts(directory: Path) -> List[Path]:
+        try:
+            return [
+                directory / name for name in os.listdir(directory)
+                if name.startswith("part-") and name.endswith(".csv")
+            ]
+        except OSError:
+            return []
+
+    @staticmethod
+    def _swap_in(staged: Path, directory: Path) -> None:
+        """用 staged 目录整体替换分区目录；旧目录中 part 以外的条目（如子分区）移入新目录。"""
+        while True:
+            backup = None
+            if directory.exists():
+                for name in os.listdir(directory):
+                    if not (name.startswith("part-") and name.endswith(".csv")):
+                        os.rename(directory / name, staged / name)
+                backup = Path(tempfile.mkdtemp(prefix=f".{directory.name}.old-", dir=directory.parent))
+                os.rename(directory, backup / directory.name)
+            try:
+                os.rename(staged, directory)
+            except OSError:
+                if directory.exists():
+                    # 另一个运行刚换入了同一分区：再换一次
+                    if backup is not None:
+                        shutil.rmtree(backup, ignore_errors=True)
+                    continue
+                if backup is not None:
+                    os.rename(backup / directory.name, directory)
+                    shutil.rmtree(backup, ignore_errors=True)
+                raise
+            if backup is not None:
+                shutil.rmtree(backup, ignore_errors=True)
+            return
+
+    def _write_partition(self, entity_name: str, spill: _PartitionSpill, part: tuple[str, ...]) -> List[Path]:
+        directory = self.partition_dir(entity_name, part)
+        number = 0
+        if self.append:
+            directory.mkdir(parents=True, exist_ok=True)
+            target = directory
+            for p in self._existing_parts(directory):
+                try:
+                    number = max(number, int(p.name[len("part-"):-len(".csv")]) + 1)
+                except ValueError:
+                    pass
+        else:
+            directory.parent.mkdir(parents=True, exist_ok=True)
+            target = Path(tempfile.mkdtemp(prefix=f".{directory.name}.new-", dir=directory.parent))
+
+        fieldnames = build_fieldnames(spill.keys[part])
+        written: list[Path] = []
+        rows_in_file = 0
+        f = w = tmp_path = None
+
+        def commit() -> None:
+            nonlocal f, number
+            f.close()
+            final, number = self._commit(tmp_path, target, number)
+            written.append(final)
+            f = None
+
+        try:
+            with spill.path.open("rb") as src:
+                for _, _, offset, _ in sorted(spill.blocks[part]):
+                    src.seek(offset)
+                    block = pickle.load(src)
+                    while block:
+                        if f is None:
+                            fd, name = tempfile.mkstemp(prefix=".part-", suffix=".tmp", dir=target)
+                            tmp_path = Path(name)
+                            f = os.fdopen(fd, "w", newline="", encoding="utf-8")
+                            w = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+                            w.writeheader()
+                            rows_in_file = 0
+                        take = block[: self.max_rows - rows_in_file]
+                        block = block[len(take):]
+                        write_rows(w, take, fieldnames)
+                        rows_in_file += len(take)
+                        if rows_in_file >= self.max_rows:
+                            commit()
+            if f is not None:
+                commit()
+        except BaseException:
+            if f is not None:
+                f.close()
+                os.unlink(tmp_path)
+            if not self.append:
+                shutil.rmtree(target, ignore_errors=True)
+            raise
+
+        if self.metrics.enabled:
+            self.metrics.inc("rows_written", sum(b[3] for b in spill.blocks[part]), command=entity_name)
+            self.metrics.inc("bytes_written", sum(p.stat().st_size for p in written), command=entity_name)
+        if not self.append:
+            self._swap_in(target, directory)
+            written = [directory / p.name for p in written]
+        return written
+
+    def close(self) -> List[Path]:
+        written: list[Path] = []
+        try:
+            for spill in self._entities.values():
+                spill.fh.close()
+            jobs = [
+                (entity_name, spill, part)
+                for entity_name, spill in self._entities.items()
+                for part in spill.blocks
+            ]
+            with self.metrics.timer("export"):
+                if self.writers <= 1 or len(jobs) <= 1:
+                    for job in jobs:
+                        written.extend(self._write_partition(*job))
+                else:
+                    with ThreadPoolExecutor(max_workers=min(self.writers, len(jobs))) as pool:
+                        for paths in pool.map(lambda job: self._write_partition(*job), jobs):
+                            written.extend(paths)
+        finally:
+            self.discard()
+        return written
+
+    def discard(self) -> None:
+        for spill in self._entities.values():
+            spill.fh.close()
+        self._entities.clear()
+        self._spill_dir.cleanup()
+
+    def __enter__(self) -> "PartitionedCsvExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
@@ -0,0 +1,271 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, Any, List, Tuple
+import re
+import threading
+
+# 只在输出开头若干行内找表头
+SCAN_LINES = 30
+# 表格末尾最多这么多行可以不对齐（"Total ..." 之类的脚注），这些行按 TEXT_COLUMN 输出
+FOOTER_LINES = 2
+# 表格之外的非空行（表头之前的说明、脚注等）各输出一行，原文放在这一列
+TEXT_COLUMN = "_text"
+
+_SEPARATOR = re.compile(r"[-=+|\s]+\Z")
+# 表头单词：以字母开头，不含逗号等散文标点
+_HEADER_TOKEN = re.compile(r"[A-Za-z(#*][\w\-/?#%().:*]*\Z")
+# 接口名、IP、MAC、时间等数据值（数字与 / . : 相邻）
+_DATA_LIKE = re.compile(r"\d[/.:]|[/.:]\d")
+# 散文而非表头："bytes):" 之类以冒号结尾、"(8192" 之类括号内带数字的单词
+_PROSE_TOKEN = re.compile(r".*:\Z|.*[()].*\d|.*\d.*[()]")
+_TOKEN = re.compile(r"\S+")
+_BLANK_LINE = re.compile(r"\n[ \t]*(?:\n|\Z)")
+# 空格 -> 0，其他字符 -> 1
+_OCCUPIED = bytes(0 if b == 0x20 else 1 for b in range(256))
+
+
+def column_name(text: str) -> str:
+    s = re.sub(r"[^\w]+", "_", text.strip().lower())
+    return s.strip("_")
+
+
+def _find_header(text: str, header: str, start: int = 0) -> tuple[int, int] | None:
+    """从 start 起找与表头完全相同的一行，返回 (行首, 行尾)。str.find 比多行正则快得多。"""
+    i = text.find(header, start)
+    while i >= 0:
+        end = i + len(header)
+        nl = text.find("\n", end)
+        line_end = len(text) if nl < 0 else nl
+        if (i == 0 or text[i - 1] == "\n") and not text[end:line_end].strip(" \t"):
+            return i, line_end
+        i = text.find(header, i + 1)
+    return None
+
+
+class _Table:
+    """
+    表头之后的数据行；按列检查是否有字符时一次性生成占用矩阵。
+    start 为第一行数据在原文中的位置。
+    """
+
+    __slots__ = ("lines", "start", "width", "_occ")
+
+    def __init__(self, lines: List[str], start: int = 0):
+        self.lines = lines
+        self.start = start
+        self.width = max(map(len, lines)) if lines else 0
+        self._occ: bytes | None = None
+
+    def occupied(self, col: int) -> int:
+        """第 col 列（从 0 起）有非空格字符的第一行的行号，没有时返回 -1。"""
+        w = self.width
+        if col >= w:
+            return -1
+        if self._occ is None:
+            padded = "".join([line.ljust(w) for line in self.lines])
+            self._occ = padded.encode("ascii", "replace").translate(_OCCUPIED)
+        return self._occ[col::w].find(1)
+
+    def clear(self, boundary: int, limit: int) -> int:
+        """
+        boundary 左侧一列在前 limit 行中都是空白时返回 limit；
+        只有末尾脚注行占用时返回截断后的行数；否则返回 -1。
+        """
+        i = self.occupied(boundary - 1)
+        if i < 0 or i >= limit:
+            return limit
+        n = len(self.lines)
+        if n > FOOTER_LINES and i >= n - FOOTER_LINES:
+            return i
+        return -1
+
+    def end(self, limit: int) -> int:
+        """前 limit 行数据在原文中的结束位置（含换行符）。"""
+        return self.start + sum(len(line) + 1 for line in self.lines[:limit])
+
+
+def _table_at(text: str, start: int, header: str) -> _Table:
+    """表头之后到空行或下一个相同表头为止的数据行（跳过开头的 ---- 分隔线）。"""
+    while True:
+        nl = text.find("\n", start)
+        line = text[start:] if nl < 0 else text[start:nl]
+        if not line.strip():
+            return _Table([], start)
+        if nl < 0 or not _SEPARATOR.match(line):
+            break
+        start = nl + 1
+    end = len(text)
+    m = _BLANK_LINE.search(text, start)
+    if m is not None:
+        end = min(end, m.start())
+    found = _find_header(text, header, start)
+    if found is not None:
+        end = min(end, found[0])
+    body = text[start:end].rstrip("\n")
+    return _Table(body.split("\n") if body else [], start)
+
+
+@dataclass(frozen=True)
+class ColumnLayout:
+    """一张定宽表的表头和各列起始位置。"""
+    header: str
+    names: Tuple[str, ...]
+    starts: Tuple[int, ...]
+
+    def fit(self, table: _Table) -> int:
+        """数据仍按这些列位置对齐时返回可用的行数，否则返回 -1。"""
+        limit = len(table.lines)
+        for b in self.starts[1:]:
+            if limit <= 0:
+                break
+            limit = table.clear(b, limit)
+        return limit
+
+    def rows(self, lines: List[str]) -> List[Dict[str, Any]]:
+        getter = itemgetter(*[slice(a, b) for a, b in zip(self.starts, self.starts[1:] + (None,))])
+        names = self.names
+        strip = str.strip
+        return [dict(zip(names, map(strip, getter(line)))) for line in lines]
+
+
+def header_candidate(line: str) -> List[tuple[int, str]] | None:
+    tokens = [(m.start(), m.group()) for m in _TOKEN.finditer(line)]
+    if len(tokens) < 2:
+        return None
+    for _, text in tokens:
+        if not _HEADER_TOKEN.match(text) or _DATA_LIKE.search(text) or _PROSE_TOKEN.match(text):
+            return None
+    return tokens
+
+
+def fit_layout(header: str, tokens: List[tuple[int, str]], table: _Table) -> tuple[ColumnLayout, int] | None:
+    """
+    每个表头单词之前的间隙里，找一个所有数据行都是空白的位置作为列边界；
+    找不到时该单词并入前一列（如 "Mac Address"）。某一列的表头单词下方没有
+    任何数据时不是表格。返回 (列布局, 可用的行数)。
+    """
+    limit = len(table.lines)
+    if not limit:
+        return None
+    starts = [0]
+    for (start, _), (prev_start, prev_text) in zip(tokens[1:], tokens):
+        prev_end = prev_start + len(prev_text)
+        for b in range(start, prev_end, -1):
+            clear = table.clear(b, limit)
+            if clear >= 0:
+                starts.append(b)
+                limit = clear
+                break
+    if len(starts) < 2 or limit <= 0:
+        return None
+    # 每一列的表头单词下方都要有数据，否则只是碰巧对齐的散文
+    bounds = starts[1:] + [len(header)]
+    for a, b in zip(starts, bounds):
+        cols = [c for start, text in tokens if a <= start < b for c in range(start, start + len(text))]
+        if not any(0 <= table.occupied(c) < limit for c in cols):
+            return None
+
+    names: list[str] = []
+    for i, (a, b) in enumerate(zip(starts, starts[1:] + [None])):
+        name = column_name(header[a:b]) or f"col{i + 1}"
+        base, n = name, 1
+        while name in names:
+            n += 1
+            name = f"{base}_{n}"
+        names.append(name)
+    return ColumnLayout(header, tuple(names), tuple(starts)), limit
+
+
+# (表头起始位置, 最后一行数据之后的位置, 数据行)
+Span = Tuple[int, int, List[str]]
+
+
+def detect_layout(text: str) -> tuple[ColumnLayout, Span] | None:
+    """在开头 SCAN_LINES 行内找表头，返回 (列布局, 第一张表)。"""
+    pos = 0
+    for _ in range(SCAN_LINES):
+        nl = text.find("\n", pos)
+        if nl < 0:
+            break
+        header = text[pos:nl].rstrip()
+        tokens = header_candidate(header)
+        if tokens is not None:
+            table = _table_at(text, nl + 1, header)
+            fitted = fit_layout(header, tokens, table)
+            if fitted is not None:
+                layout, limit = fitted
+                return layout, (pos, table.end(limit), table.lines[:limit])
+        pos = nl + 1
+    return None
+
+
+_lock = threading.Lock()
+_layouts: dict[tuple[str, str], ColumnLayout] = {}
+
+
+def _tables(text: str, layout: ColumnLayout, skip: int = 0) -> List[Span]:
+    """按缓存的列位置取出所有与表头对齐的表格；skip 跳过前几个表头。"""
+    out: list[Span] = []
+    pos, i = 0, 0
+    while True:
+        found = _find_header(text, layout.header, pos)
+        if found is None:
+            return out
+        header_start = found[0]
+        pos = found[1] + 1
+        i += 1
+        if i <= skip:
+            continue
+        table = _table_at(text, pos, layout.header)
+        limit = layout.fit(table)
+        if limit > 0:
+            out.append((header_start, table.end(limit), table.lines[:limit]))
+
+
+def _text_rows(chunk: str) -> List[Dict[str, Any]]:
+    # 分隔线（---- / ====）不含信息，不输出
+    return [
+        {TEXT_COLUMN: line.strip()}
+        for line in chunk.split("\n")
+        if line.strip() and not _SEPARATOR.match(line)
+    ]
+
+
+def parse_fixed_width(raw_output: str, cache_key: tuple[str, str] | None = None) -> List[Dict[str, Any]] | None:
+    """
+    按表头识别定宽表：列名取自表头，每行按列位置切片，列值中的空格不会错位。
+    cache_key=(platform, 命令) 时缓存列位置，下一份输出表头相同且数据仍对齐时直接复用。
+    同一表头重复出现（分页、分段）时继续解析。表格之外的非空行（表头之前的说明、
+    脚注等）不会丢弃，按出现顺序各输出一行，原文在 _text 列。
+    找不到表头时返回 None。
+    """
+    text = raw_output.replace("\r\n", "\n")
+    if "\t" in text:
+        text = text.expandtabs()
+
+    layout = _layouts.get(cache_key) if cache_key is not None else None
+    tables = _tables(text, layout) if layout is not None else []
+    if not tables:
+        found = detect_layout(text)
+        if found is None:
+            return None
+        layout, first = found
+        tables = [first] + _tables(text, layout, skip=1)
+        if cache_key is not None:
+            with _lock:
+                _layouts[cache_key] = layout
+
+    rows: list[dict] = []
+    pos = 0
+    for start, end, lines in tables:
+        rows.extend(_text_rows(text[pos:start]))
+        rows.extend(layout.rows(lines))
+        pos = max(pos, end)
+    rows.extend(_text_rows(text[pos:]))
+    return rows or None
+
+
+def clear_layouts() -> None:
+    with _lock:
+        _layouts.clear()
@@ -0,0 +1,348 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Iterable
+import re
+import sys
+import threading
+
+SEP = "_"
+
+# Genie schema 的固定键都是小写标识符；接口名、IP、编号等动态键通常不是
+_FIXED_KEY = re.compile(r"[a-z_][a-z0-9_]*\Z")
+
+# 展开层数：None 不限制，0 不展开（整份输出压成一行）
+_explode_depth: int | None = None
+
+
+def set_explode_depth(depth: int | None) -> None:
+    """设置默认展开层数（解析进程通过 ParseStage 的 initializer 设置）。"""
+    global _explode_depth
+    if depth is not None and depth < 0:
+        raise ValueError("explode depth must be >= 0")
+    _explode_depth = depth
+
+
+def explode_depth() -> int | None:
+    return _explode_depth
+
+
+class _Scalar:
+    __slots__ = ()
+    explodes = False
+
+    def __repr__(self) -> str:
+        return "SCALAR"
+
+
+SCALAR = _Scalar()
+
+
+class Record:
+    """
+    固定键的 dict：标量复制到当前行，嵌套 dict 以 "父键_" 为前缀展平。
+    遇到计划中没有的键时按数据推断一次并记入计划；default 用于 schema 中
+    与固定键并列的动态键。
+    """
+
+    __slots__ = ("fields", "default", "explodes")
+
+    def __init__(self, fields: Dict[str, Any] | None = None, default=None):
+        self.fields = dict(fields or {})
+        self.default = default
+        self.explodes = any(n.explodes for n in self.fields.values()) or bool(
+            default is not None and default.explodes
+        )
+
+    def node(self, key: str, value: Any):
+        node = self.fields.get(key)
+        if node is None:
+            node = self.default
+            if node is None:
+                node = self.fields[key] = infer(value)
+                self.explodes = self.explodes or node.explodes
+        return node
+
+    def emit(
+        self,
+        value: dict,
+        prefix: str,
+        depth: int | None,
+        keys: List[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        own: dict[str, Any] = {}
+        split = None
+        for k, v in value.items():
+            node = self.node(k, v)
+            if node is SCALAR:
+                own[prefix + k] = v
+            elif split is None and depth != 0 and node.explodes:
+                split = (node, k, v)
+            else:
+                node.flatten(v, f"{prefix}{k}{SEP}", own)
+        if split is None:
+            return [own]
+        node, k, v = split
+        rows = node.emit(v, f"{prefix}{k}{SEP}", depth, keys=keys)
+        if not rows:
+            return [own]
+        return [{**own, **r} for r in rows]
+
+    def flatten(self, value: dict, prefix: str, out: Dict[str, Any]) -> None:
+        for k, v in value.items():
+            node = self.node(k, v)
+            if node is SCALAR:
+                out[prefix + k] = v
+            else:
+                node.flatten(v, f"{prefix}{k}{SEP}", out)
+
+
+class Collection:
+    """
+    动态键的 dict（或 dict 列表）：每个元素一行，键写入键列。
+    键列名取所在字段名（最外层为 _key），元素的列以 "字段名_" 为前缀。
+    用到的键列名依次追加到 keys（FlattenPlan.key_columns）。
+    """
+
+    __slots__ = ("item",)
+    explodes = True
+
+    def __init__(self, item):
+        self.item = item
+
+    @staticmethod
+    def _items(value) -> Iterable[tuple[Any, Any]]:
+        return enumerate(value) if isinstance(value, list) else value.items()
+
+    def emit(
+        self,
+        value,
+        prefix: str,
+        depth: int | None,
+        key_column: str | None = None,
+        keys: List[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        if depth == 0:
+            out: dict[str, Any] = {}
+            self.flatten(value, prefix, out)
+            return [out]
+        if key_column is None:
+            key_column = prefix[: -len(SEP)] or "_key"
+        if keys is not None and key_column not in keys:
+            keys.append(key_column)
+        item = self.item
+        item_prefix = prefix
+        if isinstance(item, Collection):
+            item_prefix = f"{key_column}{SEP}key{SEP}"
+        next_depth = None if depth is None else depth - 1
+
+        rows: list[dict] = []
+        for key, v in self._items(value):
+            if item is SCALAR:
+                rows.append({key_column: key, f"{item_prefix}value": v})
+                continue
+            for r in item.emit(v, item_prefix, next_depth, keys=keys):
+                row = {key_column: key}
+                row.update(r)
+                rows.append(row)
+        return rows
+
+    def flatten(self, value, prefix: str, out: Dict[str, Any]) -> None:
+        item = self.item
+        for key, v in self._items(value):
+            if item is SCALAR:
+                out[f"{prefix}{key}"] = v
+            else:
+                item.flatten(v, f"{prefix}{key}{SEP}", out)
+
+
+def infer(value: Any):
+    """按一份数据推断计划节点（没有 schema 时使用）。"""
+    if isinstance(value, dict):
+        if not value:
+            return Record()
+        if all(isinstance(v, dict) for v in value.values()) and not all(
+            isinstance(k, str) and _FIXED_KEY.match(k) for k in value
+        ):
+            return Collection(_infer_items(value.values()))
+        return Record({k: infer(v) for k, v in value.items()})
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        return Collection(_infer_items(value))
+    return SCALAR
+
+
+def _infer_items(items: Iterable[dict]) -> Record:
+    # 合并所有元素的键，后续设备遇到的新键再按需补充
+    merged = Record()
+    for item in items:
+        for k, v in item.items():
+            merged.node(k, v)
+    return merged
+
+
+def _schema_key(key: Any) -> Any:
+    # Optional(x) / Optional(Any()) -> x / Any()
+    while type(key).__name__ == "Optional":
+        key = key.schema
+    return key
+
+
+def compile_schema(schema: Any):
+    """把 Genie parser 的 schema 编译为计划节点；Any() 键即动态键。"""
+    kind = type(schema).__name__
+    if kind == "Schema":
+        return compile_schema(schema.schema)
+    if isinstance(schema, dict):
+        fields: dict[str, Any] = {}
+        dynamic = None
+        for k, v in schema.items():
+            key = _schema_key(k)
+            if isinstance(key, str):
+                fields[key] = compile_schema(v)
+            else:
+                dynamic = compile_schema(v)
+        if dynamic is not None and not fields and dynamic is not SCALAR:
+            return Collection(dynamic)
+        return Record(fields, default=dynamic)
+    if kind == "ListOf" or (isinstance(schema, list) and schema):
+        inner = compile_schema(schema.schema if kind == "ListOf" else schema[0])
+        return Collection(inner) if isinstance(inner, (Record, Collection)) else SCALAR
+    return SCALAR
+
+
+class FlattenPlan:
+    """
+    一个命令（parser schema）的展平计划。优先由 schema 编译；
+    没有 schema 时由第一份输出推断，之后的设备直接复用，只在出现新键时补充。
+    key_columns 按由外到内的顺序记录输出过的键列名（增量导出用作行键）。
+    """
+
+    __slots__ = ("root", "source", "key_columns")
+
+    def __init__(self, root=None, source: str = "inferred"):
+        self.root = root
+        self.source = source
+        self.key_columns: List[str] = []
+
+    def rows(self, parsed: Any, depth: Any = ...) -> List[Dict[str, Any]]:
+        if depth is ...:
+            depth = _explode_depth
+        if self.root is None:
+            self.root = infer(parsed)
+        schema = self.source == "schema"
+        try:
+            return _plan_rows(self.root, parsed, depth, schema, self.key_columns)
+        except (AttributeError, TypeError):
+            # 数据与计划不符（类型漂移）：本次按数据重新推断，不改动缓存的计划
+            return _plan_rows(infer(parsed), parsed, depth, False, self.key_columns)
+
+
+def _plan_rows(
+    node,
+    value: Any,
+    depth: int | None,
+    schema: bool = False,
+    keys: List[str] | None = None,
+) -> List[Dict[str, Any]]:
+    if node is SCALAR:
+        return []
+    if keys is None:
+        keys = []
+    key_column = None
+    last = None
+    outer: dict[str, Any] = {}
+    # 只有一个键的外层（{'interface': {...}}、{'version': {...}}）不作为列前缀。
+    # 只有 schema 中的固定键可以这样去掉；动态键（如 {'vrf': {'default': ...}}
+    # 中的 VRF 名）写入以外层字段命名的键列。没有 schema 时无法区分
+    # 'default' 与固定键，按 字段名 / 数据键 交替处理。
+    while isinstance(node, Record) and isinstance(value, dict) and len(value) == 1:
+        (k, v), = value.items()
+        fixed = k in node.fields if schema else key_column is None
+        child = node.node(k, v)
+        if child is SCALAR:
+            break
+        if fixed:
+            node, value, key_column = child, v, k
+            continue
+        # 连续的动态键与 Collection 一样命名为 "外层键列_key"
+        column = key_column or (f"{last}{SEP}key" if last else "_key")
+        outer[column] = k
+        if column not in keys:
+            keys.append(column)
+        node, value, key_column, last = child, v, None, column
+    if isinstance(node, Collection):
+        rows = node.emit(value, "", depth, key_column, keys=keys)
+    else:
+        rows = node.emit(value, "", depth, keys=keys)
+    if outer:
+        rows = [{**outer, **r} for r in rows]
+    return rows
+
+
+_lock = threading.Lock()
+_schema_plans: dict[Any, FlattenPlan] = {}
+_command_plans: dict[tuple[str, str], FlattenPlan] = {}
+# ParseStage 解析进程中的计划不在本进程，只带回键列名
+_remote_key_columns: dict[tuple[str, str], List[str]] = {}
+
+
+def _schema_for(device, command: str):
+    # 只有 genie 已被加载（真实 Genie Device）时才查 parser，避免为假设备导入 genie
+    if "genie" not in sys.modules:
+        return None, None
+    try:
+        from genie.libs.parser.utils import get_parser
+
+        parser_cls, _ = get_parser(command, device)
+    except Exception:
+        return None, None
+    return parser_cls, getattr(parser_cls, "schema", None)
+
+
+def plan_for(device, command: str) -> FlattenPlan:
+    """按 (os, 命令) 取计划；同一个 parser class 的命令共享由 schema 编译的计划。"""
+    key = (str(getattr(device, "os", "") or ""), command)
+    plan = _command_plans.get(key)
+    if plan is not None:
+        return plan
+
+    parser_cls, schema = _schema_for(device, command)
+    with _lock:
+        plan = _command_plans.get(key)
+        if plan is not None:
+            return plan
+        if schema is not None:
+            plan = _schema_plans.get(parser_cls)
+            if plan is None:
+                try:
+                    plan = FlattenPlan(compile_schema(schema), source="schema")
+                except Exception:
+                    plan = FlattenPlan()
+                _schema_plans[parser_cls] = plan
+        else:
+            plan = FlattenPlan()
+        _command_plans[key] = plan
+    return plan
+
+
+def plan_key_columns(pyats_os: str, command: str) -> List[str]:
+    """(os, 命令) 的展平计划输出过的键列名，含解析进程中记录的。"""
+    key = (pyats_os, command)
+    plan = _command_plans.get(key)
+    cols = list(plan.key_columns) if plan is not None else []
+    cols.extend(c for c in _remote_key_columns.get(key, ()) if c not in cols)
+    return cols
+
+
+def record_key_columns(pyats_os: str, command: str, columns: Iterable[str]) -> None:
+    """合并解析进程中记录的键列名（ParseStage 返回结果时调用）。"""
+    if not columns:
+        return
+    with _lock:
+        known = _remote_key_columns.setdefault((pyats_os, command), [])
+        known.extend(c for c in columns if c not in known)
+
+
+def clear_plans() -> None:
+    with _lock:
+        _schema_plans.clear()
+        _command_plans.clear()
+        _remote_key_columns.clear()
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List
+import csv
+import os
+import socket
+import threading
+import time
+
+from .metrics import NULL_METRICS
+
+SSH_PORT = 22
+# 预检并发上限：探测只是一次 TCP 握手，线程几乎都在等待
+PROBE_WORKERS = 256
+
+FAILURE_FIELDS = ("timestamp", "hostname", "address", "stage", "command", "error_type", "error")
+# 输出目录中的默认文件名；命令 CSV 的文件名不会以 "_" 开头（见 normalize_command），不会重名
+FAILURES_CSV = "_failures.csv"
+
+
+def management_address(testbed, name: str) -> tuple[str, int] | None:
+    """设备的 (管理地址, 端口)。LazyTestbed 直接读设备定义，不创建 Device。"""
+    definition = getattr(testbed, "definition", None)
+    if definition is not None:
+        cli = definition[name].get("connections", {}).get("cli", {})
+    else:
+        cli = testbed.devices[name].connections.get("cli") or {}
+    ip = cli.get("ip")
+    if not ip:
+        return None
+    return str(ip), int(cli.get("port") or SSH_PORT)
+
+
+def probe(host: str, port: int = SSH_PORT, timeout: float = 1.0) -> OSError | None:
+    """TCP 连接 host:port，成功返回 None，失败返回异常。"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return None
+    except OSError as exc:
+        return exc
+
+
+def precheck(
+    addresses: Dict[str, tuple[str, int]],
+    timeout: float = 1.0,
+    metrics=NULL_METRICS,
+) -> Dict[str, OSError]:
+    """
+    并发探测 hostname -> (地址, 端口)，返回不可达设备的 hostname -> 异常。
+    整体耗时约为一个 timeout，而不是每台设备一个 Unicon 连接超时。
+    """
+    if not addresses:
+        return {}
+
+    def run(item: tuple[str, tuple[str, int]]) -> tuple[str, OSError | None]:
+        name, (host, port) = item
+        return name, probe(host, port, timeout)
+
+    with metrics.timer("precheck"):
+        with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(addresses))) as pool:
+            results = list(pool.map(run, addresses.items()))
+    dead = {name: exc for name, exc in results if exc is not None}
+    metrics.inc("precheck_unreachable", len(dead))
+    return dead
+
+
+class CircuitBreaker:
+    """
+    按设备的熔断器：连续失败 threshold 次（连接、命令、预检都算）后打开，
+    不再向该设备发送命令；cooldown 秒后半开，allow() 只放行一个调用方试探，
+    其余调用方在试探结束前仍被拒绝。试探成功则关闭，失败则重新计时；
+    试探方没有报告结果时，再过 cooldown 秒放行下一次试探。
+    daemon 中跨作业保留状态。
+
+    allow() 用于决定是否开始采集一台设备（会占用试探名额）；已获准的采集
+    在每条命令前用 tripped() 检查熔断器是否在中途打开。
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 300.0):
+        if threshold < 1:
+            raise ValueError("breaker threshold must be >= 1")
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        # hostname -> [连续失败次数, 打开（或放行试探）时间, 是否有在途的试探]
+        self._hosts: dict[str, list] = {}
+
+    def _blocked(self, state: list | None, now: float) -> bool:
+        return (
+            state is not None
+            and state[0] >= self.threshold
+            and now - state[1] < self.cooldown
+        )
+
+    def allow(self, hostname: str, now: float | None = None) -> bool:
+        state = self._hosts.get(hostname)
+        if state is None or state[0] < self.threshold:
+            return True
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._hosts.get(hostname)
+            if state is None or state[0] < self.threshold:
+                return True
+            if self._blocked(state, now):
+                return False
+            # 半开：放行这一次试探，冷却期重新计时，其余调用方继续被拒绝
+            state[1] = now
+            state[2] = True
+            return True
+
+    def tripped(self, hostname: str) -> bool:
+        """熔断器已打开且调用方不是试探方（采集中途连续失败达到阈值）时返回 True。"""
+        state = self._hosts.get(hostname)
+        return state is not None and state[0] >= self.threshold and not state[2]
+
+    def success(self, hostname: str) -> None:
+        if hostname in self._hosts:
+            with self._lock:
+                self._hosts.pop(hostname, None)
+
+    def failure(self, hostname: str, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._hosts.setdefault(hostname, [0, 0.0, False])
+            state[0] += 1
+            if state[0] >= self.threshold:
+                state[1] = now
+                state[2] = False
+
+    def open_hosts(self, now: float | None = None) -> List[str]:
+        """当前被拒绝的设备（冷却中或正在试探），不占用试探名额。"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [name for name, state in self._hosts.items() if self._blocked(state, now)]
+
+
+class FailureLog:
+    """一次运行中各设备的失败明细，结束时写成 failures CSV（线程安全）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows: list[dict[str, Any]] = []
+
+    def add(
+        self,
+        hostname: str,
+        stage: str,
+        error: BaseException | str,
+        command: str = "",
+        address: str = "",
+    ) -> None:
+        row = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "hostname": hostname,
+            "address": address,
+            "stage": stage,
+            "command": command,
+            "error_type": type(error).__name__ if isinstance(error, BaseException) else "",
+            "error": str(error),
+        }
+        with self._lock:
+            self.rows.append(row)
+
+    def hostnames(self) -> List[str]:
+        with self._lock:
+            return list(dict.fromkeys(r["hostname"] for r in self.rows))
+
+    def write_csv(self, path: str | Path) -> Path:
+        """写出全部失败（没有失败时只有表头），先写临时文件再替换。"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            rows = sorted(self.rows, key=lambda r: (r["hostname"], r["timestamp"]))
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FAILURE_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, path)
+        return path
+
+    def __len__(self) -> int:
+        return len(self.rows)
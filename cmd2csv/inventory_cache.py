@@ -0,0 +1,166 @@
+from __future__ import annotations
+from dataclasses import asdict
+from typing import List, Any
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+from .ndb_client import NdbClient, NdbDevice, NdbFetchResult
+
+
+class InventoryCache:
+    """
+    本地持久化的 NdbDevice 缓存（JSON 文件）。
+
+    每条记录保存设备信息、获取时间以及返回它的那次请求每一页的 URL、ETag / Last-Modified，
+    过期（超过 ttl 秒）后逐页用条件请求向 NDB 重新验证。
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str, ttl: float = 300.0):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.records: dict[str, dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.records = {}
+            return
+        if data.get("version") != self.VERSION:
+            self.records = {}
+            return
+        self.records = data.get("devices", {})
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with self._lock:
+            payload = {"version": self.VERSION, "devices": self.records}
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, hostname: str) -> NdbDevice | None:
+        rec = self.records.get(hostname)
+        if rec is None:
+            return None
+        return NdbDevice(**rec["device"])
+
+    def is_fresh(self, hostname: str, now: float | None = None) -> bool:
+        rec = self.records.get(hostname)
+        if rec is None:
+            return False
+        now = time.time() if now is None else now
+        return now - rec["fetched_at"] < self.ttl
+
+    def validators(self, hostname: str) -> List[list]:
+        return self.records.get(hostname, {}).get("pages", [])
+
+    def put(self, device: NdbDevice, pages: List[list], now: float) -> None:
+        with self._lock:
+            self.records[device.hostname] = {
+                "device": asdict(device),
+                "fetched_at": now,
+                "pages": pages,
+            }
+
+    def touch(self, hostname: str, now: float) -> None:
+        with self._lock:
+            rec = self.records.get(hostname)
+            if rec is not None:
+                rec["fetched_at"] = now
+
+    def drop(self, hostname: str) -> None:
+        with self._lock:
+            self.records.pop(hostname, None)
+
+
+class CachedNdbClient:
+    """
+    在 NdbClient 前加一层 InventoryCache，接口与 NdbClient.fetch_devices_by_names 相同。
+
+    - 新鲜的记录直接返回，不访问网络
+    - 过期的记录按返回它们的那次分页结果分组，逐页做条件请求；全部 304 只刷新时间
+    - 缓存中没有的 hostname 才做普通查询
+    - offline=True 时完全不访问网络，只返回缓存中已有的设备（忽略 TTL）
+    """
+
+    def __init__(
+        self,
+        client: NdbClient | None,
+        cache: InventoryCache,
+        offline: bool = False,
+    ):
+        if client is None and not offline:
+            raise ValueError("NdbClient is required unless offline=True")
+        self.client = client
+        self.cache = cache
+        self.offline = offline
+
+    def _refresh(self, jobs: List[tuple[List[str], List[list] | None]]) -> None:
+        client = self.client
+        now = time.time()
+
+        def run(job) -> tuple[List[str], NdbFetchResult]:
+            chunk, pages = job
+            return chunk, client.fetch_chunk_conditional(chunk, pages)
+
+        if len(jobs) <= 1:
+            results = [run(job) for job in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=min(client.max_workers, len(jobs))) as pool:
+                results = list(pool.map(run, jobs))
+
+        for chunk, res in results:
+            if res.not_modified:
+                for hostname in chunk:
+                    self.cache.touch(hostname, now)
+                continue
+            returned = set()
+            for dev in res.devices:
+                returned.add(dev.hostname)
+                self.cache.put(dev, res.pages, now)
+            # NDB 中已不存在的设备从缓存中移除
+            for hostname in chunk:
+                if hostname not in returned:
+                    self.cache.drop(hostname)
+
+    def fetch_devices_by_names(self, hostnames: list[str]) -> list[NdbDevice]:
+        if not self.offline:
+            now = time.time()
+            missing: list[str] = []
+            stale: dict[str, tuple[List[list], list[str]]] = {}
+            for hostname in dict.fromkeys(hostnames):
+                if hostname not in self.cache.records:
+                    missing.append(hostname)
+                elif not self.cache.is_fresh(hostname, now):
+                    pages = self.cache.validators(hostname)
+                    stale.setdefault(json.dumps(pages), (pages, []))[1].append(hostname)
+
+            size = self.client.chunk_size
+            jobs: list[tuple[List[str], List[list] | None]] = []
+            for i in range(0, len(missing), size):
+                jobs.append((missing[i:i + size], None))
+            for pages, names in stale.values():
+                for i in range(0, len(names), size):
+                    jobs.append((names[i:i + size], pages))
+
+            if jobs:
+                self._refresh(jobs)
+                self.cache.save()
+
+        devices: list[NdbDevice] = []
+        for hostname in dict.fromkeys(hostnames):
+            dev = self.cache.get(hostname)
+            if dev is not None:
+                devices.append(dev)
+        return devices
@@ -0,0 +1,183 @@
+from __future__ import annotations
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, Iterator
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+
+def _label_key(labels: Dict[str, Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class RunMetrics:
+    """
+    一次运行的分阶段计时、计数和失败记录（线程安全）。
+
+    - timer / observe: 记录某阶段的耗时，labels 如 hostname / command / engine
+    - inc: 计数器，如 parse_engine_hits / rows / raw_bytes
+    - failure: 失败明细
+
+    结果可写成 JSON 运行报告和 Prometheus textfile collector 文件。
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = datetime.utcnow().isoformat()
+        self._t0 = time.perf_counter()
+        self.timings: list[dict[str, Any]] = []
+        self.counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        self.failures: list[dict[str, Any]] = []
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0, **labels)
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        record = {"stage": stage, "seconds": seconds, **labels}
+        with self._lock:
+            self.timings.append(record)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def failure(self, stage: str, error: BaseException | str, **labels) -> None:
+        record = {"stage": stage, "error": str(error), "type": type(error).__name__, **labels}
+        with self._lock:
+            self.failures.append(record)
+        self.inc("failures", stage=stage)
+
+    def export_state(self) -> tuple[list[dict[str, Any]], list[tuple[str, Dict[str, str], float]]]:
+        """导出计时和计数（可 pickle），用于从子进程传回父进程合并。"""
+        with self._lock:
+            timings = list(self.timings)
+            counters = [(name, dict(labels), value) for (name, labels), value in self.counters.items()]
+        return timings, counters
+
+    def merge(self, timings: list[dict[str, Any]], counters: list[tuple[str, Dict[str, str], float]]) -> None:
+        with self._lock:
+            self.timings.extend(timings)
+            for name, labels, value in counters:
+                key = (name, _label_key(labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        summary: dict[str, dict[str, float]] = {}
+        with self._lock:
+            timings = list(self.timings)
+        for t in timings:
+            s = summary.setdefault(t["stage"], {"count": 0, "sum": 0.0, "max": 0.0})
+            s["count"] += 1
+            s["sum"] += t["seconds"]
+            s["max"] = max(s["max"], t["seconds"])
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            timings = list(self.timings)
+            failures = list(self.failures)
+        return {
+            "started_at": self.started_at,
+            "elapsed_seconds": time.perf_counter() - self._t0,
+            "stages": self.stage_summary(),
+            "timings": timings,
+            "counters": counters,
+            "failures": failures,
+        }
+
+    def write_json(self, path: str) -> None:
+        _atomic_write(Path(path), json.dumps(self.to_dict(), indent=2, default=str))
+
+    def prometheus_text(self, prefix: str = "cmd2csv") -> str:
+        lines: list[str] = []
+
+        # 阶段耗时去掉 hostname 标签后聚合，避免标签基数过大
+        agg: dict[tuple[tuple[str, str], ...], list[float]] = {}
+        with self._lock:
+            timings = list(self.timings)
+            counters = sorted(self.counters.items())
+        for t in timings:
+            key = _label_key({k: v for k, v in t.items() if k not in ("seconds", "hostname")})
+            a = agg.setdefault(key, [0, 0.0])
+            a[0] += 1
+            a[1] += t["seconds"]
+
+        lines.append(f"# TYPE {prefix}_stage_seconds summary")
+        for key, (count, total) in sorted(agg.items()):
+            labels = _format_labels(dict(key))
+            lines.append(f"{prefix}_stage_seconds_sum{labels} {total:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{labels} {count}")
+
+        seen: set[str] = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(dict(labels))} {value:g}")
+
+        lines.append(f"# TYPE {prefix}_run_elapsed_seconds gauge")
+        lines.append(f"{prefix}_run_elapsed_seconds {time.perf_counter() - self._t0:.6f}")
+        lines.append(f"# TYPE {prefix}_run_last_timestamp_seconds gauge")
+        lines.append(f"{prefix}_run_last_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        # textfile collector 要求原子替换，避免读到半个文件
+        _atomic_write(Path(path), self.prometheus_text())
+
+
+class NullMetrics:
+    """未开启统计时使用，所有方法为空操作。"""
+
+    enabled = False
+
+    def timer(self, stage: str, **labels):
+        return nullcontext()
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        pass
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def failure(self, stage: str, error: BaseException | str, **labels) -> None:
+        pass
+
+    def merge(self, timings, counters) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
@@ -1,7 +1,12 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Dict
-import requests
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+# requests 导入较慢，只在建立会话时导入
+if TYPE_CHECKING:
+    import requests
 
 
 @dataclass
@@ -15,10 +20,41 @@ class NdbDevice:
     role: str | None = None
 
 
+@dataclass
+class NdbFetchResult:
+    """
+    一次（可能带条件头的）分块查询结果；not_modified 时 devices 为空。
+    pages 是每一页的 [url, etag, last_modified]，用于下次逐页重新验证。
+    """
+    devices: List[NdbDevice]
+    pages: List[list] = field(default_factory=list)
+    not_modified: bool = False
+
+
 class NdbClient:
-    def __init__(self, base_url: str, token: str):
+    """
+    NDB 查询客户端。
+
+    - 使用带连接池的 requests.Session（keep-alive）
+    - hostnames 按 chunk_size 切块并发查询，避免 URL 过长
+    - 自动跟随分页（响应体中的 "next" 或 Link: rel="next"）
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        chunk_size: int = 200,
+        max_workers: int = 8,
+        timeout: float = 10,
+        session: requests.Session | None = None,
+    ):
         self.base_url = base_url.rstrip("/")
         self.token = token
+        self.chunk_size = max(1, chunk_size)
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.session = session or self._build_session()
 
     def _headers(self) -> Dict[str, str]:
         return {
@@ -26,36 +62,127 @@ class NdbClient:
             "Accept": "application/json",
         }
 
+    def _build_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self._headers())
+        return session
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _next_url(self, resp: requests.Response, data: Dict[str, Any]) -> str | None:
+        nxt = data.get("next") or resp.links.get("next", {}).get("url")
+        if not nxt:
+            return None
+        return urljoin(resp.url, nxt)
+
+    def _revalidate(self, pages: List[list]) -> bool:
+        """
+        用每一页各自的验证器做条件请求；所有页都返回 304 才算未变化。
+        任何一页没有验证器或返回 200 时返回 False，由调用方整块重新获取。
+        """
+        for url, etag, last_modified in pages:
+            headers: Dict[str, str] = {}
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            if not headers:
+                return False
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+            if resp.status_code != 304:
+                resp.raise_for_status()
+                return False
+        return True
+
+    def _fetch_chunk(
+        self,
+        chunk: List[str],
+        pages: List[list] | None = None,
+    ) -> tuple[List[Dict[str, Any]] | None, List[list]]:
+        """
+        返回 (records, pages)，pages 是每一页的 [url, etag, last_modified]。
+        传入上次的 pages 且每一页都返回 304 时 records 为 None。
+        """
+        if pages and self._revalidate(pages):
+            return None, pages
+
+        # 示例：假设 /devices?hostname=R1,R2，分页时返回 next 链接
+        url: str | None = f"{self.base_url}/devices"
+        params: Dict[str, str] | None = {"hostname": ",".join(chunk)}
+
+        records: list[dict] = []
+        pages = []
+        while url:
+            resp = self.session.get(url, params=params, timeout=self.timeout)
+            resp.raise_for_status()
+            pages.append([resp.url, resp.headers.get("ETag"), resp.headers.get("Last-Modified")])
+            data = resp.json()
+            records.extend(data["devices"])
+            url = self._next_url(resp, data)
+            params = None  # next 链接已包含查询参数
+
+        return records, pages
+
+    @staticmethod
+    def _to_device(d: Dict[str, Any]) -> NdbDevice:
+        return NdbDevice(
+            hostname=d["hostname"],
+            mgmt_ip=d["mgmt_ip"],
+            vendor=d["vendor"],
+            os=d["os"],          # iosxe / nxos / eos / ...
+            model=d.get("model"),
+            site=d.get("site"),
+            role=d.get("role"),
+        )
+
+    def fetch_chunk_conditional(
+        self,
+        hostnames: List[str],
+        pages: List[list] | None = None,
+    ) -> NdbFetchResult:
+        """
+        用上次结果中每一页的 If-None-Match / If-Modified-Since 重新验证一个 hostname 分块。
+        调用方负责把 hostnames 控制在 chunk_size 以内。
+        """
+        records, pages = self._fetch_chunk(hostnames, pages)
+        if records is None:
+            return NdbFetchResult([], pages, not_modified=True)
+
+        wanted = set(hostnames)
+        devices = [self._to_device(d) for d in records if d["hostname"] in wanted]
+        return NdbFetchResult(devices, pages)
+
     def fetch_devices_by_names(self, hostnames: list[str]) -> list[NdbDevice]:
         """
         根据实际 NDB API 修改。
         目标是返回 NdbDevice 列表。
         """
-        # 示例：假设 /devices?hostname=R1,R2
-        params = {"hostname": ",".join(hostnames)}
-        resp = requests.get(
-            f"{self.base_url}/devices",
-            headers=self._headers(),
-            params=params,
-            timeout=10,
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        wanted = set(hostnames)
+        chunks = [
+            hostnames[i:i + self.chunk_size]
+            for i in range(0, len(hostnames), self.chunk_size)
+        ]
+
+        if len(chunks) <= 1:
+            pages = [self._fetch_chunk(c) for c in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                pages = list(pool.map(self._fetch_chunk, chunks))
 
         devices: list[NdbDevice] = []
-        for d in data["devices"]:
-            hostname = d["hostname"]
-            if hostname not in hostnames:
-                continue
-            devices.append(
-                NdbDevice(
-                    hostname=hostname,
-                    mgmt_ip=d["mgmt_ip"],
-                    vendor=d["vendor"],
-                    os=d["os"],          # iosxe / nxos / eos / ...
-                    model=d.get("model"),
-                    site=d.get("site"),
-                    role=d.get("role"),
-                )
-            )
+        seen: set[str] = set()
+        for records, _ in pages:
+            for d in records:
+                hostname = d["hostname"]
+                if hostname not in wanted or hostname in seen:
+                    continue
+                seen.add(hostname)
+                devices.append(self._to_device(d))
         return devices
@@ -0,0 +1,140 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Any
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+
+from .devices import offline_device
+from .flatten import explode_depth, plan_key_columns, record_key_columns, set_explode_depth
+from .metrics import NULL_METRICS, RunMetrics
+from .parser_pipeline import normalize_command, parse_cascade
+from .routing import ENGINE_ORDER
+
+
+def parse_job(
+    pyats_os: str,
+    tokens: tuple[tuple[str, str], ...],
+    ntc_platform: str,
+    command: str,
+    raw_output: str,
+    engines: List[str],
+    templates_dir: str | None,
+    with_metrics: bool,
+):
+    """
+    在解析进程中执行。只接收解析所需的数据（平台、命令、原始文本），
+    Genie 解析用按 tokens（os、platform、model 等）构造的离线设备。
+    返回 (parse_engine, rows, failed, metrics_state, key_columns)；
+    key_columns 是 Genie 展平计划的键列名，主进程的增量导出要用。
+    """
+    metrics = RunMetrics() if with_metrics else NULL_METRICS
+    parse_engine, rows, failed = parse_cascade(
+        offline_device(pyats_os, tokens),
+        ntc_platform,
+        command,
+        raw_output,
+        engines=engines,
+        templates_dir=templates_dir,
+        metrics=metrics,
+    )
+    state = metrics.export_state() if with_metrics else None
+    keys = plan_key_columns(pyats_os, command) if parse_engine == "genie" else []
+    return parse_engine, rows, failed, state, keys
+
+
+@dataclass
+class ParseJob:
+    future: Future
+    pyats_os: str
+    ntc_platform: str
+    command: str
+    cmd_norm: str
+
+
+class ParseStage:
+    """
+    CPU 密集的解析阶段：采集线程执行命令后 submit 原始输出，
+    解析在 ProcessPoolExecutor 中进行，可用满多核。
+
+    在途任务数受 max_pending 限制，超过时 submit 阻塞采集线程（背压），
+    避免大输出在内存中堆积。路由表和统计留在主进程中更新。
+
+    设备对象不能传给解析进程，Genie 解析改用 parser_tokens() 相同的离线设备，
+    因此结果与在线解析一致；自定义 parse() 的设备（如 benchmarks 的模拟设备）
+    在进程池中不会调用其 parse()。
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        templates_dir: str | None = None,
+        max_pending: int | None = None,
+        metrics=NULL_METRICS,
+        router=None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.templates_dir = templates_dir
+        self.metrics = metrics
+        self.router = router
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        # 采集线程已在运行，用 spawn 避免 fork 继承线程持有的锁
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            # spawn 的子进程不继承模块状态，展开层数随 initializer 传入
+            initializer=set_explode_depth,
+            initargs=(explode_depth(),),
+        )
+
+    def submit(
+        self,
+        pyats_os: str,
+        ntc_platform: str,
+        command: str,
+        raw_output: str,
+        tokens: tuple[tuple[str, str], ...] = (),
+    ) -> ParseJob:
+        cmd_norm = normalize_command(command)
+        if self.router is not None:
+            engines = self.router.order(ntc_platform, cmd_norm)
+        else:
+            engines = list(ENGINE_ORDER)
+
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(
+                parse_job,
+                pyats_os,
+                tokens,
+                ntc_platform,
+                command,
+                raw_output,
+                engines,
+                self.templates_dir,
+                self.metrics.enabled,
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return ParseJob(fut, pyats_os, ntc_platform, command, cmd_norm)
+
+    def result(self, job: ParseJob) -> tuple[str, List[Dict[str, Any]]]:
+        parse_engine, rows, failed, state, keys = job.future.result()
+        record_key_columns(job.pyats_os, job.command, keys)
+        if self.router is not None:
+            self.router.record(job.ntc_platform, job.cmd_norm, parse_engine, failed)
+        if state is not None:
+            self.metrics.merge(*state)
+        return parse_engine, rows
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "ParseStage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
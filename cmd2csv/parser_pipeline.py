@@ -1,13 +1,22 @@
 from __future__ import annotations
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator
 from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import re
-from pathlib import Path
+import time
 
-from genie.metaparser.util.exceptions import SchemaEmptyParserError
-from ntc_templates.parse import parse_output
-import textfsm
+# 各解析引擎在 engine_*.py 中，首次使用时才由 engines.PARSE_ENGINES 导入
+from .engines import PARSE_ENGINES
+from .flatten import FlattenPlan
+from .fixed_width import parse_fixed_width
+from .metrics import NULL_METRICS
+from .routing import ENGINE_ORDER, FALLBACK_ENGINE
+from .health import management_address, precheck
+from .scheduling import SESSION_KEY, device_field
+from .rows import RowBlock, RowStore
+from .devices import parser_tokens
 
 
 def normalize_command(command: str) -> str:
@@ -17,77 +26,39 @@ def normalize_command(command: str) -> str:
     return s.strip("_")
 
 
-def flatten_one_level(d: dict) -> dict:
-    out: dict[str, Any] = {}
-    for k, v in d.items():
-        if isinstance(v, dict):
-            for kk, vv in v.items():
-                out[f"{k}_{kk}"] = vv
-        else:
-            out[k] = v
-    return out
-
-
-def genie_to_rows(parsed: Any) -> List[Dict[str, Any]] | None:
+def genie_to_rows(parsed: Any, plan: FlattenPlan | None = None) -> List[Dict[str, Any]] | None:
+    """
+    Genie 结构化输出 -> 行。按展平计划递归展开动态键（接口、VRF、地址等），
+    固定键的嵌套 dict 以 "父键_" 为前缀展平为列。
+    """
     if isinstance(parsed, list) and parsed and isinstance(parsed[0], dict):
         return parsed
 
-    if isinstance(parsed, dict):
-        # 尝试识别「key -> dict」结构
-        if all(isinstance(v, dict) for v in parsed.values()):
-            rows: list[dict] = []
-            for k, v in parsed.items():
-                row = {"_key": k}
-                row.update(flatten_one_level(v))
-                rows.append(row)
-            return rows
+    if isinstance(parsed, dict) and parsed:
+        return (plan or FlattenPlan()).rows(parsed) or None
     return None
 
 
-def try_genie_parse(device, command: str) -> List[Dict[str, Any]] | None:
-    try:
-        parsed = device.parse(command)
-    except (SchemaEmptyParserError, Exception):
-        return None
-    return genie_to_rows(parsed)
-
-
-def try_ntc_parse(ntc_platform: str, command: str, raw_output: str) -> List[Dict[str, Any]] | None:
-    try:
-        rows = parse_output(
-            platform=ntc_platform,
-            command=command,
-            data=raw_output,
-        )
-        return rows or None
-    except Exception:
-        return None
-
-
 def template_filename(ntc_platform: str, command: str) -> str:
     cmd_norm = normalize_command(command)
     return f"{ntc_platform}__{cmd_norm}.textfsm"
 
 
-def try_textfsm_auto(templates_dir: str, ntc_platform: str, command: str, raw_output: str) -> List[Dict[str, Any]] | None:
-    path = Path(templates_dir) / template_filename(ntc_platform, command)
-    if not path.exists():
-        return None
-
-    with path.open() as f:
-        fsm = textfsm.TextFSM(f)
-
-    rows = fsm.ParseText(raw_output)
-    headers = [h.lower() for h in fsm.header]
-
-    result: list[dict] = []
-    for r in rows:
-        result.append(dict(zip(headers, r)))
-    return result or None
-
+def fallback_whitespace(
+    raw_output: str,
+    ntc_platform: str | None = None,
+    command: str | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    有表头的定宽表按列位置切分（列名取自表头，列位置按 (平台, 命令) 缓存）；
+    否则按空白切分为 col1..colN。
+    """
+    cache_key = (ntc_platform, normalize_command(command)) if ntc_platform and command else None
+    rows = parse_fixed_width(raw_output, cache_key)
+    if rows is not None:
+        return rows
 
-def fallback_whitespace(raw_output: str) -> List[Dict[str, Any]]:
-    rows: list[dict] = []
+    rows = []
     for line in raw_output.splitlines():
         line = line.rstrip()
         if not line:
@@ -98,51 +69,383 @@ def fallback_whitespace(raw_output: str) -> List[Dict[str, Any]]:
     return rows
 
 
+def _run_engine(
+    engine: str,
+    device,
+    ntc_platform: str,
+    command: str,
+    raw_output: str,
+    templates_dir: str | None,
+) -> List[Dict[str, Any]] | None:
+    return PARSE_ENGINES.get(engine)(device, ntc_platform, command, raw_output, templates_dir)
+
+
+def parse_cascade(
+    device,
+    ntc_platform: str,
+    command: str,
+    raw_output: str,
+    engines=ENGINE_ORDER,
+    templates_dir: str | None = None,
+    metrics=NULL_METRICS,
+) -> tuple[str, List[Dict[str, Any]], List[str]]:
+    """
+    按 engines 顺序尝试解析，全部失败时退回空白切分。
+    返回: (parse_engine, rows, 失败的引擎列表)
+    """
+    failed: list[str] = []
+    for engine in engines:
+        if engine == "textfsm" and not templates_dir:
+            continue
+        with metrics.timer("parse", engine=engine, command=command):
+            rows = _run_engine(engine, device, ntc_platform, command, raw_output, templates_dir)
+        if rows:
+            return engine, rows, failed
+        metrics.inc("parse_engine_misses", engine=engine, command=command)
+        failed.append(engine)
+
+    with metrics.timer("parse", engine=FALLBACK_ENGINE, command=command):
+        return FALLBACK_ENGINE, fallback_whitespace(raw_output, ntc_platform, command), failed
+
+
+def parse_raw_output(
+    device,
+    ntc_platform: str,
+    command: str,
+    raw_output: str,
+    templates_dir: str | None = None,
+    metrics=NULL_METRICS,
+    router=None,
+) -> tuple[str, List[Dict[str, Any]]]:
+    """
+    对同一份原始输出依次尝试 Genie -> NTC -> 自定义 TextFSM -> 空白切分。
+    指定 router（EngineRouter）时按学习到的顺序尝试，并跳过屡次失败的引擎。
+    返回: (parse_engine, rows)
+    """
+    cmd_norm = normalize_command(command)
+    engines = ENGINE_ORDER if router is None else router.order(ntc_platform, cmd_norm)
+
+    parse_engine, rows, failed = parse_cascade(
+        device, ntc_platform, command, raw_output,
+        engines=engines, templates_dir=templates_dir, metrics=metrics,
+    )
+    if router is not None:
+        router.record(ntc_platform, cmd_norm, parse_engine, failed)
+    return parse_engine, rows
+
+
+def stamp_rows(
+    dev_meta: Dict[str, Any],
+    command: str,
+    parse_engine: str,
+    rows: List[Dict[str, Any]],
+) -> RowBlock:
+    """
+    加上设备元数据与 command、parse_engine。元数据在块中只存一份，
+    各行按列名 schema 存为 tuple，写 CSV 时才并入（见 rows.py）。
+    """
+    return RowBlock.from_dicts({**dev_meta, "command": command, "parse_engine": parse_engine}, rows)
+
+
+def execute_command(
+    device,
+    dev_meta: Dict[str, Any],
+    ntc_platform: str,
+    command: str,
+    command_timeout: float | None = None,
+    capture=None,
+    metrics=NULL_METRICS,
+) -> str:
+    # 每条命令只在设备上执行一次，所有解析引擎共用这份输出
+    with metrics.timer("execute", hostname=dev_meta.get("hostname", ""), command=command):
+        if command_timeout is not None:
+            raw_output = device.execute(command, timeout=command_timeout)
+        else:
+            raw_output = device.execute(command)
+
+    _record_output(dev_meta, ntc_platform, command, raw_output, capture, metrics, device)
+    return raw_output
+
+
+def execute_batch(
+    device,
+    dev_meta: Dict[str, Any],
+    ntc_platform: str,
+    commands: List[str],
+    command_timeout: float | None = None,
+    capture=None,
+    metrics=NULL_METRICS,
+    batch_size: int = 0,
+) -> List[str]:
+    """
+    一次 execute 调用发送设备的全部命令（Unicon 的列表形式，会话内逐条执行、
+    只做一轮对话处理），返回按 commands 顺序拆分好的各命令输出。
+    重复的命令只执行一次。batch_size > 0 时每次 execute 至多发送这么多条命令。
+    """
+    unique = list(dict.fromkeys(commands))
+    combined: dict[str, str] = {}
+    for chunk in batch_chunks(unique, batch_size):
+        with metrics.timer("execute_batch", hostname=dev_meta.get("hostname", "")):
+            if command_timeout is not None:
+                output = device.execute(chunk, timeout=command_timeout)
+            else:
+                output = device.execute(chunk)
+        combined.update(batch_outputs(chunk, output))
+
+    for command in unique:
+        _record_output(dev_meta, ntc_platform, command, combined.get(command, ""), capture, metrics, device)
+    return [combined.get(command, "") for command in commands]
+
+
+def batch_chunks(commands: List[str], batch_size: int = 0) -> List[List[str]]:
+    """按 batch_size 切分命令列表；0 表示不切分。"""
+    size = batch_size if batch_size > 0 else max(1, len(commands))
+    return [commands[i:i + size] for i in range(0, len(commands), size)]
+
+
+def batch_outputs(commands: List[str], combined: Any) -> Dict[str, str]:
+    """把列表形式 execute 的返回值整理成 command -> output。"""
+    if isinstance(combined, dict):
+        return combined
+    # Unicon 对只有一条命令的列表直接返回字符串
+    if len(commands) != 1:
+        raise TypeError(f"batch execute returned {type(combined).__name__}, expected dict")
+    return {commands[0]: combined}
+
+
+def _record_output(dev_meta, ntc_platform: str, command: str, raw_output: str, capture, metrics, device) -> None:
+    if capture is not None:
+        capture.save(
+            dev_meta, ntc_platform, command, normalize_command(command), raw_output, parser_tokens(device)
+        )
+
+    if metrics.enabled:
+        metrics.inc("raw_bytes", len(raw_output.encode("utf-8", "replace")), command=command)
+
+
+def count_parsed(metrics, parse_engine: str, command: str, rows: List[Dict[str, Any]]) -> None:
+    if metrics.enabled:
+        metrics.inc("parse_engine_hits", engine=parse_engine, command=command)
+        metrics.inc("rows", len(rows), command=command)
+
+
 def process_one(
     device,
     dev_meta: Dict[str, Any],
     ntc_platform: str,
     command: str,
     templates_dir: str | None = None,
-) -> tuple[str, List[Dict[str, Any]]]:
+    command_timeout: float | None = None,
+    capture=None,
+    metrics=NULL_METRICS,
+    router=None,
+) -> tuple[str, RowBlock]:
     entity_name = normalize_command(command)
 
-    # 先试 Genie
-    rows = try_genie_parse(device, command)
-    parse_engine = None
+    raw_output = execute_command(
+        device, dev_meta, ntc_platform, command,
+        command_timeout=command_timeout, capture=capture, metrics=metrics,
+    )
 
-    if rows:
-        parse_engine = "genie"
-    else:
-        raw_output = device.execute(command)
-
-        ntc_rows = try_ntc_parse(ntc_platform, command, raw_output)
-        if ntc_rows:
-            rows = ntc_rows
-            parse_engine = "ntc"
-        elif templates_dir:
-            tfsm_rows = try_textfsm_auto(templates_dir, ntc_platform, command, raw_output)
-            if tfsm_rows:
-                rows = tfsm_rows
-                parse_engine = "textfsm"
-            else:
-                rows = fallback_whitespace(raw_output)
-                parse_engine = "raw_space"
+    parse_engine, rows = parse_raw_output(
+        device, ntc_platform, command, raw_output,
+        templates_dir=templates_dir, metrics=metrics, router=router,
+    )
+    count_parsed(metrics, parse_engine, command, rows)
+
+    return entity_name, stamp_rows(dev_meta, command, parse_engine, rows)
+
+
+def run_setup_commands(dev, setup_commands: List[str], metrics=NULL_METRICS) -> None:
+    if not setup_commands:
+        return
+    with metrics.timer("session_setup", hostname=dev.name):
+        for cmd in setup_commands:
+            dev.execute(cmd)
+
+
+@contextmanager
+def device_session(
+    dev,
+    connect_timeout: float | None = None,
+    metrics=NULL_METRICS,
+    sessions=None,
+    setup_commands: List[str] = (),
+) -> Iterator[Any]:
+    """
+    设备会话：默认连接、用完断开；指定 sessions（SessionPool）时复用常驻会话。
+    setup_commands（如 terminal length 0）在每个会话建立后执行一次。
+    """
+    if sessions is not None:
+        with sessions.lease(dev, connect_timeout=connect_timeout, metrics=metrics, setup_commands=setup_commands):
+            yield dev
+        return
+
+    connect_kwargs: dict[str, Any] = {"log_stdout": False}
+    if connect_timeout is not None:
+        connect_kwargs["connection_timeout"] = connect_timeout
+    try:
+        with metrics.timer("connect", hostname=dev.name):
+            dev.connect(**connect_kwargs)
+    except Exception as exc:
+        metrics.failure("connect", exc, hostname=dev.name)
+        raise
+    try:
+        run_setup_commands(dev, setup_commands, metrics)
+        yield dev
+    finally:
+        with metrics.timer("disconnect", hostname=dev.name):
+            dev.disconnect()
+
+
+def collect_device(
+    dev,
+    commands: List[str],
+    ts: str,
+    templates_dir: str | None = None,
+    connect_timeout: float | None = None,
+    command_timeout: float | None = None,
+    capture=None,
+    metrics=NULL_METRICS,
+    router=None,
+    parse_stage=None,
+    sessions=None,
+    batch: bool = False,
+    setup_commands: List[str] = (),
+    breaker=None,
+    failures=None,
+    history=None,
+    batch_size: int = 0,
+) -> Dict[str, RowStore]:
+    """
+    连接单台设备并执行全部命令，返回该设备的 normalized_command -> RowStore。
+    每台设备只由一个线程处理，因此这里不需要加锁。
+
+    指定 parse_stage（ParseStage）时，本线程只负责执行命令，原始输出交给
+    解析进程池；断开会话后再收集解析结果。
+    batch=True 时全部命令通过一次 execute_batch 调用执行（batch_size > 0 时
+    每次至多 batch_size 条），再逐条解析。
+
+    指定 breaker（CircuitBreaker）时，单条命令失败只记录并继续，熔断器打开后
+    剩余命令不再发送；否则命令失败即中断该设备。连接等失败仍向上抛出，
+    并记入 failures（FailureLog）。
+    history（DurationHistory）记录每条命令和会话开销的耗时，供下次调度。
+    """
+    t0 = time.perf_counter()
+    result: dict[str, RowStore] = defaultdict(RowStore)
+    pending: list[tuple[str, Any]] = []
+    ntc_platform = dev.custom.get("ntc_platform", dev.os)
+    tokens = parser_tokens(dev) if parse_stage is not None else ()
+    dev_meta = {
+        "timestamp": ts,
+        "hostname": dev.name,
+        "site": dev.custom.get("site", ""),
+        "role": dev.custom.get("role", ""),
+        "os": dev.os,
+    }
+
+    def handle(cmd: str, raw_output: str) -> None:
+        if parse_stage is None:
+            parse_engine, rows = parse_raw_output(
+                dev, ntc_platform, cmd, raw_output,
+                templates_dir=templates_dir, metrics=metrics, router=router,
+            )
+            count_parsed(metrics, parse_engine, cmd, rows)
+            result[normalize_command(cmd)].add(stamp_rows(dev_meta, cmd, parse_engine, rows))
         else:
-            rows = fallback_whitespace(raw_output)
-            parse_engine = "raw_space"
+            pending.append((cmd, parse_stage.submit(dev.os, ntc_platform, cmd, raw_output, tokens)))
 
-    out_rows: list[dict] = []
-    for r in rows:
-        row = {
-            **dev_meta,
-            "command": command,
-            "parse_engine": parse_engine,
-            **r,
-        }
-        out_rows.append(row)
+    stage, current = "connect", ""
+    # normalized_command -> 耗时（执行 + 本线程内的解析）
+    durations: dict[str, float] = {}
+    try:
+        with device_session(dev, connect_timeout, metrics, sessions, setup_commands):
+            stage = "command"
+            if batch:
+                t_batch = time.perf_counter()
+                try:
+                    raw_outputs = execute_batch(
+                        dev, dev_meta, ntc_platform, commands,
+                        command_timeout=command_timeout, capture=capture, metrics=metrics,
+                        batch_size=batch_size,
+                    )
+                except Exception as exc:
+                    current = "; ".join(commands)
+                    metrics.failure("command", exc, hostname=dev.name, command=current)
+                    raise
+                # 批量执行无法区分各命令，平均分摊
+                share = (time.perf_counter() - t_batch) / max(1, len(commands))
+            else:
+                raw_outputs = None
+
+            for i, cmd in enumerate(commands):
+                if breaker is not None and breaker.tripped(dev.name):
+                    # 熔断：剩余命令不再发送
+                    skipped = "; ".join(commands[i:])
+                    metrics.failure("circuit_open", "circuit open", hostname=dev.name, command=skipped)
+                    if failures is not None:
+                        failures.add(dev.name, "circuit_open", "circuit open", command=skipped)
+                    break
+                current = cmd
+                t_cmd = time.perf_counter()
+                try:
+                    if raw_outputs is not None:
+                        raw_output = raw_outputs[i]
+                    else:
+                        raw_output = execute_command(
+                            dev, dev_meta, ntc_platform, cmd,
+                            command_timeout=command_timeout, capture=capture, metrics=metrics,
+                        )
+                    handle(cmd, raw_output)
+                except Exception as exc:
+                    metrics.failure("command", exc, hostname=dev.name, command=cmd)
+                    if breaker is None:
+                        raise
+                    # 错误没有传到 lease，单独标记会话不再复用
+                    if sessions is not None:
+                        sessions.discard(dev)
+                    breaker.failure(dev.name)
+                    if failures is not None:
+                        failures.add(dev.name, "command", exc, command=cmd)
+                else:
+                    if breaker is not None:
+                        breaker.success(dev.name)
+                    if history is not None:
+                        cmd_norm = normalize_command(cmd)
+                        seconds = time.perf_counter() - t_cmd
+                        if raw_outputs is not None:
+                            seconds += share
+                        durations[cmd_norm] = durations.get(cmd_norm, 0.0) + seconds
+    except Exception as exc:
+        if failures is not None:
+            failures.add(dev.name, stage, exc, command=current)
+        if breaker is not None:
+            breaker.failure(dev.name)
+        raise
+    finally:
+        metrics.observe("device", time.perf_counter() - t0, hostname=dev.name)
+
+    if history is not None:
+        for cmd_norm, seconds in durations.items():
+            history.record(dev.name, cmd_norm, seconds)
+        history.record(dev.name, SESSION_KEY, max(0.0, time.perf_counter() - t0 - sum(durations.values())))
+
+    # 会话已释放，再等待解析进程的结果；解析失败与在线解析一样按命令失败处理
+    for cmd, job in pending:
+        try:
+            parse_engine, rows = parse_stage.result(job)
+        except Exception as exc:
+            metrics.failure("command", exc, hostname=dev.name, command=cmd)
+            if failures is not None:
+                failures.add(dev.name, "command", exc, command=cmd)
+            if breaker is None:
+                raise
+            breaker.failure(dev.name)
+            continue
+        count_parsed(metrics, parse_engine, cmd, rows)
+        result[normalize_command(cmd)].add(stamp_rows(dev_meta, cmd, parse_engine, rows))
 
-    return entity_name, out_rows
+    return result
 
 
 def collect_from_testbed(
@@ -150,41 +453,162 @@ def collect_from_testbed(
     hostnames: List[str],
     commands: List[str],
     templates_dir: str | None = None,
-) -> Dict[str, List[Dict[str, Any]]]:
+    workers: int = 1,
+    connect_timeout: float | None = None,
+    command_timeout: float | None = None,
+    sink=None,
+    capture=None,
+    metrics=NULL_METRICS,
+    router=None,
+    parse_stage=None,
+    sessions=None,
+    batch: bool = False,
+    setup_commands: List[str] = (),
+    precheck_timeout: float | None = None,
+    breaker=None,
+    failures=None,
+    scheduler=None,
+    batch_size: int = 0,
+) -> Dict[str, RowStore]:
     """
-    返回: normalized_command -> List[rows]
+    返回: normalized_command -> RowStore（每台设备每条命令一个 RowBlock）
+
+    workers > 1 时使用线程池并发采集（SSH 以 I/O 等待为主）。
+    不经 sink 时各设备结果按 testbed 中的设备顺序合并（指定 scheduler 时也是），
+    输出与串行模式一致。
+
+    指定 sink（如 StreamingCsvExporter）时，每台设备采集完成后立即调用
+    sink.add_rows(entity_name, rows)，不在内存中累积，返回空 dict。
+    指定 capture（CaptureStore）时保存每条命令的原始输出。
+    metrics（RunMetrics）用于记录各阶段耗时与计数。
+    router（EngineRouter）用于按历史结果选择解析引擎。
+    parse_stage（ParseStage）把 CPU 密集的解析放到进程池，与 SSH I/O 解耦。
+    sessions（SessionPool）复用常驻会话，不再每次连接/断开。
+    batch=True 时每台设备的全部命令一次发送（batch_size > 0 时按此分批）；
+    setup_commands 每个会话执行一次。
+
+    precheck_timeout 指定时先并发探测各设备管理地址的 TCP/22，不可达的设备
+    不再建立 Unicon 连接。breaker（CircuitBreaker）跳过已熔断的设备。
+    指定 failures（FailureLog）时单台设备失败只记录，不中断整次运行。
+
+    scheduler（Scheduler）按历史耗时决定派发顺序（最长的先开始）并限制每个
+    site / role 的并发，结束后在 scheduler.report() 中给出预计与实际 makespan；
+    其 history 同时记录本次各设备各命令的耗时。
     """
-    entities: dict[str, list[dict]] = defaultdict(list)
+    entities: dict[str, RowStore] = defaultdict(RowStore)
     ts = datetime.utcnow().isoformat()
 
-    # 只使用指定 hostnames
-    devices = [
-        dev for name, dev in testbed.devices.items()
-        if (not hostnames) or (name in hostnames)
-    ]
-
-    for dev in devices:
-        dev.connect(log_stdout=False)
-
-        ntc_platform = dev.custom.get("ntc_platform", dev.os)
-        dev_meta = {
-            "timestamp": ts,
-            "hostname": dev.name,
-            "site": dev.custom.get("site", ""),
-            "role": dev.custom.get("role", ""),
-            "os": dev.os,
-        }
-
-        for cmd in commands:
-            entity_name, rows = process_one(
+    # 先按 hostnames 选出设备名，Device 在采集线程中才取出（LazyTestbed 此时才创建）
+    wanted = set(hostnames)
+    names = [name for name in testbed.devices if not wanted or name in wanted]
+
+    def skip(name: str, stage: str, error, address: str = "") -> None:
+        metrics.failure(stage, error, hostname=name)
+        if failures is not None:
+            failures.add(name, stage, error, address=address)
+
+    if breaker is not None:
+        allowed = []
+        for name in names:
+            if breaker.allow(name):
+                allowed.append(name)
+            else:
+                skip(name, "circuit_open", "circuit open")
+        names = allowed
+
+    if precheck_timeout is not None and names:
+        addresses = {}
+        for name in names:
+            addr = management_address(testbed, name)
+            if addr is not None:
+                addresses[name] = addr
+        dead = precheck(addresses, timeout=precheck_timeout, metrics=metrics)
+        for name, exc in dead.items():
+            skip(name, "precheck", exc, address="%s:%d" % addresses[name])
+            if breaker is not None:
+                breaker.failure(name)
+        names = [name for name in names if name not in dead]
+
+    def run(name: str) -> Dict[str, RowStore]:
+        try:
+            dev = testbed.devices[name]
+        except Exception as exc:
+            if breaker is not None:
+                breaker.failure(name)
+            if failures is None:
+                raise
+            skip(name, "load", exc)
+            return {}
+        try:
+            return collect_device(
                 dev,
-                dev_meta,
-                ntc_platform,
-                cmd,
+                commands,
+                ts,
                 templates_dir=templates_dir,
+                connect_timeout=connect_timeout,
+                command_timeout=command_timeout,
+                capture=capture,
+                metrics=metrics,
+                router=router,
+                parse_stage=parse_stage,
+                sessions=sessions,
+                batch=batch,
+                batch_size=batch_size,
+                setup_commands=setup_commands,
+                breaker=breaker,
+                failures=failures,
+                history=scheduler.history if scheduler is not None else None,
             )
-            entities[entity_name].extend(rows)
-
-        dev.disconnect()
-
+        except Exception:
+            # 已在 collect_device 中记入 failures
+            if failures is None:
+                raise
+            return {}
+
+    def emit(result: Dict[str, RowStore]) -> None:
+        for entity_name, rows in result.items():
+            if sink is not None:
+                sink.add_rows(entity_name, rows)
+            else:
+                entities[entity_name].extend(rows)
+
+    t0 = time.perf_counter()
+    if scheduler is not None:
+        groups = None
+        if scheduler.group_by:
+            groups = {name: device_field(testbed, name, scheduler.group_by) for name in names}
+        order = scheduler.plan(names, [normalize_command(c) for c in commands], workers, groups)
+    else:
+        order = names
+
+    def merge(results: Iterator[tuple[str, Dict[str, RowStore]]]) -> None:
+        # sink 按 hostname 重排，可按完成顺序送出；否则按 testbed 顺序合并，
+        # 与不调度时结果一致
+        if sink is not None:
+            for _, result in results:
+                emit(result)
+            return
+        done = dict(results)
+        for name in names:
+            if name in done:
+                emit(done.pop(name))
+
+    if workers <= 1 or len(names) <= 1:
+        merge((name, run(name)) for name in order)
+    elif scheduler is not None:
+        with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+            merge((name, fut.result()) for name, fut in scheduler.dispatch(pool, order, run))
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+            futures = [pool.submit(run, name) for name in names]
+            # sink 会按 hostname 重排，可按完成顺序送出；
+            # 否则按提交顺序合并，保证结果确定
+            for fut in (as_completed(futures) if sink is not None else futures):
+                emit(fut.result())
+
+    if scheduler is not None:
+        scheduler.actual = time.perf_counter() - t0
+        metrics.observe("makespan", scheduler.actual)
+        if scheduler.predicted is not None:
+            metrics.observe("makespan_predicted", scheduler.predicted)
     return entities
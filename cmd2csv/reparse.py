@@ -0,0 +1,116 @@
+from __future__ import annotations
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List
+
+from .capture_store import list_runs, list_hosts, iter_host_captures
+from .devices import offline_device
+from .exporter import StreamingCsvExporter
+from .parser_pipeline import normalize_command, parse_raw_output, stamp_rows
+from .rows import RowStore
+from .flatten import explode_depth, set_explode_depth
+
+
+def reparse_host(host_dir: str, templates_dir: str | None = None) -> Dict[str, RowStore]:
+    """
+    在子进程中重新解析一台设备的全部存档输出，返回 normalized_command -> rows。
+    """
+    result: dict[str, RowStore] = {}
+    for cap in iter_host_captures(Path(host_dir)):
+        device = offline_device(cap.dev_meta.get("os", ""), cap.tokens)
+        parse_engine, rows = parse_raw_output(
+            device, cap.ntc_platform, cap.command, cap.read(), templates_dir=templates_dir
+        )
+        result.setdefault(normalize_command(cap.command), RowStore()).add(
+            stamp_rows(cap.dev_meta, cap.command, parse_engine, rows)
+        )
+    return result
+
+
+def reparse_run(
+    capture_dir: str,
+    run_id: str,
+    output_dir: str,
+    templates_dir: str | None = None,
+    jobs: int | None = None,
+) -> None:
+    host_dirs = [str(p) for p in list_hosts(capture_dir, run_id)]
+    with StreamingCsvExporter(output_dir) as exporter:
+        with ProcessPoolExecutor(
+            max_workers=jobs or os.cpu_count(),
+            initializer=set_explode_depth,
+            initargs=(explode_depth(),),
+        ) as pool:
+            futures = [pool.submit(reparse_host, d, templates_dir) for d in host_dirs]
+            for fut in as_completed(futures):
+                for entity_name, rows in fut.result().items():
+                    exporter.add_rows(entity_name, rows)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="cmd2csv reparse",
+        description="Re-parse stored raw outputs and export CSV without connecting to devices.",
+    )
+    p.add_argument(
+        "--capture-dir",
+        required=True,
+        help="Capture store directory written by --capture-dir",
+    )
+    p.add_argument(
+        "--run-id",
+        default=None,
+        help="Run to re-parse (default: latest run)",
+    )
+    p.add_argument(
+        "--templates-dir",
+        default=None,
+        help="Optional TextFSM templates directory (for auto lookup)",
+    )
+    p.add_argument(
+        "--genie-explode",
+        type=int,
+        default=None,
+        help="Levels of dynamic keys (interfaces, VRFs, addresses, ...) in Genie output "
+             "exploded into rows; deeper levels become columns (default: all, 0: one row)",
+    )
+    p.add_argument(
+        "--output-dir",
+        default="output",
+        help="Output directory for CSV files",
+    )
+    p.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of parser processes (default: CPU count)",
+    )
+    return p
+
+
+def main(argv: List[str] | None = None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.genie_explode is not None:
+        set_explode_depth(args.genie_explode)
+
+    run_id = args.run_id
+    if run_id is None:
+        runs = list_runs(args.capture_dir)
+        if not runs:
+            parser.error(f"no captured runs under {args.capture_dir}")
+        run_id = runs[-1]
+
+    reparse_run(
+        args.capture_dir,
+        run_id,
+        args.output_dir,
+        templates_dir=args.templates_dir,
+        jobs=args.jobs,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from typing import Dict, Any, List
+from pathlib import Path
+import argparse
+import json
+import os
+import threading
+
+# raw_space 是兜底，不参与排序
+ENGINE_ORDER = ("genie", "ntc", "textfsm")
+FALLBACK_ENGINE = "raw_space"
+
+
+class EngineRouter:
+    """
+    按 (ntc_platform, normalized_command) 记录哪个解析引擎成功过。
+
+    - winner: 最近一次成功的引擎，下次直接先试它
+    - fails: 各引擎连续失败次数，达到 fail_threshold 即视为否定项，不再尝试
+    - 每 reprobe_every 次解析按默认顺序完整重试一次，以便发现模板/解析器的变化
+
+    表以 JSON 持久化，供后续运行复用。
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        path: str | None = None,
+        reprobe_every: int = 100,
+        fail_threshold: int = 3,
+    ):
+        self.path = Path(path) if path else None
+        self.reprobe_every = reprobe_every
+        self.fail_threshold = fail_threshold
+        self._lock = threading.Lock()
+        self.table: dict[str, dict[str, Any]] = {}
+        if self.path is not None:
+            self.load()
+
+    @staticmethod
+    def key(ntc_platform: str, cmd_norm: str) -> str:
+        return f"{ntc_platform}|{cmd_norm}"
+
+    def load(self) -> None:
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.table = {}
+            return
+        self.table = data.get("routes", {}) if data.get("version") == self.VERSION else {}
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with self._lock:
+            payload = json.dumps({"version": self.VERSION, "routes": self.table}, indent=2, sort_keys=True)
+        tmp_path.write_text(payload, encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def order(self, ntc_platform: str, cmd_norm: str) -> List[str]:
+        """返回本次应尝试的引擎顺序（不含 raw_space）。"""
+        k = self.key(ntc_platform, cmd_norm)
+        with self._lock:
+            entry = self.table.get(k)
+            if entry is None:
+                return list(ENGINE_ORDER)
+
+            entry["uses"] = entry.get("uses", 0) + 1
+            if self.reprobe_every and entry["uses"] % self.reprobe_every == 0:
+                return list(ENGINE_ORDER)
+
+            winner = entry.get("winner")
+            fails = entry.get("fails", {})
+            engines = [
+                e for e in ENGINE_ORDER
+                if e != winner and fails.get(e, 0) < self.fail_threshold
+            ]
+            if winner in ENGINE_ORDER:
+                engines.insert(0, winner)
+            return engines
+
+    def record(self, ntc_platform: str, cmd_norm: str, engine: str, failed: List[str]) -> None:
+        k = self.key(ntc_platform, cmd_norm)
+        with self._lock:
+            entry = self.table.setdefault(k, {"winner": None, "wins": {}, "fails": {}, "uses": 0})
+            entry["winner"] = engine
+            entry["wins"][engine] = entry["wins"].get(engine, 0) + 1
+            entry["fails"].pop(engine, None)
+            for e in failed:
+                entry["fails"][e] = entry["fails"].get(e, 0) + 1
+
+    def reset(self, ntc_platform: str | None = None, cmd_norm: str | None = None) -> int:
+        """删除匹配的条目，返回删除数量；不带参数时清空整张表。"""
+        with self._lock:
+            keys = [
+                k for k in self.table
+                if (ntc_platform is None or k.split("|", 1)[0] == ntc_platform)
+                and (cmd_norm is None or k.split("|", 1)[1] == cmd_norm)
+            ]
+            for k in keys:
+                del self.table[k]
+            return len(keys)
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return json.loads(json.dumps(self.table))
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="cmd2csv routes",
+        description="Inspect or reset the learned parse-engine routing table.",
+    )
+    p.add_argument(
+        "--routing-table",
+        required=True,
+        help="Routing table JSON file (as passed to cmd2csv --routing-table)",
+    )
+    p.add_argument(
+        "--platform",
+        default=None,
+        help="Only entries for this ntc_platform, e.g. cisco_ios",
+    )
+    p.add_argument(
+        "--command",
+        default=None,
+        help="Only entries for this command",
+    )
+    p.add_argument(
+        "--reset",
+        action="store_true",
+        help="Delete the selected entries instead of listing them",
+    )
+    return p
+
+
+def main(argv: List[str] | None = None):
+    from .parser_pipeline import normalize_command
+
+    args = build_arg_parser().parse_args(argv)
+    router = EngineRouter(args.routing_table)
+    cmd_norm = normalize_command(args.command) if args.command else None
+
+    if args.reset:
+        removed = router.reset(args.platform, cmd_norm)
+        router.save()
+        print(f"removed {removed} route(s)")
+        return
+
+    for k, entry in sorted(router.entries().items()):
+        platform, cmd = k.split("|", 1)
+        if args.platform and platform != args.platform:
+            continue
+        if cmd_norm and cmd != cmd_norm:
+            continue
+        fails = ",".join(f"{e}={n}" for e, n in sorted(entry.get("fails", {}).items())) or "-"
+        wins = ",".join(f"{e}={n}" for e, n in sorted(entry.get("wins", {}).items())) or "-"
+        print(f"{platform:<14} {cmd:<40} winner={entry.get('winner')} wins[{wins}] fails[{fails}]")
+
+
+if __name__ == "__main__":
+    main()
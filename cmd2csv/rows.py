@@ -0,0 +1,228 @@
+from __future__ import annotations
+from collections.abc import Sequence
+from operator import itemgetter
+from typing import Dict, Any, Iterable, Iterator, List
+import bisect
+import threading
+
+
+class _Missing:
+    """行中没有该列（与值为 None 不同：dict 视图中不出现该键）。"""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class Schema:
+    """一组列名（按首次出现的顺序）。相同的列名元组只保留一个实例。"""
+
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns: tuple[str, ...]):
+        self.columns = columns
+        self.index = {c: i for i, c in enumerate(columns)}
+
+    def __reduce__(self):
+        # 反序列化（溢写文件、进程池）时重新驻留
+        return intern_schema, (self.columns,)
+
+    def __repr__(self) -> str:
+        return f"Schema{self.columns!r}"
+
+
+_schemas: dict[tuple[str, ...], Schema] = {}
+_schemas_lock = threading.Lock()
+
+
+def intern_schema(columns: Iterable[str]) -> Schema:
+    columns = tuple(columns)
+    schema = _schemas.get(columns)
+    if schema is None:
+        with _schemas_lock:
+            schema = _schemas.setdefault(columns, Schema(columns))
+    return schema
+
+
+class RowBlock(Sequence):
+    """
+    一台设备一条命令的行：元数据（timestamp、hostname、site、role、os、command、
+    parse_engine）只存一份，各行是按 schema 排列的 tuple，缺少的列为 MISSING。
+
+    按序列访问时每行是 {**meta, **行} 的 dict（与原来 stamp_rows 的结果相同），
+    只在需要时临时生成；导出时用 project() 直接按表头取值，不生成 dict。
+    """
+
+    __slots__ = ("meta", "schema", "values", "dense")
+
+    def __init__(self, meta: Dict[str, Any], schema: Schema, values: List[tuple], dense: bool = True):
+        self.meta = meta
+        self.schema = schema
+        self.values = values
+        self.dense = dense
+
+    @classmethod
+    def from_dicts(cls, meta: Dict[str, Any], rows: List[Dict[str, Any]]) -> "RowBlock":
+        if not rows:
+            return cls(meta, intern_schema(()), [])
+        columns = tuple(rows[0])
+        n = len(columns)
+        # 常见情况：模板 / 定宽表输出的每行列名和顺序都相同
+        if all(len(r) == n and tuple(r) == columns for r in rows):
+            return cls(meta, intern_schema(columns), [tuple(r.values()) for r in rows])
+        columns = tuple(dict.fromkeys(k for r in rows for k in r))
+        n = len(columns)
+        values = [tuple([r.get(c, MISSING) for c in columns]) for r in rows]
+        return cls(meta, intern_schema(columns), values, dense=all(len(r) == n for r in rows))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _row(self, t: tuple) -> Dict[str, Any]:
+        row = dict(self.meta)
+        if self.dense:
+            row.update(zip(self.schema.columns, t))
+        else:
+            row.update((c, v) for c, v in zip(self.schema.columns, t) if v is not MISSING)
+        return row
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return RowBlock(self.meta, self.schema, self.values[i], self.dense)
+        return self._row(self.values[i])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return map(self._row, self.values)
+
+    def __repr__(self) -> str:
+        return f"RowBlock({self.meta.get('hostname', '')!r}, {self.meta.get('command', '')!r}, rows={len(self)})"
+
+    @property
+    def hostname(self) -> str:
+        return self.meta.get("hostname", "")
+
+    def keys(self) -> set[str]:
+        """出现过的所有列名。"""
+        return set(self.meta).union(self.schema.columns)
+
+    def uniform(self, field: str) -> bool:
+        """该字段的值是否对所有行相同（只来自元数据，不是解析出的列）。"""
+        return field not in self.schema.index
+
+    def take(self, indices: List[int]) -> "RowBlock":
+        values = self.values
+        return RowBlock(self.meta, self.schema, [values[i] for i in indices], self.dense)
+
+    def with_meta(self, **fields) -> "RowBlock":
+        """追加元数据列（共享行数据）；与解析出的列重名时返回 None。"""
+        if any(f in self.schema.index for f in fields):
+            return None
+        return RowBlock({**self.meta, **fields}, self.schema, self.values, self.dense)
+
+    def project(self, fieldnames: List[str], restval: Any = "") -> Iterator[tuple]:
+        """按 fieldnames 顺序产出每行的值（csv.writer 用），元数据此时才并入。"""
+        meta = self.meta
+        index = self.schema.index
+        n = len(self.schema.columns)
+        consts: list[Any] = []
+        indices: list[int] = []
+        for f in fieldnames:
+            i = index.get(f)
+            if i is None:
+                indices.append(n + len(consts))
+                consts.append(meta.get(f, restval))
+            else:
+                indices.append(i)
+        if not indices:
+            return (() for _ in self.values)
+        getter = itemgetter(*indices) if len(indices) > 1 else (lambda t, _i=indices[0]: (t[_i],))
+        consts_t = tuple(consts)
+        if self.dense:
+            return (getter(t + consts_t) for t in self.values)
+        # 缺列时取元数据中的同名值（与 {**meta, **行} 一致），否则为 restval
+        fill = [meta.get(f, restval) for f in fieldnames]
+        return (self._fill(getter(t + consts_t), fill) for t in self.values)
+
+    @staticmethod
+    def _fill(row: tuple, fill: List[Any]) -> tuple:
+        if MISSING not in row:
+            return row
+        return tuple([fill[j] if v is MISSING else v for j, v in enumerate(row)])
+
+
+class RowStore(Sequence):
+    """一个命令的全部行，按设备块保存；按序列访问时逐行生成 dict。"""
+
+    __slots__ = ("blocks", "_ends")
+
+    def __init__(self, blocks: Iterable[RowBlock] = ()):
+        self.blocks: list[RowBlock] = []
+        self._ends: list[int] = []
+        for block in blocks:
+            self.add(block)
+
+    def add(self, block: RowBlock) -> None:
+        if not len(block):
+            return
+        self.blocks.append(block)
+        self._ends.append((self._ends[-1] if self._ends else 0) + len(block))
+
+    def extend(self, rows) -> None:
+        for block in row_blocks(rows):
+            self.add(block if isinstance(block, RowBlock) else RowBlock.from_dicts({}, block))
+
+    def __len__(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("row index out of range")
+        b = bisect.bisect_right(self._ends, i)
+        start = self._ends[b - 1] if b else 0
+        return self.blocks[b][i - start]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for block in self.blocks:
+            yield from block
+
+    def __repr__(self) -> str:
+        return f"RowStore(blocks={len(self.blocks)}, rows={len(self)})"
+
+
+def row_blocks(rows) -> List[Any]:
+    """RowStore -> 其各块；RowBlock 或 dict 列表 -> [rows]。"""
+    if isinstance(rows, RowStore):
+        return rows.blocks
+    return [rows]
+
+
+def row_keys(rows) -> set[str]:
+    """所有行出现过的列名。"""
+    keys: set[str] = set()
+    for block in row_blocks(rows):
+        if isinstance(block, RowBlock):
+            keys |= block.keys()
+        else:
+            for r in block:
+                keys.update(r.keys())
+    return keys
+
+
+def write_rows(writer, rows, fieldnames: List[str]) -> None:
+    """用 csv.DictWriter 写出行；RowBlock / RowStore 直接按表头取值，不生成 dict。"""
+    for block in row_blocks(rows):
+        if isinstance(block, RowBlock):
+            writer.writer.writerows(block.project(fieldnames, writer.restval))
+        else:
+            writer.writerows(block)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterator, List
+import heapq
+import json
+import os
+import threading
+
+# 连接、登录、setup_commands、断开等与命令无关的耗时
+SESSION_KEY = "_session"
+# 没有任何历史时的单条命令估计（秒）；所有设备相同时保持原顺序
+DEFAULT_SECONDS = 5.0
+
+
+class DurationHistory:
+    """
+    按 (hostname, normalized_command) 记录历次运行的耗时（指数加权平均），
+    以 JSON 持久化，供调度器估计每台设备的采集时长。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str | None = None, alpha: float = 0.3):
+        self.path = Path(path) if path else None
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.table: dict[str, dict[str, Any]] = {}
+        if self.path is not None:
+            self.load()
+
+    @staticmethod
+    def key(hostname: str, cmd_norm: str) -> str:
+        return f"{hostname}|{cmd_norm}"
+
+    def load(self) -> None:
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.table = {}
+            return
+        self.table = data.get("durations", {}) if data.get("version") == self.VERSION else {}
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with self._lock:
+            payload = json.dumps({"version": self.VERSION, "durations": self.table}, indent=2, sort_keys=True)
+        tmp_path.write_text(payload, encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def record(self, hostname: str, cmd_norm: str, seconds: float) -> None:
+        k = self.key(hostname, cmd_norm)
+        with self._lock:
+            entry = self.table.get(k)
+            if entry is None:
+                self.table[k] = {"seconds": seconds, "runs": 1}
+            else:
+                entry["seconds"] += self.alpha * (seconds - entry["seconds"])
+                entry["runs"] += 1
+
+    def get(self, hostname: str, cmd_norm: str) -> float | None:
+        entry = self.table.get(self.key(hostname, cmd_norm))
+        return None if entry is None else entry["seconds"]
+
+    def command_means(self) -> Dict[str, float]:
+        """cmd_norm -> 所有设备的平均耗时，用于估计没有历史的设备。"""
+        sums: dict[str, list[float]] = {}
+        with self._lock:
+            items = [(k, e["seconds"]) for k, e in self.table.items()]
+        for k, seconds in items:
+            s = sums.setdefault(k.split("|", 1)[1], [0.0, 0])
+            s[0] += seconds
+            s[1] += 1
+        return {cmd: total / n for cmd, (total, n) in sums.items()}
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+def device_field(testbed, name: str, field: str) -> str:
+    """设备 custom 中的 site / role 等字段。LazyTestbed 直接读设备定义，不创建 Device。"""
+    definition = getattr(testbed, "definition", None)
+    if definition is not None:
+        custom = definition[name].get("custom", {})
+    else:
+        custom = testbed.devices[name].custom
+    return str(custom.get(field) or "")
+
+
+class Scheduler:
+    """
+    采集顺序与并发控制：
+
+    - 按历史耗时估计每台设备的总时长，最长的先开始（LPT），避免慢设备最后才开始
+    - group_by="site" / "role" 时每组同时进行的设备数不超过 group_limits[组名]
+      （或 default_group_limit）；组已满时先派发后面其他组的设备
+    - plan 时按同样的派发规则模拟出预计 makespan，运行后与实际值一起报告
+    """
+
+    def __init__(
+        self,
+        history: DurationHistory | None = None,
+        group_by: str | None = None,
+        group_limits: Dict[str, int] | None = None,
+        default_group_limit: int | None = None,
+    ):
+        self.history = history
+        self.group_by = group_by
+        self.group_limits = group_limits or {}
+        self.default_group_limit = default_group_limit
+        self.estimates: dict[str, float] = {}
+        self.groups: dict[str, str] = {}
+        self.workers = 1
+        self.predicted: float | None = None
+        self.actual: float | None = None
+
+    def estimate(self, hostname: str, cmd_norms: List[str], means: Dict[str, float]) -> float:
+        """命令耗时之和加会话开销；没有该设备记录的命令用所有设备的平均值。"""
+        history = self.history
+        total = 0.0
+        for cmd in [SESSION_KEY, *cmd_norms]:
+            seconds = history.get(hostname, cmd) if history is not None else None
+            if seconds is None:
+                seconds = means.get(cmd, 0.0 if cmd == SESSION_KEY else DEFAULT_SECONDS)
+            total += seconds
+        return total
+
+    def plan(
+        self,
+        names: List[str],
+        cmd_norms: List[str],
+        workers: int,
+        groups: Dict[str, str] | None = None,
+    ) -> List[str]:
+        """
+        返回派发顺序（预计耗时降序，相同时保持原顺序），并计算预计 makespan。
+        groups 为 hostname -> group_by 字段的值。
+        """
+        means = self.history.command_means() if self.history is not None else {}
+        self.estimates = {name: self.estimate(name, cmd_norms, means) for name in names}
+        self.groups = dict(groups or {})
+        self.workers = max(1, workers)
+        order = sorted(names, key=self.estimates.__getitem__, reverse=True)
+        # 没有任何历史时估计值只是默认值，不给出预计 makespan
+        self.predicted = self.simulate(order) if self.history else None
+        return order
+
+    def _limit(self, group: str) -> int | None:
+        return self.group_limits.get(group, self.default_group_limit) if self.group_by else None
+
+    def _next(self, pending: List[str], running: Counter) -> int | None:
+        """pending 中第一个所在组未满的设备的位置。"""
+        for i, name in enumerate(pending):
+            group = self.groups.get(name, "")
+            limit = self._limit(group)
+            if not limit or running[group] < limit:
+                return i
+        return None
+
+    def simulate(self, order: List[str]) -> float:
+        """按 dispatch 的规则模拟，返回预计 makespan（秒）。"""
+        pending = list(order)
+        running: Counter = Counter()
+        events: list[tuple[float, int, str]] = []
+        now, seq = 0.0, 0
+        while pending or events:
+            while len(events) < self.workers and pending:
+                i = self._next(pending, running)
+                if i is None:
+                    break
+                name = pending.pop(i)
+                group = self.groups.get(name, "")
+                running[group] += 1
+                heapq.heappush(events, (now + self.estimates.get(name, DEFAULT_SECONDS), seq, group))
+                seq += 1
+            now, _, group = heapq.heappop(events)
+            running[group] -= 1
+        return now
+
+    def dispatch(
+        self,
+        pool: Executor,
+        order: List[str],
+        run: Callable[[str], Any],
+    ) -> Iterator[tuple[str, Future]]:
+        """按 order 派发到线程池（遵守组上限），按完成顺序产出 (hostname, future)。"""
+        pending = list(order)
+        running: Counter = Counter()
+        futures: dict[Future, tuple[str, str]] = {}
+        while pending or futures:
+            while len(futures) < self.workers and pending:
+                i = self._next(pending, running)
+                if i is None:
+                    break
+                name = pending.pop(i)
+                group = self.groups.get(name, "")
+                running[group] += 1
+                futures[pool.submit(run, name)] = (name, group)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, group = futures.pop(fut)
+                running[group] -= 1
+                yield name, fut
+
+    def report(self) -> Dict[str, Any]:
+        out: dict[str, Any] = {
+            "devices": len(self.estimates),
+            "workers": self.workers,
+            "predicted_makespan": self.predicted,
+            "actual_makespan": self.actual,
+        }
+        if self.predicted and self.actual is not None:
+            out["error_pct"] = round((self.actual - self.predicted) / self.predicted * 100, 1)
+        return out
@@ -0,0 +1,224 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List
+import threading
+import time
+
+from .metrics import NULL_METRICS
+from .parser_pipeline import run_setup_commands
+
+
+class _Session:
+    def __init__(self, dev):
+        self.dev = dev
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+        self.last_checked = 0.0
+        self.connected = False
+        self.connects = 0
+        self.leases = 0
+        # 借出期间被标记为不可信，归还时断开
+        self.discard = False
+
+
+class SessionPool:
+    """
+    常驻设备会话池（daemon 模式使用）。
+
+    - lease(dev): 独占借出一台设备的已登录会话，未连接时才建立连接
+    - 距上次检查超过 health_interval 秒的会话，借出前先做健康检查，失败则重连
+    - 命令执行出错时丢弃该会话（会话状态不可信），下次重新连接；
+      调用方捕获了错误时用 discard(dev) 标记
+    - 空闲超过 idle_timeout 秒的会话由后台线程断开
+    - setup_commands 只在会话建立时执行一次，复用会话时不再重复
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 300.0,
+        health_interval: float = 60.0,
+        health_command: str | None = None,
+    ):
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.health_command = health_command
+        self._lock = threading.Lock()
+        self._sessions: dict[str, _Session] = {}
+        self._stop = threading.Event()
+        self._reaper: threading.Thread | None = None
+
+    def _entry(self, dev) -> _Session:
+        with self._lock:
+            entry = self._sessions.get(dev.name)
+            if entry is None or entry.dev is not dev:
+                entry = self._sessions[dev.name] = _Session(dev)
+            return entry
+
+    def _healthy(self, dev) -> bool:
+        try:
+            if not dev.is_connected():
+                return False
+            if self.health_command is not None:
+                dev.execute(self.health_command)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _disconnect(dev) -> None:
+        try:
+            dev.disconnect()
+        except Exception:
+            pass
+
+    def _connect(
+        self,
+        entry: _Session,
+        connect_timeout: float | None,
+        metrics,
+        setup_commands: List[str] = (),
+    ) -> None:
+        dev = entry.dev
+        connect_kwargs: dict[str, Any] = {"log_stdout": False}
+        if connect_timeout is not None:
+            connect_kwargs["connection_timeout"] = connect_timeout
+        try:
+            with metrics.timer("connect", hostname=dev.name):
+                dev.connect(**connect_kwargs)
+        except Exception as exc:
+            metrics.failure("connect", exc, hostname=dev.name)
+            self._disconnect(dev)
+            raise
+        try:
+            run_setup_commands(dev, setup_commands, metrics)
+        except Exception:
+            self._disconnect(dev)
+            raise
+        entry.connected = True
+        entry.connects += 1
+        entry.last_checked = time.monotonic()
+
+    @contextmanager
+    def lease(
+        self,
+        dev,
+        connect_timeout: float | None = None,
+        metrics=NULL_METRICS,
+        setup_commands: List[str] = (),
+    ) -> Iterator[Any]:
+        entry = self._entry(dev)
+        with entry.lock:
+            now = time.monotonic()
+            if not entry.connected:
+                self._connect(entry, connect_timeout, metrics, setup_commands)
+            else:
+                healthy = dev.is_connected()
+                if healthy and now - entry.last_checked >= self.health_interval:
+                    with metrics.timer("health_check", hostname=dev.name):
+                        healthy = self._healthy(dev)
+                    entry.last_checked = now
+                if healthy:
+                    metrics.inc("session_reuses", hostname=dev.name)
+                else:
+                    metrics.inc("session_reconnects", hostname=dev.name)
+                    self._disconnect(dev)
+                    self._connect(entry, connect_timeout, metrics, setup_commands)
+
+            entry.leases += 1
+            entry.discard = False
+            try:
+                yield dev
+            except BaseException:
+                self._disconnect(dev)
+                entry.connected = False
+                raise
+            else:
+                if entry.discard:
+                    self._disconnect(dev)
+                    entry.connected = False
+            finally:
+                entry.last_used = time.monotonic()
+
+    def discard(self, dev) -> None:
+        """
+        标记当前借出的会话不再复用（例如命令出错但调用方选择继续），
+        lease 结束时断开，下次重新连接。
+        """
+        with self._lock:
+            entry = self._sessions.get(dev.name)
+        if entry is not None and entry.dev is dev:
+            entry.discard = True
+
+    def evict_idle(self, now: float | None = None) -> int:
+        """断开空闲超时的会话，返回断开数量；正在使用的会话跳过。"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entries = list(self._sessions.values())
+        evicted = 0
+        for entry in entries:
+            if not entry.connected or now - entry.last_used < self.idle_timeout:
+                continue
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                self._disconnect(entry.dev)
+                entry.connected = False
+                evicted += 1
+            finally:
+                entry.lock.release()
+        return evicted
+
+    def drop(self, hostname: str) -> None:
+        with self._lock:
+            entry = self._sessions.pop(hostname, None)
+        if entry is not None:
+            with entry.lock:
+                self._disconnect(entry.dev)
+
+    def start(self, interval: float | None = None) -> None:
+        """启动后台空闲回收线程。"""
+        if self._reaper is not None:
+            return
+        interval = interval or max(1.0, min(self.idle_timeout / 2, 30.0))
+
+        def reap() -> None:
+            while not self._stop.wait(interval):
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=reap, name="cmd2csv-session-reaper", daemon=True)
+        self._reaper.start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._sessions.values())
+        now = time.monotonic()
+        return {
+            "sessions": len(entries),
+            "connected": sum(1 for e in entries if e.connected),
+            "hosts": {
+                e.dev.name: {
+                    "connected": e.connected,
+                    "in_use": e.lock.locked(),
+                    "idle_seconds": round(now - e.last_used, 1) if e.last_used else None,
+                    "connects": e.connects,
+                    "leases": e.leases,
+                }
+                for e in entries
+            },
+        }
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+        with self._lock:
+            hostnames = list(self._sessions)
+        for name in hostnames:
+            self.drop(name)
+
+    def __enter__(self) -> "SessionPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,303 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Iterable
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import os
+
+from .devices import OS_MAP
+from .exporter import StreamingCsvExporter
+from .flatten import plan_key_columns
+from .metrics import NULL_METRICS
+from .parser_pipeline import normalize_command
+from .rows import RowBlock, RowStore, row_blocks
+from .template_registry import get_registry, ntc_template
+
+# 不参与行哈希的列（每次运行都会变化）
+VOLATILE_FIELDS = frozenset({"timestamp"})
+
+KEY_SEP = "\x1f"
+DUP_SEP = "\x1d"
+
+# pyats_os -> ntc_platform（行里只有 os 列）
+_NTC_PLATFORM = {info["pyats_os"]: info["ntc_platform"] for info in OS_MAP.values()}
+
+
+def row_hash(row: Dict[str, Any]) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for k in sorted(row):
+        if k in VOLATILE_FIELDS:
+            continue
+        h.update(f"{k}\x1e{row[k]}\x1d".encode("utf-8", "replace"))
+    return h.hexdigest()
+
+
+def _pick(rows, indices: List[int]):
+    if isinstance(rows, RowBlock):
+        return rows.take(indices)
+    return [rows[i] for i in indices]
+
+
+class SnapshotIndex:
+    """
+    一个命令上次运行的快照索引：<snapshot_dir>/<entity>.json.gz
+
+        hosts: hostname -> {"cols": 键列, "rows": {行键: 行哈希}}
+
+    行键由键列的值拼成；没有键列时行键就是行哈希本身
+    （此时行的变化表现为一删一增）。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.hosts: dict[str, dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.hosts = {}
+            return
+        self.hosts = data.get("hosts", {}) if data.get("version") == self.VERSION else {}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "hosts": self.hosts}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+class DeltaExporter:
+    """
+    增量导出：与上次运行的快照比较，只写出变化的行。接口与 StreamingCsvExporter 相同。
+
+    行键优先用 hostname + 展平计划的键列（Genie，如 vrf、interface），其次用模板的
+    Key 列（NTC / 自定义 TextFSM），
+    也可用 key_columns={entity: [列]} 指定。
+
+    - mode="changelog": 每个命令一个 <cmd>.changes.csv，change 列为 added/changed/removed
+    - mode="split": <cmd>.added.csv / <cmd>.changed.csv / <cmd>.removed.csv
+
+    removed 只针对本次运行采集到的设备（未采集的设备保留上次快照），
+    removed 行只包含 hostname、command 和键列。close() 成功后才更新快照。
+    指定 failures（FailureLog）时，失败的 (设备, 命令) 既不输出 removed，
+    也不替换快照，下次运行仍与上次成功的结果比较。
+    """
+
+    MODES = ("changelog", "split")
+
+    def __init__(
+        self,
+        output_dir: str,
+        snapshot_dir: str,
+        mode: str = "changelog",
+        key_columns: Dict[str, List[str]] | None = None,
+        templates_dir: str | None = None,
+        metrics=NULL_METRICS,
+        failures=None,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown delta mode: {mode}")
+        self.mode = mode
+        self.snapshot_dir = Path(snapshot_dir)
+        self.key_columns = key_columns or {}
+        self.templates_dir = templates_dir
+        self.metrics = metrics
+        self.failures = failures
+        self._out = StreamingCsvExporter(output_dir, metrics=metrics)
+        self._previous: dict[str, SnapshotIndex] = {}
+        self._current: dict[str, dict[str, dict[str, Any]]] = {}
+        self._commands: dict[str, str] = {}
+        self._seen_hosts: set[str] = set()
+        self._key_cache: dict[tuple[str, str, str, str], List[str]] = {}
+
+    def _snapshot(self, entity_name: str) -> SnapshotIndex:
+        snap = self._previous.get(entity_name)
+        if snap is None:
+            snap = SnapshotIndex(self.snapshot_dir / f"{entity_name}.json.gz")
+            self._previous[entity_name] = snap
+        return snap
+
+    def _columns_for(self, entity_name: str, row: Dict[str, Any]) -> List[str]:
+        if entity_name in self.key_columns:
+            return list(self.key_columns[entity_name])
+
+        engine = row.get("parse_engine", "")
+        command = row.get("command", "")
+        os_name = row.get("os", "")
+        if engine == "genie":
+            # Genie 行的键列来自展平计划（以字段命名，如 vrf、interface）
+            cols = [c for c in plan_key_columns(os_name, command) if c in row]
+            if cols:
+                return cols
+        if "_key" in row:
+            return ["_key"]
+        ck = (entity_name, engine, command, os_name)
+        cols = self._key_cache.get(ck)
+        if cols is None:
+            tmpl = None
+            platform = _NTC_PLATFORM.get(os_name, os_name)
+            if engine == "ntc":
+                tmpl = ntc_template(platform, command)
+            elif engine == "textfsm" and self.templates_dir:
+                tmpl = get_registry(self.templates_dir).get(platform, normalize_command(command))
+            cols = [k.lower() for k in tmpl.keys] if tmpl is not None else []
+            self._key_cache[ck] = cols
+        return cols
+
+    def _emit(self, entity_name: str, change: str, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        self.metrics.inc("delta_rows", len(rows), change=change, command=entity_name)
+        if self.mode == "split":
+            self._out.add_rows(f"{entity_name}.{change}", rows)
+        else:
+            tagged = RowStore()
+            for block in row_blocks(rows):
+                # change 作为块元数据共享；与解析出的列重名时退回逐行 dict
+                b = block.with_meta(change=change) if isinstance(block, RowBlock) else None
+                tagged.extend(b if b is not None else [{**r, "change": change} for r in block])
+            self._out.add_rows(f"{entity_name}.changes", tagged)
+
+    def add_rows(self, entity_name: str, rows: List[dict]) -> None:
+        if not rows:
+            return
+        prev = self._snapshot(entity_name)
+        current = self._current.setdefault(entity_name, {})
+
+        added = RowStore()
+        changed = RowStore()
+        unchanged = 0
+        for block in row_blocks(rows):
+            added_idx: list[int] = []
+            changed_idx: list[int] = []
+            for i, r in enumerate(block):
+                hostname = r.get("hostname", "")
+                host = current.get(hostname)
+                if host is None:
+                    self._seen_hosts.add(hostname)
+                    self._commands.setdefault(entity_name, r.get("command", ""))
+                    host = current[hostname] = {"cols": self._columns_for(entity_name, r), "rows": {}}
+                cols = host["cols"]
+                h = row_hash(r)
+                if cols:
+                    key = KEY_SEP.join(str(r.get(c, "")) for c in cols)
+                else:
+                    key = h
+                # 键列不唯一时按出现次序区分
+                base, n = key, 1
+                while key in host["rows"]:
+                    n += 1
+                    key = f"{base}{DUP_SEP}{n}"
+                host["rows"][key] = h
+
+                old_host = prev.hosts.get(hostname)
+                old = old_host["rows"].get(key) if old_host and old_host["cols"] == cols else None
+                if old is None:
+                    added_idx.append(i)
+                elif old != h:
+                    changed_idx.append(i)
+                else:
+                    unchanged += 1
+            # 输出的行仍与输入共享元数据和行 tuple
+            added.extend(_pick(block, added_idx))
+            changed.extend(_pick(block, changed_idx))
+
+        self._emit(entity_name, "added", added)
+        self._emit(entity_name, "changed", changed)
+        if unchanged:
+            self.metrics.inc("delta_rows", unchanged, change="unchanged", command=entity_name)
+
+    def _failed(self) -> set[tuple[str, str]]:
+        """FailureLog 中失败的 (hostname, 命令)；不针对某条命令的失败记为 (hostname, "")。"""
+        failed: set[tuple[str, str]] = set()
+        if self.failures is None:
+            return failed
+        for row in list(self.failures.rows):
+            # 熔断、批量执行的失败把多条命令用 "; " 连在一起
+            commands = [c for c in row["command"].split("; ") if c.strip()] or [""]
+            for c in commands:
+                failed.add((row["hostname"], normalize_command(c) if c else ""))
+        return failed
+
+    def _hosts_for(self, entity_name: str, failed: set[tuple[str, str]]) -> List[str]:
+        """本次运行中该命令成功采集的设备：removed 与快照替换都只针对这些设备。"""
+        return sorted(
+            h for h in self._seen_hosts
+            if (h, entity_name) not in failed and (h, "") not in failed
+        )
+
+    def _removed_rows(self, entity_name: str, hosts: List[str]) -> List[Dict[str, Any]]:
+        prev = self._snapshot(entity_name)
+        current = self._current.get(entity_name, {})
+        command = self._commands.get(entity_name, "")
+        removed: list[dict] = []
+        for hostname in hosts:
+            old_host = prev.hosts.get(hostname)
+            if not old_host:
+                continue
+            new_host = current.get(hostname)
+            same_cols = new_host is not None and new_host["cols"] == old_host["cols"]
+            new_keys = new_host["rows"] if same_cols else {}
+            for key in old_host["rows"]:
+                if key in new_keys:
+                    continue
+                row: dict[str, Any] = {"hostname": hostname, "command": command}
+                if old_host["cols"]:
+                    values = key.split(DUP_SEP, 1)[0]
+                    row.update(zip(old_host["cols"], values.split(KEY_SEP)))
+                else:
+                    row["_row_hash"] = key
+                removed.append(row)
+        return removed
+
+    def close(self) -> List[Path]:
+        failed = self._failed()
+        hosts = {entity_name: self._hosts_for(entity_name, failed) for entity_name in self._current}
+        try:
+            for entity_name in self._current:
+                self._emit(entity_name, "removed", self._removed_rows(entity_name, hosts[entity_name]))
+        except BaseException:
+            self.discard()
+            raise
+        written = self._out.close()
+
+        # 输出写完后再更新快照：只替换本次采集到的设备
+        for entity_name, current in self._current.items():
+            snap = self._snapshot(entity_name)
+            for hostname in hosts[entity_name]:
+                if hostname in current:
+                    snap.hosts[hostname] = current[hostname]
+                else:
+                    snap.hosts.pop(hostname, None)
+            snap.save()
+        return written
+
+    def discard(self) -> None:
+        self._out.discard()
+
+    def __enter__(self) -> "DeltaExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def parse_key_columns(specs: Iterable[str]) -> Dict[str, List[str]]:
+    """解析 --delta-key 参数：'show ip int brief=intf+ipaddr' -> {entity: [列]}。"""
+    out: dict[str, list[str]] = {}
+    for spec in specs:
+        command, sep, cols = spec.partition("=")
+        if not sep or not cols.strip():
+            raise ValueError(f"invalid key spec (expected COMMAND=col[+col]): {spec}")
+        out[normalize_command(command)] = [c.strip() for c in cols.split("+") if c.strip()]
+    return out
@@ -0,0 +1,212 @@
+from __future__ import annotations
+from typing import Dict, List, Any, TYPE_CHECKING
+from functools import lru_cache
+from pathlib import Path
+import io
+import os
+import threading
+import time
+
+# textfsm / ntc_templates 在首次编译模板时才导入
+if TYPE_CHECKING:
+    import textfsm
+    from textfsm import clitable
+
+
+class CompiledTemplate:
+    """
+    一个 TextFSM 模板文件的编译结果。
+
+    模板文本只读一次；编译好的 TextFSM 实例放在空闲池中复用，
+    每次解析前 Reset() 即可，相当于廉价克隆。多线程下每个线程各取一个实例。
+    """
+
+    def __init__(self, path: Path, source: str, mtime: float):
+        self.path = path
+        self.source = source
+        self.mtime = mtime
+        self._free: list[textfsm.TextFSM] = [self._compile()]
+        self.header = list(self._free[0].header)
+        self.keys = list(self._free[0].GetValuesByAttrib("Key"))
+
+    def _compile(self) -> textfsm.TextFSM:
+        import textfsm
+
+        return textfsm.TextFSM(io.StringIO(self.source))
+
+    def parse(self, raw_output: str) -> List[Dict[str, Any]]:
+        try:
+            fsm = self._free.pop()
+        except IndexError:
+            fsm = self._compile()
+        try:
+            fsm.Reset()
+            records = fsm.ParseText(raw_output)
+        finally:
+            self._free.append(fsm)
+
+        headers = [h.lower() for h in self.header]
+        return [dict(zip(headers, r)) for r in records]
+
+
+class TemplateCache:
+    """
+    path -> CompiledTemplate，按文件 mtime 失效。
+    为避免每次查找都 stat，同一路径至多每 recheck_interval 秒检查一次。
+    """
+
+    def __init__(self, recheck_interval: float = 5.0):
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._entries: dict[Path, tuple[CompiledTemplate, float]] = {}
+
+    def get(self, path: Path) -> CompiledTemplate | None:
+        now = time.monotonic()
+        entry = self._entries.get(path)
+        if entry is not None:
+            tmpl, checked_at = entry
+            if now - checked_at < self.recheck_interval:
+                return tmpl
+
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+
+        if entry is not None and entry[0].mtime == mtime:
+            self._entries[path] = (entry[0], now)
+            return entry[0]
+
+        with self._lock:
+            # 其它线程可能已经重新编译过
+            entry = self._entries.get(path)
+            if entry is not None and entry[0].mtime == mtime:
+                return entry[0]
+            tmpl = CompiledTemplate(path, path.read_text(), mtime)
+            self._entries[path] = (tmpl, now)
+            return tmpl
+
+
+class TemplateRegistry:
+    """
+    启动时索引 templates_dir 一次：
+        (ntc_platform, normalize_command(cmd)) -> <ntc_platform>__<cmd>.textfsm
+    模板在首次使用时编译并缓存；目录 mtime 变化时重新索引。
+    """
+
+    SUFFIX = ".textfsm"
+
+    def __init__(self, templates_dir: str, recheck_interval: float = 5.0):
+        self.templates_dir = Path(templates_dir)
+        self.recheck_interval = recheck_interval
+        self._cache = TemplateCache(recheck_interval)
+        self._index: dict[tuple[str, str], Path] = {}
+        self._dir_mtime: float | None = None
+        self._checked_at = 0.0
+        self.reindex()
+
+    def reindex(self) -> None:
+        index: dict[tuple[str, str], Path] = {}
+        try:
+            self._dir_mtime = self.templates_dir.stat().st_mtime
+            entries = list(os.scandir(self.templates_dir))
+        except OSError:
+            self._dir_mtime = None
+            entries = []
+
+        for entry in entries:
+            name = entry.name
+            if not name.endswith(self.SUFFIX) or "__" not in name:
+                continue
+            platform, cmd_norm = name[: -len(self.SUFFIX)].split("__", 1)
+            index[(platform, cmd_norm)] = Path(entry.path)
+
+        self._index = index
+        self._checked_at = time.monotonic()
+
+    def _maybe_reindex(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.recheck_interval:
+            return
+        try:
+            dir_mtime = self.templates_dir.stat().st_mtime
+        except OSError:
+            dir_mtime = None
+        if dir_mtime != self._dir_mtime:
+            self.reindex()
+        else:
+            self._checked_at = now
+
+    def get(self, ntc_platform: str, cmd_norm: str) -> CompiledTemplate | None:
+        """cmd_norm 为 normalize_command(command) 的结果。"""
+        self._maybe_reindex()
+        path = self._index.get((ntc_platform, cmd_norm))
+        if path is None:
+            return None
+        return self._cache.get(path)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+_registries: dict[str, TemplateRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(templates_dir: str) -> TemplateRegistry:
+    key = os.path.abspath(templates_dir)
+    reg = _registries.get(key)
+    if reg is None:
+        with _registries_lock:
+            reg = _registries.get(key)
+            if reg is None:
+                reg = TemplateRegistry(templates_dir)
+                _registries[key] = reg
+    return reg
+
+
+# ---- NTC templates ----
+
+_ntc_cache = TemplateCache()
+
+
+@lru_cache(maxsize=1)
+def _ntc_index(template_dir: str) -> clitable.CliTable:
+    from textfsm import clitable
+
+    return clitable.CliTable("index", template_dir)
+
+
+@lru_cache(maxsize=1)
+def _ntc_template_dir() -> str:
+    from ntc_templates.parse import _get_template_dir
+
+    return _get_template_dir()
+
+
+@lru_cache(maxsize=4096)
+def ntc_template_paths(ntc_platform: str, command: str) -> tuple[Path, ...] | None:
+    """
+    在 NTC index 中查找 (platform, command) 对应的模板文件。
+    index 逐行正则匹配代价较高，结果用 LRU 缓存。
+    """
+    template_dir = _ntc_template_dir()
+    cli_table = _ntc_index(template_dir)
+    row_idx = cli_table.index.GetRowMatch({"Command": command, "Platform": ntc_platform})
+    if not row_idx:
+        return None
+    templates = cli_table.index.index[row_idx]["Template"]
+    return tuple(Path(template_dir) / t for t in templates.split(":"))
+
+
+def ntc_template(ntc_platform: str, command: str) -> CompiledTemplate | None:
+    """
+    返回单模板命令的编译结果；多模板（需要按 Key 合并）的命令返回 None，
+    由调用方退回 ntc_templates.parse.parse_output。
+    """
+    paths = ntc_template_paths(ntc_platform, command)
+    if not paths or len(paths) != 1:
+        return None
+    return _ntc_cache.get(paths[0])
@@ -12,21 +12,28 @@ from netmiko.ssh_autodetect import SSHDetect
 from netmiko import Netmiko
 import json
 import argparse
-import pandas as pd
+import csv
+import shutil
 import smtplib
+import tempfile
+import zipfile
 import email.mime.multipart
 import email.mime.text
 from email.mime.application import MIMEApplication
 from distutils.sysconfig import get_python_lib
-from multiprocessing import Process
+from multiprocessing import Pool
+from functools import partial
 from datetime import datetime
 import os
 import time, threading
-from multiprocessing import Process
 
 MAX_DEPTH = 3
 MAX_RETRY = 20
 SLEEP_PERIOD = 5
+MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024
+# Room left in every email for the MIME headers and the short text part
+MIME_HEADER_ALLOWANCE = 4096
+DEVICE_TYPE_CACHE = os.path.join(os.path.expanduser('~'), '.command_to_csv_device_types.json')
 LIB_DIR = get_python_lib()
 os.environ["NET_TEXTFSM"] = str(LIB_DIR + "/ntc_templates/templates/")
 parser = argparse.ArgumentParser(description='Python Script to parse command output of networking devices and convert '
@@ -42,38 +49,153 @@ parser.add_argument('-C', '--command', help='Commands to be executed. Quote by "
 parser.add_argument('-R', '--recipient', help='Email address of recipient of csv output file. Optional. Multiple '
                                               'array should be '
                                               'split by ";" ')
+parser.add_argument('-W', '--workers', type=int, default=1, help='Number of hosts processed in parallel. '
+                                                                'Default 1 (one host after another)')
+parser.add_argument('--smtp-server', default='', help='SMTP relay used to send the results. '
+                                                         'Email is skipped when empty')
+parser.add_argument('--smtp-port', type=int, default=25, help='SMTP port. Default 25')
+parser.add_argument('--sender', default='', help='Sender address of the result email')
+parser.add_argument('--max-attachment-mb', type=float, default=MAX_ATTACHMENT_SIZE / 1024 / 1024,
+                    help='Largest attachment per email in MB. A bigger result archive is split into '
+                         'several emails. Default 10')
+parser.add_argument('--device-type-cache', default=DEVICE_TYPE_CACHE,
+                    help='JSON file remembering the detected device type of each host, so autodetect only runs '
+                         'for new hosts or after a failed login')
 args = parser.parse_args()
 
 
-def email_alert(smtp_server, sender, recipient, results):
-    """ Send email of result file in attachment"""
-    msg = email.mime.multipart.MIMEMultipart()
-    msg['Subject'] = 'Execution result of command output to csv script'
-    msg['From'] = sender
-    msg['To'] = recipient
-    mailobj = smtplib.SMTP(smtp_server)
-    for result in results:
-        try:
-            part = MIMEApplication(open(result, 'rb').read())
-        except TypeError:
-            return
-        part.add_header('Content-Disposition', 'attachment', filename=result)
-        msg.attach(part)
+def build_archive(results, archive_path):
+    """ Stream the result files into one deflate compressed zip archive"""
+    with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for result in results:
+            archive.write(result, arcname=os.path.basename(result))
+    return archive_path
+
+
+def split_file(path, part_size):
+    """ Yield the file content in chunks of at most part_size bytes"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(part_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def raw_part_size(max_attachment_size):
+    """ Largest raw chunk whose base64 encoding plus MIME headers fits in max_attachment_size.
+    base64 turns every 57 raw bytes into one 76 character line plus CRLF"""
+    return max(57, (max_attachment_size - MIME_HEADER_ALLOWANCE) // 78 * 57)
+
+
+def email_alert(smtp_server, sender, recipient, results, smtp_port=25, max_attachment_size=MAX_ATTACHMENT_SIZE):
+    """ Send the result files as one zip attachment. An email bigger than max_attachment_size once encoded is
+    split into numbered parts, one email each, to be joined with cat"""
+    if not results:
+        return
+    if not smtp_server or not recipient:
+        print('No SMTP server or recipient given. Email is skipped.')
+        return
+    recipients = [r.strip() for r in recipient.split(';') if r.strip()]
+    workdir = tempfile.mkdtemp(prefix='command_to_csv_')
+    archive_name = 'command_to_csv_%s.zip' % datetime.now().strftime('%Y%m%d_%H%M%S')
     try:
-        mailobj.sendmail(sender, recipient, msg.as_string())
-        print('Email is sent for the  result to %s' % recipient)
-        mailobj.quit()
+        archive_path = build_archive(results, os.path.join(workdir, archive_name))
+        size = os.path.getsize(archive_path)
+        part_size = raw_part_size(max_attachment_size)
+        parts = max(1, (size + part_size - 1) // part_size)
+        mailobj = smtplib.SMTP(smtp_server, smtp_port)
+        try:
+            for index, chunk in enumerate(split_file(archive_path, part_size), 1):
+                msg = email.mime.multipart.MIMEMultipart()
+                subject = 'Execution result of command output to csv script'
+                filename = archive_name
+                if parts > 1:
+                    subject += ' (%d/%d)' % (index, parts)
+                    filename = '%s.%03d' % (archive_name, index)
+                msg['Subject'] = subject
+                msg['From'] = sender
+                msg['To'] = recipient
+                if parts > 1:
+                    msg.attach(email.mime.text.MIMEText(
+                        'Part %d of %d. Save all parts, then join them with: cat %s.* > %s'
+                        % (index, parts, archive_name, archive_name)))
+                part = MIMEApplication(chunk)
+                part.add_header('Content-Disposition', 'attachment', filename=filename)
+                msg.attach(part)
+                mailobj.sendmail(sender, recipients, msg.as_bytes())
+            print('Email is sent for the  result to %s' % recipient)
+        finally:
+            mailobj.quit()
     except Exception as exc:
         print(str(exc))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def flatten_record(record, prefix=''):
+    """ Nested dicts become "parent.child" columns, same as pandas.json_normalize"""
+    flat = {}
+    for key, value in record.items():
+        key = prefix + str(key)
+        if isinstance(value, dict) and value:
+            flat.update(flatten_record(value, key + '.'))
+        else:
+            flat[key] = value
+    return flat
+
+
+def write_csv(records, filename):
+    """ Write the parsed records to csv. Columns are ordered by first appearance"""
+    rows = [flatten_record(record) for record in records]
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+class DeviceType_cache(object):
+    """ Persistent hostname -> netmiko device_type map. With path=None it only lives in memory"""
+    def __init__(self, path=None, types=None):
+        self.path = path
+        self.types = dict(types or {})
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.types = json.load(f)
+        except (IOError, ValueError):
+            self.types = {}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.types, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, hostname):
+        return self.types.get(hostname)
+
+    def put(self, hostname, device_type):
+        self.types[hostname] = device_type
+
+    def invalidate(self, hostname):
+        self.types.pop(hostname, None)
 
 
 class Connection_data(object):
-    def __init__(self, username, password, secret):
+    def __init__(self, username, password, secret, device_types=None):
         self.connections = {}
         self.username = username
         self.password = password
         self.secret = secret
         self.enabled = []
+        self.device_types = device_types if device_types is not None else DeviceType_cache()
 
     def get_connection(self, hostname):
         if hostname not in self.connections:
@@ -86,10 +208,23 @@ class Connection_data(object):
                 'secret': self.secret,
                 'banner_timeout': 30
             }
+            cached_type = self.device_types.get(hostname)
+            if cached_type:
+                host_info['device_type'] = cached_type
+                try:
+                    self.connections[hostname] = Netmiko(**host_info)
+                    return self.connections[hostname]
+                except Exception as exc:
+                    # Device may have been replaced or credentials changed. Forget it and detect again.
+                    print('Login to %s as %s failed (%s). Running autodetect.' % (hostname, cached_type, exc))
+                    self.device_types.invalidate(hostname)
+                    host_info['device_type'] = "autodetect"
             guesser = SSHDetect(**host_info)
             best_match = guesser.autodetect()
             host_info['device_type'] = best_match
             self.connections[hostname] = Netmiko(**host_info)
+            if best_match:
+                self.device_types.put(hostname, best_match)
         return self.connections[hostname]
 
     def delete_connection(self, hostname):
@@ -154,6 +289,18 @@ def init():
     parser.add_argument('-R', '--recipient', help='Email address of recipient of csv output file. Optional. Multiple '
                                                   'array should be '
                                                   'split by ";" ')
+    parser.add_argument('-W', '--workers', type=int, default=1, help='Number of hosts processed in parallel. '
+                                                                    'Default 1 (one host after another)')
+    parser.add_argument('--smtp-server', default='', help='SMTP relay used to send the results. '
+                                                             'Email is skipped when empty')
+    parser.add_argument('--smtp-port', type=int, default=25, help='SMTP port. Default 25')
+    parser.add_argument('--sender', default='', help='Sender address of the result email')
+    parser.add_argument('--max-attachment-mb', type=float, default=MAX_ATTACHMENT_SIZE / 1024 / 1024,
+                        help='Largest attachment per email in MB. A bigger result archive is split into '
+                             'several emails. Default 10')
+    parser.add_argument('--device-type-cache', default=DEVICE_TYPE_CACHE,
+                        help='JSON file remembering the detected device type of each host, so autodetect only '
+                             'runs for new hosts or after a failed login')
     args = parser.parse_args()
     user = args.username
     password = getpass.getpass("Please input SSH password： ")
@@ -161,12 +308,18 @@ def init():
         secret = getpass.getpass("Please input enable password： ")
     else:
         secret = None
-    conn_table = Connection_data(user, password, secret)
+    conn_table = Connection_data(user, password, secret, DeviceType_cache(args.device_type_cache))
 
 
-def abort():
+def init_worker(username, password, secret, device_types):
+    """ Pool initializer: every worker process gets its own connections and a copy of the device type cache"""
+    global conn_table
+    conn_table = Connection_data(username, password, secret, DeviceType_cache(types=device_types))
+
+
+def abort(code=1):
     conn_table.clear_connection()
-    exit(1)
+    exit(code)
 
 
 def run_commands(hostname, commands):
@@ -183,8 +336,51 @@ def run_commands(hostname, commands):
         for info in output:
             print(info)
         print("=" * end_prompt_count + hostname + " " + " " + command + " END " + "=" * end_prompt_count)
-        normalized_df = pd.json_normalize(output)
-        normalized_df.to_csv(hostname + "_" + command + '.csv', index=False)
+        write_csv(output, hostname + "_" + command + '.csv')
+
+
+def run_host(hostname, commands):
+    """ Run the commands on one host and close its connection. Returns the hostname, the device type to remember
+    for it (None to forget) and the error message if the host failed"""
+    error = None
+    try:
+        run_commands(hostname, commands)
+    except Exception as exc:
+        error = str(exc) or exc.__class__.__name__
+        print('%s failed: %s' % (hostname, error))
+    finally:
+        if hostname in conn_table.connections:
+            conn_table.delete_connection(hostname)
+    return hostname, conn_table.device_types.get(hostname), error
+
+
+def run_serial(hostnames, commands):
+    """ Process the hosts one after another. Returns {hostname: error} for the hosts that failed"""
+    failed = {}
+    for hostname in hostnames:
+        hostname, _, error = run_host(hostname, commands)
+        if error is not None:
+            failed[hostname] = error
+    return failed
+
+
+def run_parallel(hostnames, commands, workers):
+    """ Process the hosts in worker processes. Returns {hostname: error} for the hosts that failed"""
+    failed = {}
+    pool = Pool(processes=min(workers, len(hostnames)), initializer=init_worker,
+                initargs=(user, password, secret, conn_table.device_types.types))
+    try:
+        for hostname, device_type, error in pool.imap_unordered(partial(run_host, commands=commands), hostnames):
+            if device_type:
+                conn_table.device_types.put(hostname, device_type)
+            else:
+                conn_table.device_types.invalidate(hostname)
+            if error is not None:
+                failed[hostname] = error
+    finally:
+        pool.close()
+        pool.join()
+    return failed
 
 
 def name():
@@ -199,17 +395,25 @@ def name():
 def main():
     start_time = datetime.now()
     init()
-    for hostname in args.hostname:
-        run_commands(hostname, args.command)
+    try:
+        if args.workers > 1 and len(args.hostname) > 1:
+            failed = run_parallel(args.hostname, args.command, args.workers)
+        else:
+            failed = run_serial(args.hostname, args.command)
+    finally:
+        conn_table.device_types.save()
     file_name = name()
     #print(file_name)
-    email_alert(smtp_server='', sender='', recipient=args.recipient,
-                results=file_name)
+    email_alert(smtp_server=args.smtp_server, sender=args.sender, recipient=args.recipient,
+                results=file_name, smtp_port=args.smtp_port,
+                max_attachment_size=int(args.max_attachment_mb * 1024 * 1024))
     for filename in file_name:
         os.remove(filename)
     end_time = datetime.now()
     print("%s %s"%(start_time,end_time))
-    abort()
+    for hostname in sorted(failed):
+        print('FAILED %s: %s' % (hostname, failed[hostname]))
+    abort(1 if failed else 0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+import hashlib
+import importlib.util
+import json
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from cmd2csv.ndb_client import NdbClient
+
+LEGACY_SCRIPT = Path(__file__).resolve().parent.parent / "command_to_csv.py"
+PAGE_SIZE = 2
+
+
+def record(hostname, site="dc1"):
+    return {"hostname": hostname, "mgmt_ip": "192.0.2.1", "vendor": "cisco", "os": "iosxe", "site": site}
+
+
+class StubNdb(BaseHTTPRequestHandler):
+    """
+    /devices?hostname=a,b,c：每页 PAGE_SIZE 条，奇数页在响应体中给 next，
+    偶数页用 Link 头；每页的 ETag 由该页内容计算，If-None-Match 相同时返回 304。
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.server.requests.append((url.path, query, dict(self.headers)))
+        if self.headers.get("Authorization") != "Bearer t0k":
+            self.send_response(401)
+            self.end_headers()
+            return
+
+        names = query["hostname"][0].split(",")
+        page = int(query.get("page", ["0"])[0])
+        chunk = names[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        body = {"devices": [record(n, self.server.sites.get(n, "dc1"))
+                            for n in chunk if n not in self.server.unknown]}
+        more = (page + 1) * PAGE_SIZE < len(names)
+        next_url = f"/devices?hostname={','.join(names)}&page={page + 1}"
+        if more and page % 2 == 0:
+            body["next"] = next_url
+        data = json.dumps(body).encode()
+        etag = '"%s"' % hashlib.sha1(data).hexdigest()[:12]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        if more and page % 2 == 1:
+            self.send_header("Link", f'<{next_url}>; rel="next"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def ndb():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNdb)
+    server.requests = []
+    server.unknown = set()
+    server.sites = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(server, **kwargs):
+    return NdbClient(f"http://127.0.0.1:{server.server_address[1]}/", "t0k", **kwargs)
+
+
+def stub_netmiko(monkeypatch):
+    """没有安装 netmiko 时放一个空壳模块，测试再按需替换 Netmiko / SSHDetect。"""
+    try:
+        import netmiko  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    class Unavailable:
+        def __init__(self, **kwargs):
+            raise RuntimeError("netmiko is not installed")
+
+    netmiko = types.ModuleType("netmiko")
+    netmiko.ConnectHandler = netmiko.Netmiko = Unavailable
+    netmiko.ssh_exception = types.ModuleType("netmiko.ssh_exception")
+    autodetect = types.ModuleType("netmiko.ssh_autodetect")
+    autodetect.SSHDetect = Unavailable
+    netmiko.ssh_autodetect = autodetect
+    for module in (netmiko, netmiko.ssh_exception, autodetect):
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+
+
+@pytest.fixture
+def legacy(monkeypatch):
+    # 旧脚本在导入时解析命令行参数并设置 NET_TEXTFSM
+    stub_netmiko(monkeypatch)
+    monkeypatch.delenv("NET_TEXTFSM", raising=False)
+    monkeypatch.setattr(sys, "argv", ["command_to_csv.py", "-H", "r1", "-U", "admin", "-C", "show version"])
+    spec = importlib.util.spec_from_file_location("command_to_csv", LEGACY_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    # 并行模式的工作进程按模块名找到 run_host
+    monkeypatch.setitem(sys.modules, "command_to_csv", module)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cmd2csv.async_collect import AsyncSSHTransport, FakeTransport, Target, UniconTransport, collect_async
+from cmd2csv.health import CircuitBreaker, FailureLog
+
+OUTPUTS = {"show a": "x y\n1 2", "show b": "p q\n3 4"}
+
+
+class RefusingTransport(FakeTransport):
+    async def connect(self, timeout=None):
+        raise ConnectionRefusedError("refused")
+
+
+class FailingCommandTransport(FakeTransport):
+    async def execute(self, command, timeout=None):
+        if command == "show a":
+            raise OSError("boom")
+        return await super().execute(command, timeout)
+
+
+def make_targets():
+    return [
+        Target("r1", "iosxe", "cisco_ios", FakeTransport(OUTPUTS)),
+        Target("r2", "iosxe", "cisco_ios", RefusingTransport(OUTPUTS)),
+        Target("r3", "iosxe", "cisco_ios", FailingCommandTransport(OUTPUTS)),
+    ]
+
+
+def hosts(entities):
+    return {name: sorted(r["hostname"] for r in rows) for name, rows in entities.items()}
+
+
+def test_failures_are_recorded_and_other_devices_finish():
+    failures = FailureLog()
+    entities = collect_async(make_targets(), list(OUTPUTS), breaker=CircuitBreaker(3), failures=failures)
+    # r3 继续执行失败命令之后的命令
+    assert hosts(entities) == {"show_a": ["r1"], "show_b": ["r1", "r3"]}
+    assert sorted((r["hostname"], r["stage"], r["command"]) for r in failures.rows) == [
+        ("r2", "connect", ""),
+        ("r3", "command", "show a"),
+    ]
+
+
+def test_without_breaker_a_failed_command_aborts_only_that_device():
+    failures = FailureLog()
+    entities = collect_async(make_targets(), list(OUTPUTS), failures=failures)
+    assert hosts(entities) == {"show_a": ["r1"], "show_b": ["r1"]}
+    assert len(failures.hostnames()) == 2
+
+
+def test_open_circuit_skips_device():
+    breaker = CircuitBreaker(threshold=1)
+    breaker.failure("r1")
+    failures = FailureLog()
+    entities = collect_async(make_targets()[:1], list(OUTPUTS), breaker=breaker, failures=failures)
+    assert not entities
+    assert [r["stage"] for r in failures.rows] == ["circuit_open"]
+
+
+def test_without_failure_log_errors_propagate():
+    with pytest.raises(ConnectionRefusedError):
+        collect_async(make_targets(), ["show a"])
+
+
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({}, {}),
+        ({"known_hosts": "/etc/ssh/known_hosts"}, {"known_hosts": "/etc/ssh/known_hosts"}),
+        ({"verify_host_keys": False}, {"known_hosts": None}),
+    ],
+)
+def test_asyncssh_host_key_checking_is_opt_out(monkeypatch, kwargs, expected):
+    asyncssh = pytest.importorskip("asyncssh")
+    seen = {}
+
+    async def fake_connect(host, **kw):
+        seen.update(kw)
+        raise OSError("stop")
+
+    monkeypatch.setattr(asyncssh, "connect", fake_connect)
+    t = AsyncSSHTransport("192.0.2.1", "u", "p", **kwargs)
+    with pytest.raises(OSError):
+        asyncio.run(t.connect(1.0))
+    assert {k: v for k, v in seen.items() if k == "known_hosts"} == expected
+
+
+class ConnectOrder(FakeTransport):
+    started: list = []
+
+    async def connect(self, timeout=None):
+        ConnectOrder.started.append(self.name)
+        await super().connect(timeout)
+
+
+def test_group_waiters_do_not_hold_global_slots():
+    # 全局 2 个名额，每个站点 1 个：dc1 排队的设备不应挡住 dc2
+    ConnectOrder.started = []
+    targets = []
+    for name, site in (("a1", "dc1"), ("a2", "dc1"), ("a3", "dc1"), ("b1", "dc2")):
+        t = ConnectOrder(OUTPUTS, latency=0.02)
+        t.name = name
+        targets.append(Target(name, "iosxe", "cisco_ios", t, site=site))
+    collect_async(targets, ["show a"], concurrency=2, group_by="site", default_group_limit=1)
+    assert ConnectOrder.started[:2] == ["a1", "b1"]
+
+
+class BlockingDevice:
+    """execute("show hang") 一直阻塞到 release 被设置；记录调用与并发情况。"""
+
+    name = "r1"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.busy = False
+        self.overlap = False
+
+    def _enter(self, call):
+        self.overlap |= self.busy
+        self.busy = True
+        self.calls.append(call)
+
+    def connect(self, **kwargs):
+        self._enter("connect")
+        self.busy = False
+
+    def execute(self, command, **kwargs):
+        self._enter(command)
+        try:
+            if command == "show hang":
+                self.release.wait(5)
+            return OUTPUTS.get(command, "")
+        finally:
+            self.busy = False
+
+    def disconnect(self):
+        self._enter("disconnect")
+        self.busy = False
+
+
+def test_timed_out_unicon_session_is_abandoned():
+    dev = BlockingDevice()
+    failures = FailureLog()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        target = Target("r1", "iosxe", "cisco_ios", UniconTransport(dev, executor))
+        entities = collect_async(
+            [target], ["show hang", "show a"],
+            command_timeout=0.1, breaker=CircuitBreaker(5), failures=failures,
+        )
+        # 超时后不再发送命令，也不在阻塞的调用旁边断开
+        assert not entities and dev.calls == ["connect", "show hang"]
+        assert [(r["stage"], r["command"]) for r in failures.rows] == [("command", "show hang")]
+        dev.release.set()
+    assert dev.calls == ["connect", "show hang", "disconnect"]
+    assert not dev.overlap
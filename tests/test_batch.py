@@ -0,0 +1,41 @@
+from test_parse_stage import OUTPUTS, CannedDevice
+
+from cmd2csv.parser_pipeline import batch_chunks, collect_device
+
+SETUP_NOISE = "terminal length 0\nr1#"
+
+
+class BatchDevice(CannedDevice):
+    """记录每次 execute；列表形式与 Unicon 一样返回 命令 -> 输出 的字典。"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def execute(self, command, **kwargs):
+        self.calls.append(command)
+        if isinstance(command, list):
+            return {c: OUTPUTS[c] for c in command}
+        return SETUP_NOISE
+
+
+def test_batch_chunks():
+    assert batch_chunks(["a", "b", "c"]) == [["a", "b", "c"]]
+    assert batch_chunks(["a", "b", "c"], 2) == [["a", "b"], ["c"]]
+    assert batch_chunks([], 2) == []
+
+
+def test_batches_split_after_setup_commands():
+    dev = BatchDevice()
+    commands = [*OUTPUTS, "show ip interface brief"]
+    result = collect_device(dev, commands, "ts", batch=True, batch_size=1,
+                            setup_commands=["terminal length 0"])
+    # setup 命令只在会话建立时执行一次，重复命令只发送一次
+    assert dev.calls == ["terminal length 0", ["show ip interface brief"], ["show bench"]]
+    assert sorted(result) == sorted(c.replace(" ", "_") for c in OUTPUTS)
+    rows = [row for store in result.values() for row in store]
+    assert rows and not any("terminal" in str(v) for row in rows for v in row.values())
+
+    dev = BatchDevice()
+    collect_device(dev, commands, "ts", batch=True)
+    assert dev.calls == [list(OUTPUTS)]
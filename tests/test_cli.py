@@ -0,0 +1,38 @@
+import pytest
+
+from cmd2csv.cli import build_arg_parser, main
+
+
+ARGV = ["--hosts", "r1", "--commands", "show version", "--username", "u", "--password", "p"]
+
+
+def parse(*extra):
+    return build_arg_parser().parse_args([*ARGV, *extra])
+
+
+def error_for(capsys, *extra):
+    """main() 在连接 NDB 之前因参数错误退出，返回错误信息。"""
+    with pytest.raises(SystemExit):
+        main([*ARGV, *extra])
+    return capsys.readouterr().err
+
+
+def test_precheck_and_breaker_are_opt_in():
+    args = parse()
+    assert args.precheck_timeout is None and args.breaker_threshold == 0 and args.failures_csv is None
+    args = parse("--precheck-timeout", "0.5", "--breaker-threshold", "3")
+    assert args.precheck_timeout == 0.5 and args.breaker_threshold == 3
+
+
+def test_batch_size_requires_batch(capsys):
+    assert "--batch-size requires --batch" in error_for(capsys, "--batch-size", "5")
+    assert "at least 1" in error_for(capsys, "--batch", "--batch-size", "0")
+
+
+def test_partition_options_require_partition_by(capsys):
+    for extra in (["--append"], ["--max-rows-per-file", "10"], ["--export-workers", "2"]):
+        assert f"{extra[0]} requires --partition-by" in error_for(capsys, *extra)
+
+
+def test_group_limit_requires_group_by(capsys):
+    assert "--group-limit requires --group-by" in error_for(capsys, "--group-limit", "2")
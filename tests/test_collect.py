@@ -0,0 +1,69 @@
+import csv
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+from test_parse_stage import OUTPUTS, CannedDevice
+
+from cmd2csv.exporter import StreamingCsvExporter
+from cmd2csv.health import FailureLog
+from cmd2csv.parser_pipeline import collect_from_testbed
+
+NAMES = [f"r{i:02d}" for i in range(12)]
+
+
+class SlowDevice(CannedDevice):
+    """随机延迟，让多线程时的完成顺序每次不同。"""
+
+    def __init__(self, name, down=False):
+        super().__init__(name)
+        self.down = down
+
+    def connect(self, **kwargs):
+        if self.down:
+            raise ConnectionRefusedError("refused")
+
+    def execute(self, command, **kwargs):
+        time.sleep(random.uniform(0, 0.01))
+        return OUTPUTS[command]
+
+
+def make_testbed(down=()):
+    # testbed 顺序与主机名顺序不同
+    return SimpleNamespace(devices={n: SlowDevice(n, n in down) for n in reversed(NAMES)})
+
+
+def rows_of(entities):
+    return {name: [(r["hostname"], r.get("interface")) for r in store] for name, store in entities.items()}
+
+
+def test_row_order_does_not_depend_on_workers():
+    serial = rows_of(collect_from_testbed(make_testbed(), NAMES, list(OUTPUTS), workers=1))
+    for workers in (4, 12):
+        assert rows_of(collect_from_testbed(make_testbed(), NAMES, list(OUTPUTS), workers=workers)) == serial
+
+
+def test_streamed_csv_is_identical_across_workers(tmp_path):
+    outputs = []
+    for workers in (1, 6):
+        out = tmp_path / f"w{workers}"
+        with StreamingCsvExporter(str(out)) as sink:
+            collect_from_testbed(make_testbed(), NAMES, list(OUTPUTS), workers=workers, sink=sink)
+        # 时间戳每次运行不同，其余内容逐行比较
+        outputs.append({
+            p.name: [{k: v for k, v in row.items() if k != "timestamp"} for row in csv.DictReader(p.open())]
+            for p in sorted(out.glob("*.csv"))
+        })
+    assert outputs[0] and outputs[1] == outputs[0]
+
+
+def test_failing_device_keeps_other_rows():
+    failures = FailureLog()
+    entities = collect_from_testbed(make_testbed(down={"r03"}), NAMES, list(OUTPUTS), workers=4, failures=failures)
+    hosts = {r["hostname"] for r in entities["show_bench"]}
+    assert hosts == set(NAMES) - {"r03"}
+    assert failures.hostnames() == ["r03"]
+
+    with pytest.raises(ConnectionRefusedError):
+        collect_from_testbed(make_testbed(down={"r03"}), NAMES, list(OUTPUTS), workers=4)
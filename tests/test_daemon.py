@@ -0,0 +1,94 @@
+import os
+import threading
+
+import pytest
+
+from cmd2csv.daemon import CollectorService, is_loopback, make_server, submit
+from cmd2csv.metrics import RunMetrics
+
+
+class EchoService:
+    """代替 CollectorService：原样返回请求，便于检查鉴权。"""
+
+    def handle(self, request):
+        return {"ok": True, "request": request}
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def http_server():
+    server = serve(make_server(EchoService(), http="127.0.0.1:0", token="s3cret"))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_requires_bearer_token(http_server):
+    assert submit({"op": "stats"}, url=http_server) == {"ok": False, "error": "invalid token"}
+    assert submit({"op": "stats"}, url=http_server, token="wrong")["ok"] is False
+    reply = submit({"op": "stats"}, url=http_server, token="s3cret")
+    assert reply["ok"] and reply["request"]["op"] == "stats"
+
+
+def test_unix_socket_requires_token(tmp_path):
+    path = str(tmp_path / "d.sock")
+    server = serve(make_server(EchoService(), socket_path=path, token="s3cret"))
+    try:
+        assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+        assert submit({"op": "stats"}, socket_path=path)["error"] == "invalid token"
+        reply = submit({"op": "stats"}, socket_path=path, token="s3cret")
+        # token 不会继续传给 service
+        assert reply == {"ok": True, "request": {"op": "stats"}}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_non_loopback_http_needs_token():
+    assert is_loopback("127.0.0.1") and is_loopback("localhost") and is_loopback("[::1]")
+    assert not is_loopback("0.0.0.0") and not is_loopback("")
+    with pytest.raises(ValueError):
+        make_server(EchoService(), http="0.0.0.0:0")
+
+
+def test_job_paths_confined_to_data_root(tmp_path):
+    service = CollectorService(None, "u", "p", None, data_root=str(tmp_path))
+    assert service.resolve_path("out") == os.path.join(os.path.realpath(tmp_path), "out")
+    for bad in ("../out", "/etc", "out/../../x"):
+        with pytest.raises(ValueError):
+            service.resolve_path(bad)
+    (tmp_path / "link").symlink_to("/tmp")
+    with pytest.raises(ValueError):
+        service.resolve_path("link/x")
+    reply = service.handle({"hosts": ["r1"], "commands": ["show version"], "output_dir": "/tmp/x"})
+    assert reply["ok"] is False and "data root" in reply["error"]
+
+
+def test_run_id_cannot_escape_capture_dir(tmp_path):
+    service = CollectorService(None, "u", "p", None, data_root=str(tmp_path))
+    assert service.check_run_id("2024-01-01T00.00_a") == "2024-01-01T00.00_a"
+    assert service.check_run_id(None) is None
+    for bad in ("../../../escaped", "/tmp/abs_escape_demo", "..", "a/b", "a\\b", "."):
+        with pytest.raises(ValueError):
+            service.check_run_id(bad)
+        request = {"hosts": ["r1"], "commands": ["show version"], "capture_dir": "cap", "run_id": bad}
+        reply = service.handle(request)
+        assert reply["ok"] is False and "run_id" in reply["error"]
+    assert not (tmp_path / "cap").exists()
+
+
+def test_ndb_fetch_runs_outside_service_lock(tmp_path):
+    seen = []
+
+    class Ndb:
+        def fetch_devices_by_names(self, names):
+            seen.append(service._lock.locked())
+            return []
+
+    service = CollectorService(Ndb(), "u", "p", None, data_root=str(tmp_path))
+    assert service.devices_for(["r1"], RunMetrics()) == {}
+    assert seen == [False]
@@ -0,0 +1,25 @@
+from cmd2csv.devices import ClassifiedDevice, build_testbed_from_devices
+
+
+def classified(hostname, ip):
+    return ClassifiedDevice(
+        hostname=hostname, mgmt_ip=ip, vendor="cisco", os="iosxe", model="C9300",
+        site="dc1", role="core", pyats_os="iosxe", ntc_platform="cisco_ios",
+    )
+
+
+def test_lazy_testbed_creates_devices_on_access_in_one_testbed():
+    testbed = build_testbed_from_devices(
+        [classified("r1", "192.0.2.1"), classified("r2", "192.0.2.2")], "admin", "secret",
+    )
+    assert sorted(testbed.devices) == ["r1", "r2"]
+    assert testbed.materialized == 0
+
+    r1 = testbed.devices["r1"]
+    r2 = testbed.devices["r2"]
+    assert testbed.devices["r1"] is r1
+    assert testbed.materialized == 2
+    assert r1.testbed is r2.testbed is testbed.testbed
+    assert sorted(testbed.testbed.devices) == ["r1", "r2"]
+    assert str(r2.connections.cli.ip) == "192.0.2.2"
+    assert r1.testbed.credentials.default.username == "admin"
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+
+from cmd2csv.engines import PARSE_ENGINES
+
+
+def test_parse_engines_import_on_first_use():
+    # 新解释器中检查：导入 parser_pipeline 不会带入任何引擎模块
+    code = (
+        "import sys, cmd2csv.parser_pipeline\n"
+        "print(sorted(m for m in sys.modules if m.startswith('cmd2csv.engine_')))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_parse_engines_resolve_to_engine_modules():
+    for name in ("genie", "ntc", "textfsm"):
+        fn = PARSE_ENGINES.get(name)
+        assert fn.__module__ == f"cmd2csv.engine_{name}"
+    assert PARSE_ENGINES.get("textfsm")(None, "cisco_ios", "show x", "", None) is None
+
+
+def test_cascade_reuses_one_execute_per_command(monkeypatch, tmp_path):
+    from test_parse_stage import OUTPUTS, CannedDevice
+
+    from cmd2csv import parser_pipeline
+
+    seen = []
+
+    class CountingDevice(CannedDevice):
+        def execute(self, command, **kwargs):
+            seen.append(("execute", command))
+            return OUTPUTS[command]
+
+    def miss(name):
+        def parse(device, ntc_platform, command, raw_output, templates_dir):
+            seen.append((name, raw_output))
+            return None
+        return parse
+
+    for name in ("genie", "ntc", "textfsm"):
+        monkeypatch.setitem(PARSE_ENGINES._targets, name, miss(name))
+        monkeypatch.delitem(PARSE_ENGINES._loaded, name, raising=False)
+    fallback = parser_pipeline.fallback_whitespace
+
+    def recording_fallback(raw_output, *args):
+        seen.append(("raw_space", raw_output))
+        return fallback(raw_output, *args)
+
+    monkeypatch.setattr(parser_pipeline, "fallback_whitespace", recording_fallback)
+
+    result = parser_pipeline.collect_device(CountingDevice(), list(OUTPUTS), "ts", templates_dir=str(tmp_path))
+    assert [c for kind, c in seen if kind == "execute"] == list(OUTPUTS)
+    for raw in OUTPUTS.values():
+        assert [kind for kind, text in seen if text == raw] == ["genie", "ntc", "textfsm", "raw_space"]
+    assert {rows[0]["parse_engine"] for rows in result.values()} == {"raw_space"}
@@ -0,0 +1,95 @@
+import csv
+
+from cmd2csv.exporter import PartitionedCsvExporter, StreamingCsvExporter, export_per_command_as_csv
+from cmd2csv.parser_pipeline import stamp_rows
+
+
+def meta(hostname):
+    return {"timestamp": "ts", "hostname": hostname, "site": "dc1", "role": "core", "os": "iosxe"}
+
+
+def device_rows(hostname, extra=None):
+    rows = [{"interface": f"Gi0/{i}", "status": "up", **(extra or {})} for i in range(3)]
+    return stamp_rows(meta(hostname), "show x", "genie", rows)
+
+
+def test_late_columns_reach_header_and_earlier_rows_are_padded(tmp_path):
+    with StreamingCsvExporter(str(tmp_path)) as exporter:
+        exporter.add_rows("show_x", device_rows("r2"))
+        exporter.add_rows("show_x", device_rows("r1", {"speed": "1000"}))
+    with (tmp_path / "show_x.csv").open() as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    assert "speed" in reader.fieldnames
+    assert [r["hostname"] for r in rows] == ["r1"] * 3 + ["r2"] * 3
+    assert [r["speed"] for r in rows] == ["1000"] * 3 + [""] * 3
+    # 溢写目录在结束后删除
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["show_x.csv"]
+
+
+def test_spilled_output_matches_in_memory_export(tmp_path):
+    entities = {
+        "show_x": [device_rows("r3"), device_rows("r1", {"speed": "1000"}), device_rows("r2")],
+        # 普通 dict 行，一次调用包含多台设备
+        "show_y": [[{"hostname": "r2", "a": "1"}, {"hostname": "r1", "b": "2"}]],
+    }
+    export_per_command_as_csv(
+        {name: [row for block in blocks for row in block] for name, blocks in entities.items()},
+        str(tmp_path / "memory"),
+    )
+    with StreamingCsvExporter(str(tmp_path / "spill")) as exporter:
+        for name, blocks in entities.items():
+            for block in blocks:
+                exporter.add_rows(name, block)
+
+    for name in entities:
+        memory = (tmp_path / "memory" / f"{name}.csv").read_bytes()
+        assert (tmp_path / "spill" / f"{name}.csv").read_bytes() == memory
+
+
+def write_partitioned(out, hostnames, **kwargs):
+    with PartitionedCsvExporter(str(out), partition_by=("site",), **kwargs) as exporter:
+        for hostname in hostnames:
+            exporter.add_rows("show_x", device_rows(hostname))
+    return out / "command=show_x" / "site=dc1"
+
+
+def parts(directory):
+    return sorted(p.name for p in directory.iterdir())
+
+
+def read_hosts(directory):
+    hosts = []
+    for name in parts(directory):
+        with (directory / name).open() as f:
+            hosts += [r["hostname"] for r in csv.DictReader(f)]
+    return hosts
+
+
+def test_partition_split_at_max_rows(tmp_path):
+    # 2 台设备共 6 行，每个文件 4 行
+    directory = write_partitioned(tmp_path, ["r2", "r1"], max_rows=4)
+    assert parts(directory) == ["part-0.csv", "part-1.csv"]
+    assert read_hosts(directory) == ["r1"] * 3 + ["r2"] * 3
+    with (directory / "part-1.csv").open() as f:
+        assert len(list(csv.DictReader(f))) == 2
+
+
+def test_append_numbers_parts_after_existing(tmp_path):
+    write_partitioned(tmp_path, ["r1", "r2"], max_rows=3)
+    directory = write_partitioned(tmp_path, ["r3"], max_rows=3, append=True)
+    assert parts(directory) == ["part-0.csv", "part-1.csv", "part-2.csv"]
+    assert read_hosts(directory) == ["r1"] * 3 + ["r2"] * 3 + ["r3"] * 3
+
+
+def test_replace_removes_stale_parts_and_keeps_other_partitions(tmp_path):
+    write_partitioned(tmp_path, ["r1", "r2", "r3"], max_rows=3)
+    with PartitionedCsvExporter(str(tmp_path), partition_by=("site",)) as exporter:
+        exporter.add_rows("show_y", device_rows("r1"))
+    directory = write_partitioned(tmp_path, ["r4"], max_rows=3)
+    assert parts(directory) == ["part-0.csv"]
+    assert read_hosts(directory) == ["r4"] * 3
+    # 未写入的分区不变，暂存目录都已删除
+    assert parts(tmp_path / "command=show_y" / "site=dc1") == ["part-0.csv"]
+    assert parts(tmp_path) == ["command=show_x", "command=show_y"]
+    assert parts(directory.parent) == ["site=dc1"]
@@ -0,0 +1,63 @@
+import pytest
+
+from cmd2csv.fixed_width import clear_layouts, parse_fixed_width
+
+OUTPUT = """\
+Codes: C - connected, S - static
+Interface              IP-Address      OK? Method Status                Protocol
+---------------------- --------------- --- ------ --------------------- --------
+GigabitEthernet0/0     10.0.0.1        YES manual up                    up
+GigabitEthernet0/1     unassigned      YES unset  administratively down down
+Total number of interfaces in this table: 2
+
+Interface              IP-Address      OK? Method Status                Protocol
+Loopback0              192.0.2.1       YES manual up                    up
+"""
+
+
+@pytest.fixture(autouse=True)
+def fresh_layouts():
+    clear_layouts()
+    yield
+    clear_layouts()
+
+
+def test_columns_sliced_by_header_positions():
+    rows = parse_fixed_width(OUTPUT)
+    interfaces = [r for r in rows if "interface" in r]
+    assert [r["interface"] for r in interfaces] == ["GigabitEthernet0/0", "GigabitEthernet0/1", "Loopback0"]
+    assert interfaces[1]["status"] == "administratively down"
+    assert interfaces[1]["ip_address"] == "unassigned"
+
+
+def test_lines_outside_table_kept_in_order():
+    rows = parse_fixed_width(OUTPUT)
+    assert rows[0] == {"_text": "Codes: C - connected, S - static"}
+    assert rows[3] == {"_text": "Total number of interfaces in this table: 2"}
+    assert len(rows) == 5
+
+
+def test_cached_layout_gives_same_rows():
+    first = parse_fixed_width(OUTPUT, ("cisco_ios", "show_ip_interface_brief"))
+    assert parse_fixed_width(OUTPUT, ("cisco_ios", "show_ip_interface_brief")) == first
+
+
+def test_no_header_returns_none():
+    assert parse_fixed_width("just some text\nanother line 10.0.0.1\n") is None
+
+
+LOG_BUFFER = """\
+Log Buffer (8192 bytes):
+*Mar  1 00:00:01.123: %SYS-5-CONFIG_I: Configured from console by admin
+*Mar  1 00:00:05.456: %LINK-3-UPDOWN: Interface Gi0/1, changed state to up
+"""
+
+
+def test_prose_line_is_not_a_header():
+    assert parse_fixed_width(LOG_BUFFER) is None
+
+
+def test_header_words_must_sit_over_data():
+    # 空白列碰巧把数据分开，但 "Interface" 下方没有任何数据
+    text = "Interface Status\n           1       2\n           3       4\n"
+    assert parse_fixed_width(text) is None
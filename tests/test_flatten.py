@@ -0,0 +1,60 @@
+from genie.metaparser.util.schemaengine import Any
+
+from cmd2csv.flatten import FlattenPlan, compile_schema
+
+VRF_OUTPUT = {
+    "vrf": {
+        "default": {
+            "interface": {
+                "Gi0/0": {"ip": "10.0.0.1"},
+                "Gi0/1": {"ip": "10.0.0.2"},
+            },
+        },
+    },
+}
+
+
+def test_inferred_plan_keeps_lone_vrf_as_key_column():
+    plan = FlattenPlan()
+    rows = plan.rows(VRF_OUTPUT)
+    assert rows == [
+        {"vrf": "default", "interface": "Gi0/0", "ip": "10.0.0.1"},
+        {"vrf": "default", "interface": "Gi0/1", "ip": "10.0.0.2"},
+    ]
+    assert plan.key_columns == ["vrf", "interface"]
+
+
+def test_inferred_plan_unwraps_outer_wrapper_only():
+    plan = FlattenPlan()
+    assert plan.rows({"version": {"version": "17.3", "chassis": "C9300"}}) == [
+        {"version": "17.3", "chassis": "C9300"},
+    ]
+    assert plan.key_columns == []
+
+
+def test_schema_plan_unwraps_only_fixed_keys():
+    schema = {
+        "vrf": {
+            Any(): {
+                "router_id": str,
+                "neighbor": {Any(): {"state": str}},
+            },
+        },
+    }
+    plan = FlattenPlan(compile_schema(schema), source="schema")
+    output = {"vrf": {"default": {"router_id": "1.1.1.1", "neighbor": {"192.0.2.1": {"state": "up"}}}}}
+    rows = plan.rows(output)
+    assert rows == [
+        {"vrf": "default", "router_id": "1.1.1.1", "neighbor": "192.0.2.1", "neighbor_state": "up"},
+    ]
+    assert plan.key_columns == ["vrf", "neighbor"]
+
+
+def test_schema_dynamic_key_under_record_becomes_key_column():
+    # {'instance': {Any(): ...}} 与固定键并列时编译为带 default 的 Record
+    schema = {"instance": {"total": int, Any(): {"state": str}}}
+    plan = FlattenPlan(compile_schema(schema), source="schema")
+    assert plan.rows({"instance": {"ospf1": {"state": "up"}}}) == [
+        {"instance": "ospf1", "state": "up"},
+    ]
+    assert plan.key_columns == ["instance"]
@@ -0,0 +1,54 @@
+from cmd2csv.health import CircuitBreaker, FailureLog
+
+
+def test_breaker_opens_after_threshold_and_closes_on_success():
+    b = CircuitBreaker(threshold=2, cooldown=10)
+    assert b.allow("r1", now=0)
+    b.failure("r1", now=0)
+    assert b.allow("r1", now=0) and not b.tripped("r1")
+    b.failure("r1", now=1)
+    assert b.tripped("r1")
+    assert not b.allow("r1", now=5)
+    assert b.open_hosts(now=5) == ["r1"]
+
+    # 冷却期后半开：只放行一个试探
+    assert b.allow("r1", now=11)
+    assert not b.tripped("r1")
+    assert not b.allow("r1", now=11)
+    assert not b.allow("r1", now=12)
+    assert b.open_hosts(now=12) == ["r1"]
+
+    b.success("r1")
+    assert b.allow("r1", now=12) and b.allow("r1", now=12)
+    assert b.open_hosts(now=12) == []
+
+
+def test_failed_trial_reopens_circuit():
+    b = CircuitBreaker(threshold=1, cooldown=10)
+    b.failure("r1", now=0)
+    assert b.allow("r1", now=10)
+    b.failure("r1", now=10)
+    assert b.tripped("r1")
+    assert not b.allow("r1", now=15)
+    assert b.allow("r1", now=20)
+
+
+def test_abandoned_trial_expires_after_cooldown():
+    b = CircuitBreaker(threshold=1, cooldown=10)
+    b.failure("r1", now=0)
+    assert b.allow("r1", now=10)
+    assert not b.allow("r1", now=19)
+    assert b.allow("r1", now=20)
+
+
+def test_failure_log_csv(tmp_path):
+    log = FailureLog()
+    assert not log
+    log.add("r2", "connect", TimeoutError("timed out"), address="192.0.2.2:22")
+    log.add("r1", "command", "bad output", command="show version")
+    path = log.write_csv(tmp_path / "sub" / "_failures.csv")
+    lines = path.read_text().splitlines()
+    assert lines[0] == "timestamp,hostname,address,stage,command,error_type,error"
+    assert [line.split(",")[1] for line in lines[1:]] == ["r1", "r2"]
+    assert "TimeoutError" in lines[2]
+    assert log.hostnames() == ["r2", "r1"]
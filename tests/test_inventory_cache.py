@@ -0,0 +1,60 @@
+from conftest import client_for
+
+from cmd2csv.inventory_cache import CachedNdbClient, InventoryCache
+
+
+def test_conditional_fetch_returns_not_modified(ndb):
+    client = client_for(ndb)
+    first = client.fetch_chunk_conditional(["r1"])
+    (url, etag, _), = first.pages
+    assert etag and not first.not_modified
+    again = client.fetch_chunk_conditional(["r1"], first.pages)
+    assert again.not_modified and again.devices == []
+    assert ndb.requests[-1][2]["If-None-Match"] == etag
+
+
+def test_changed_later_page_is_refetched(ndb):
+    client = client_for(ndb)
+    names = ["r1", "r2", "r3", "r4"]
+    first = client.fetch_chunk_conditional(names)
+    assert len(first.pages) == 2
+
+    # 第 1 页不变（304），第 2 页变化：整块重新获取
+    ndb.sites["r4"] = "dc2"
+    del ndb.requests[:]
+    again = client.fetch_chunk_conditional(names, first.pages)
+    assert not again.not_modified
+    assert {d.hostname: d.site for d in again.devices}["r4"] == "dc2"
+    assert len(ndb.requests) == 4
+    assert [("If-None-Match" in h) for _, _, h in ndb.requests] == [True, True, False, False]
+
+
+def test_inventory_cache_revalidates_every_page(ndb, tmp_path):
+    path = tmp_path / "inventory.json"
+    names = ["r1", "r2", "r3"]
+    cached = CachedNdbClient(client_for(ndb), InventoryCache(str(path), ttl=60))
+    assert [d.hostname for d in cached.fetch_devices_by_names(names)] == names
+    assert len(ndb.requests) == 2
+
+    # 新鲜记录不访问网络；重新加载的缓存文件同样可用
+    cache = InventoryCache(str(path), ttl=60)
+    cached = CachedNdbClient(client_for(ndb), cache)
+    cached.fetch_devices_by_names(names)
+    assert len(ndb.requests) == 2
+
+    # 过期后逐页条件请求，全部 304 只刷新获取时间
+    for rec in cache.records.values():
+        rec["fetched_at"] -= 120
+    assert [d.hostname for d in cached.fetch_devices_by_names(names)] == names
+    assert len(ndb.requests) == 4
+    assert all("If-None-Match" in h for _, _, h in ndb.requests[2:])
+    assert cache.is_fresh("r1")
+
+    # 第 2 页上的设备变化也会被发现
+    for rec in cache.records.values():
+        rec["fetched_at"] -= 120
+    ndb.sites["r3"] = "dc2"
+    assert cached.fetch_devices_by_names(["r3"])[0].site == "dc2"
+
+    offline = CachedNdbClient(None, InventoryCache(str(path), ttl=0), offline=True)
+    assert [d.hostname for d in offline.fetch_devices_by_names(["r2", "r9"])] == ["r2"]
@@ -0,0 +1,82 @@
+import email
+import os
+import socketserver
+import threading
+
+import pytest
+
+
+class SmtpStandIn(socketserver.StreamRequestHandler):
+    """只实现脚本用到的 SMTP 命令，收到的邮件存入 server.messages。"""
+
+    def handle(self):
+        def reply(text):
+            self.wfile.write((text + "\r\n").encode())
+
+        reply("220 stand-in")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip().upper()
+            if cmd == "DATA":
+                reply("354 go ahead")
+                data = b""
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk == b".\r\n":
+                        break
+                    data += chunk[1:] if chunk.startswith(b"..") else chunk
+                self.server.messages.append(email.message_from_bytes(data))
+                reply("250 queued")
+            elif cmd == "QUIT":
+                reply("221 bye")
+                return
+            else:
+                reply("250 ok")
+
+
+@pytest.fixture
+def smtp():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SmtpStandIn)
+    server.daemon_threads = True
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def attachments(message):
+    return [(p.get_filename(), p.get_payload(decode=True)) for p in message.walk() if p.get_filename()]
+
+
+def test_results_sent_as_one_zip(legacy, smtp, tmp_path):
+    result = tmp_path / "r1_show_version.csv"
+    result.write_text("hostname,version\nr1,17.3\n")
+    legacy.email_alert("127.0.0.1", "me@example.com", "a@example.com; b@example.com", [str(result)],
+                       smtp_port=smtp.server_address[1])
+    assert len(smtp.messages) == 1
+    (name, payload), = attachments(smtp.messages[0])
+    assert name.endswith(".zip") and payload[:2] == b"PK"
+
+
+def test_large_archive_split_into_numbered_parts(legacy, smtp, tmp_path):
+    result = tmp_path / "big.csv"
+    # 随机内容压缩后仍然很大
+    result.write_bytes(os.urandom(50000))
+    legacy.email_alert("127.0.0.1", "me@example.com", "a@example.com", [str(result)],
+                       smtp_port=smtp.server_address[1], max_attachment_size=20000)
+    parts = [attachments(m)[0] for m in smtp.messages]
+    # base64 编码后每封邮件仍在限制以内
+    assert all(len(m.as_bytes()) <= 20000 for m in smtp.messages)
+    assert [name.rsplit(".", 1)[1] for name, _ in parts] == ["001", "002", "003", "004", "005"]
+    assert "(1/5)" in smtp.messages[0]["Subject"]
+    joined = b"".join(payload for _, payload in parts)
+    assert joined[:2] == b"PK" and len(joined) > 50000
+
+
+def test_no_server_skips_email(legacy, smtp, tmp_path, capsys):
+    legacy.email_alert("", "me@example.com", "a@example.com", [str(tmp_path / "x.csv")])
+    assert "skipped" in capsys.readouterr().out
+    assert smtp.messages == []
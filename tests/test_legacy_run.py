@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+# 每台设备真实的 device_type；"down" 无法登录
+ACTUAL_TYPES = {"r1": "cisco_ios", "r2": "cisco_nxos", "swapped": "cisco_nxos"}
+
+
+class FakeNetmiko:
+    def __init__(self, host, device_type, **kwargs):
+        if ACTUAL_TYPES.get(host) != device_type:
+            raise ValueError("pattern not detected")
+        self.host = host
+
+    def send_command(self, command, use_textfsm=True):
+        return [{"host": self.host, "intf": "Gi1", "status": "up"}]
+
+    def disconnect(self):
+        pass
+
+
+class FakeDetect:
+    calls = []
+
+    def __init__(self, host, **kwargs):
+        self.host = host
+
+    def autodetect(self):
+        FakeDetect.calls.append(self.host)
+        if self.host not in ACTUAL_TYPES:
+            raise ConnectionError("connection refused")
+        return ACTUAL_TYPES[self.host]
+
+
+@pytest.fixture
+def script(legacy, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(legacy, "Netmiko", FakeNetmiko)
+    monkeypatch.setattr(legacy, "SSHDetect", FakeDetect)
+    FakeDetect.calls = []
+    for name, value in (("user", "admin"), ("password", "pw"), ("secret", None)):
+        monkeypatch.setattr(legacy, name, value, raising=False)
+    return legacy
+
+
+def connect(script, types):
+    script.conn_table = script.Connection_data("admin", "pw", None, types)
+    return script.conn_table
+
+
+def test_stale_device_type_invalidated_and_detected_again(script, tmp_path):
+    path = str(tmp_path / "types.json")
+    (tmp_path / "types.json").write_text(json.dumps({"r1": "cisco_ios", "swapped": "cisco_ios"}))
+    table = connect(script, script.DeviceType_cache(path))
+
+    table.get_connection("r1")
+    assert FakeDetect.calls == []
+    table.get_connection("swapped")
+    assert FakeDetect.calls == ["swapped"]
+    assert table.device_types.get("swapped") == "cisco_nxos"
+
+    table.device_types.save()
+    assert json.loads((tmp_path / "types.json").read_text())["swapped"] == "cisco_nxos"
+
+
+def test_serial_collects_failures(script, tmp_path):
+    connect(script, script.DeviceType_cache())
+    failed = script.run_serial(["r1", "down", "r2"], ["show interfaces"])
+    assert list(failed) == ["down"] and "refused" in failed["down"]
+    assert sorted(p.name for p in tmp_path.glob("*.csv")) == ["r1_show interfaces.csv", "r2_show interfaces.csv"]
+
+
+def test_parallel_collects_failures_and_merges_device_types(script, tmp_path):
+    table = connect(script, script.DeviceType_cache(types={"down": "cisco_ios", "swapped": "cisco_ios"}))
+    failed = script.run_parallel(["r1", "down", "swapped", "r2"], ["show interfaces"], workers=2)
+    assert list(failed) == ["down"] and "refused" in failed["down"]
+    assert sorted(p.name for p in tmp_path.glob("*.csv")) == [
+        "r1_show interfaces.csv", "r2_show interfaces.csv", "swapped_show interfaces.csv"]
+    # 工作进程中检测到的类型合并回主进程；登录失败的主机被遗忘
+    assert table.device_types.types == {"r1": "cisco_ios", "r2": "cisco_nxos", "swapped": "cisco_nxos"}
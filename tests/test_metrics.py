@@ -0,0 +1,59 @@
+import json
+import re
+
+from test_parse_stage import OUTPUTS, CannedDevice
+
+from cmd2csv.metrics import RunMetrics
+from cmd2csv.parser_pipeline import collect_device
+
+# name{label="value",...} value
+SAMPLE = re.compile(r'[a-zA-Z_:][\w:]*(\{[a-zA-Z_]\w*="(?:[^"\\]|\\.)*"(,[a-zA-Z_]\w*="(?:[^"\\]|\\.)*")*\})? \S+\Z')
+
+
+def collected_metrics():
+    metrics = RunMetrics()
+    collect_device(CannedDevice(), list(OUTPUTS), "ts", metrics=metrics)
+    return metrics
+
+
+def test_json_report_has_per_device_and_per_command_timings(tmp_path):
+    path = tmp_path / "report" / "run.json"
+    collected_metrics().write_json(str(path))
+    report = json.loads(path.read_text())
+    assert set(report) == {"started_at", "elapsed_seconds", "stages", "timings", "counters", "failures"}
+
+    executes = [t for t in report["timings"] if t["stage"] == "execute"]
+    assert sorted(t["command"] for t in executes) == sorted(OUTPUTS)
+    assert all(t["hostname"] == "r1" and t["seconds"] >= 0 for t in executes)
+    assert [t["hostname"] for t in report["timings"] if t["stage"] == "device"] == ["r1"]
+    assert report["stages"]["execute"]["count"] == len(OUTPUTS)
+    hits = {c["labels"]["command"]: c["labels"]["engine"] for c in report["counters"] if c["name"] == "parse_engine_hits"}
+    assert hits == {"show ip interface brief": "genie", "show bench": "raw_space"}
+
+
+def test_prometheus_text_format(tmp_path):
+    metrics = collected_metrics()
+    metrics.failure("connect", "refused", hostname="r2")
+    metrics.inc("rows", 2, command='show "x"\nfoo')
+    text = metrics.prometheus_text()
+    assert text.endswith("\n")
+
+    typed = set()
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "summary") and name not in typed
+            typed.add(name)
+            continue
+        assert SAMPLE.match(line), line
+        name = re.match(r"[\w:]+", line).group()
+        assert name in typed or re.sub(r"_(sum|count)\Z", "", name) in typed
+    # 耗时按阶段聚合，不带 hostname 标签
+    assert 'cmd2csv_stage_seconds_count{command="show bench",stage="execute"} 1' in text
+    assert "hostname" not in "".join(l for l in text.splitlines() if "stage_seconds" in l)
+    assert 'cmd2csv_failures_total{stage="connect"} 1' in text
+    assert 'cmd2csv_rows_total{command="show \\"x\\"\\nfoo"} 2' in text
+
+    path = tmp_path / "cmd2csv.prom"
+    metrics.write_prometheus(str(path))
+    assert path.read_text().startswith("# TYPE cmd2csv_stage_seconds summary")
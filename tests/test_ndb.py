@@ -0,0 +1,15 @@
+from conftest import client_for
+
+
+def test_fetch_chunks_and_follows_both_pagination_styles(ndb):
+    names = [f"r{i}" for i in range(7)]
+    ndb.unknown = {"r3"}
+    client = client_for(ndb, chunk_size=5, max_workers=2)
+    devices = client.fetch_devices_by_names(names + ["r0"])
+    assert sorted(d.hostname for d in devices) == sorted(set(names) - {"r3"})
+    assert devices[0].site == "dc1"
+
+    firsts = sorted(q["hostname"][0] for _, q, _ in ndb.requests if "page" not in q)
+    assert firsts == ["r0,r1,r2,r3,r4", "r5,r6,r0"]
+    # 5 个名字 3 页（body next、Link 头），3 个名字 2 页
+    assert len(ndb.requests) == 5
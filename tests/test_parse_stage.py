@@ -0,0 +1,90 @@
+from cmd2csv.devices import offline_device, parser_tokens
+from cmd2csv.health import CircuitBreaker, FailureLog
+from cmd2csv.parse_stage import ParseStage
+from cmd2csv.parser_pipeline import collect_device
+
+SHOW_IP_INT_BRIEF = """\
+Interface              IP-Address      OK? Method Status                Protocol
+GigabitEthernet0/0     10.0.0.1        YES manual up                    up
+GigabitEthernet0/1     unassigned      YES unset  administratively down down
+Loopback0              192.0.2.1       YES manual up                    up
+"""
+
+SHOW_BENCH = """\
+Name      State     Peer
+peer1     Estab     192.0.2.1
+peer2     Idle      192.0.2.2
+"""
+
+OUTPUTS = {
+    "show ip interface brief": SHOW_IP_INT_BRIEF,
+    "show bench": SHOW_BENCH,
+}
+
+
+class CannedDevice:
+    """回放固定输出；parse() 与真实设备一样交给按自身属性选择解析器的 Genie。"""
+
+    def __init__(self, name="r1", os="iosxe", platform="cat9k"):
+        self.name = name
+        self.os = os
+        self.platform = platform
+        self.custom = {"site": "dc1", "role": "core", "ntc_platform": "cisco_ios"}
+
+    def connect(self, **kwargs):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def execute(self, command, **kwargs):
+        return OUTPUTS[command]
+
+    def parse(self, command, output=None):
+        return offline_device(self.os, parser_tokens(self)).parse(command, output=output)
+
+
+def test_parser_tokens_carry_platform():
+    assert parser_tokens(CannedDevice()) == (("os", "iosxe"), ("platform", "cat9k"))
+    assert offline_device("iosxe", (("platform", "cat9k"),)).platform == "cat9k"
+
+
+def test_pooled_parsing_matches_inline():
+    dev = CannedDevice()
+    commands = list(OUTPUTS)
+    inline = collect_device(dev, commands, "ts")
+    with ParseStage(workers=1) as stage:
+        pooled = collect_device(dev, commands, "ts", parse_stage=stage)
+
+    assert inline.keys() == pooled.keys()
+    for name in inline:
+        assert list(pooled[name]) == list(inline[name])
+    engines = {name: inline[name][0]["parse_engine"] for name in inline}
+    assert engines["show_ip_interface_brief"] == "genie"
+    assert engines["show_bench"] == "raw_space"
+
+
+class BrokenStage:
+    def submit(self, *args):
+        return None
+
+    def result(self, job):
+        raise RuntimeError("worker died")
+
+
+def test_pooled_parse_failure_is_recorded():
+    breaker = CircuitBreaker(threshold=2)
+    failures = FailureLog()
+    result = collect_device(
+        CannedDevice(), list(OUTPUTS), "ts",
+        parse_stage=BrokenStage(), breaker=breaker, failures=failures,
+    )
+    assert not result
+    assert [(r["stage"], r["command"]) for r in failures.rows] == [
+        ("command", "show ip interface brief"),
+        ("command", "show bench"),
+    ]
+    assert not breaker.allow("r1")
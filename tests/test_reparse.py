@@ -0,0 +1,27 @@
+from test_parse_stage import OUTPUTS, CannedDevice
+
+from cmd2csv import reparse
+from cmd2csv.capture_store import CaptureStore, iter_host_captures
+from cmd2csv.parser_pipeline import collect_device
+
+
+def test_reparse_matches_live_parse(tmp_path, monkeypatch):
+    store = CaptureStore(str(tmp_path), "run1")
+    live = collect_device(CannedDevice(), list(OUTPUTS), "ts", capture=store)
+
+    host_dir = tmp_path / "run1" / "r1"
+    assert {c.tokens for c in iter_host_captures(host_dir)} == {(("os", "iosxe"), ("platform", "cat9k"))}
+
+    seen = []
+    offline_device = reparse.offline_device
+
+    def recording(pyats_os, tokens=()):
+        seen.append(tokens)
+        return offline_device(pyats_os, tokens)
+
+    monkeypatch.setattr(reparse, "offline_device", recording)
+    reparsed = reparse.reparse_host(str(host_dir))
+    assert seen and all(dict(t)["platform"] == "cat9k" for t in seen)
+    assert reparsed.keys() == live.keys()
+    for name in live:
+        assert list(reparsed[name]) == list(live[name])
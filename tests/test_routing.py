@@ -0,0 +1,47 @@
+from cmd2csv.routing import ENGINE_ORDER, EngineRouter, main
+
+
+def test_winner_first_then_default_order_without_negatives():
+    router = EngineRouter(reprobe_every=0, fail_threshold=2)
+    assert router.order("cisco_ios", "show_x") == list(ENGINE_ORDER)
+
+    router.record("cisco_ios", "show_x", "textfsm", ["genie", "ntc"])
+    assert router.order("cisco_ios", "show_x") == ["textfsm", "genie", "ntc"]
+
+    # 连续失败达到阈值的引擎不再尝试；成功一次即清除失败计数
+    router.record("cisco_ios", "show_x", "textfsm", ["genie"])
+    assert router.order("cisco_ios", "show_x") == ["textfsm", "ntc"]
+    router.record("cisco_ios", "show_x", "genie", [])
+    assert router.order("cisco_ios", "show_x") == ["genie", "ntc", "textfsm"]
+
+    # 其他平台 / 命令不受影响
+    assert router.order("arista_eos", "show_x") == list(ENGINE_ORDER)
+
+
+def test_periodic_reprobe_uses_default_order():
+    router = EngineRouter(reprobe_every=3, fail_threshold=1)
+    router.record("cisco_ios", "show_x", "textfsm", ["genie", "ntc"])
+    orders = [router.order("cisco_ios", "show_x") for _ in range(3)]
+    assert orders == [["textfsm"], ["textfsm"], list(ENGINE_ORDER)]
+
+
+def test_reset_clears_learned_routes(tmp_path, capsys):
+    path = tmp_path / "routes.json"
+    router = EngineRouter(str(path), reprobe_every=0, fail_threshold=1)
+    for platform in ("cisco_ios", "arista_eos"):
+        for cmd in ("show_x", "show_y"):
+            router.record(platform, cmd, "ntc", ["genie"])
+    router.save()
+
+    assert router.reset("cisco_ios", "show_x") == 1
+    assert router.order("cisco_ios", "show_x") == list(ENGINE_ORDER)
+    assert router.order("cisco_ios", "show_y") == ["ntc", "textfsm"]
+    assert router.reset("cisco_ios") == 1
+    assert sorted(router.entries()) == ["arista_eos|show_x", "arista_eos|show_y"]
+
+    # routes --reset 修改保存的表
+    main(["--routing-table", str(path), "--platform", "arista_eos", "--command", "show y", "--reset"])
+    assert "removed 1 route(s)" in capsys.readouterr().out
+    assert sorted(EngineRouter(str(path)).entries()) == ["arista_eos|show_x", "cisco_ios|show_x", "cisco_ios|show_y"]
+    main(["--routing-table", str(path), "--reset"])
+    assert EngineRouter(str(path)).entries() == {}
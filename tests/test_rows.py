@@ -0,0 +1,47 @@
+import pickle
+
+from cmd2csv.exporter import StreamingCsvExporter
+from cmd2csv.rows import RowBlock, RowStore, row_keys
+
+META = {"timestamp": "ts", "hostname": "r1", "os": "iosxe", "command": "show x", "parse_engine": "ntc"}
+UNIFORM = [{"intf": "Gi0/0", "status": "up"}, {"intf": "Gi0/1", "status": "down"}]
+# 列不一致，且有一列与元数据重名
+RAGGED = [{"intf": "Gi0/0"}, {"intf": "Gi0/1", "desc": "uplink", "os": "override"}]
+
+
+def stamped(meta, rows):
+    return [{**meta, **r} for r in rows]
+
+
+def test_blocks_read_like_stamped_dicts():
+    for rows in (UNIFORM, RAGGED):
+        block = RowBlock.from_dicts(META, rows)
+        assert list(block) == stamped(META, rows)
+        assert block[1] == stamped(META, rows)[1]
+        assert list(pickle.loads(pickle.dumps(block))) == list(block)
+    assert not RowBlock.from_dicts(META, RAGGED).dense
+
+
+def test_store_indexing_matches_flat_list():
+    r2 = {**META, "hostname": "r2"}
+    store = RowStore([RowBlock.from_dicts(META, UNIFORM), RowBlock.from_dicts(META, []), RowBlock.from_dicts(r2, RAGGED)])
+    flat = stamped(META, UNIFORM) + stamped(r2, RAGGED)
+    assert len(store) == len(flat) == 4
+    assert list(store) == flat
+    assert [store[i] for i in range(-4, 4)] == flat[-4:] + flat
+    assert store[1:3] == flat[1:3]
+    assert row_keys(store) == {k for r in flat for k in r}
+
+
+def test_exported_csv_identical_for_blocks_and_dicts(tmp_path):
+    r2 = {**META, "hostname": "r2"}
+    store = RowStore([RowBlock.from_dicts(META, UNIFORM), RowBlock.from_dicts(r2, RAGGED)])
+    flat = stamped(META, UNIFORM) + stamped(r2, RAGGED)
+
+    outputs = []
+    for name, rows in (("blocks", store), ("dicts", flat)):
+        with StreamingCsvExporter(str(tmp_path / name)) as exporter:
+            exporter.add_rows("show_x", rows)
+        outputs.append((tmp_path / name / "show_x.csv").read_text())
+    assert outputs[0] == outputs[1]
+    assert "override" in outputs[0]
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from cmd2csv.scheduling import SESSION_KEY, DurationHistory, Scheduler
+
+
+def history_of(seconds):
+    history = DurationHistory()
+    for hostname, value in seconds.items():
+        history.record(hostname, SESSION_KEY, 0.0)
+        history.record(hostname, "show_x", value)
+    return history
+
+
+def test_plan_starts_longest_first():
+    scheduler = Scheduler(history_of({"r1": 1.0, "r2": 9.0}))
+    # r3、r4 没有记录，用平均值 5 估计，两者之间保持原顺序
+    order = scheduler.plan(["r1", "r3", "r4", "r2"], ["show_x"], workers=2)
+    assert order == ["r2", "r3", "r4", "r1"]
+    assert scheduler.estimates == {"r1": 1.0, "r2": 9.0, "r3": 5.0, "r4": 5.0}
+    # r2 + r1 | r3 + r4
+    assert scheduler.predicted == 10.0
+    assert Scheduler().plan(["r1", "r2"], ["show_x"], workers=2) == ["r1", "r2"]
+
+
+def run_scheduled(scheduler, order, scale):
+    """按 scale 秒/估计秒 sleep，记录每组的最大并发和实际 makespan。"""
+    lock = threading.Lock()
+    running, peak = Counter(), Counter()
+
+    def run(name):
+        group = scheduler.groups[name]
+        with lock:
+            running[group] += 1
+            peak[group] = max(peak[group], running[group])
+        time.sleep(scheduler.estimates[name] * scale)
+        with lock:
+            running[group] -= 1
+        return name
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scheduler.workers) as pool:
+        done = [name for name, fut in scheduler.dispatch(pool, order, run) if fut.result() == name]
+    return done, peak, time.perf_counter() - t0
+
+
+def test_dispatch_respects_group_cap_and_matches_simulation():
+    groups = {"a1": "a", "a2": "a", "b1": "b"}
+    scheduler = Scheduler(history_of({"a1": 4.0, "a2": 4.0, "b1": 1.0}), group_by="site", default_group_limit=1)
+    order = scheduler.plan(list(groups), ["show_x"], workers=2, groups=groups)
+    # a2 要等 a1 结束，b1 先用空闲的 worker
+    assert scheduler.predicted == 8.0
+
+    done, peak, actual = run_scheduled(scheduler, order, scale=0.05)
+    assert done == ["b1", "a1", "a2"]
+    assert peak == {"a": 1, "b": 1}
+    assert abs(actual - scheduler.predicted * 0.05) < 0.1
+
+    unlimited = Scheduler(scheduler.history)
+    unlimited.plan(list(groups), ["show_x"], workers=2, groups=groups)
+    assert unlimited.predicted == 5.0
+    _, peak, actual = run_scheduled(unlimited, order, scale=0.05)
+    assert peak["a"] == 2
+    assert abs(actual - unlimited.predicted * 0.05) < 0.1
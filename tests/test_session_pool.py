@@ -0,0 +1,56 @@
+from test_parse_stage import OUTPUTS, CannedDevice
+
+from cmd2csv.health import CircuitBreaker, FailureLog
+from cmd2csv.parser_pipeline import collect_device
+from cmd2csv.session_pool import SessionPool
+
+
+class FlakyDevice(CannedDevice):
+    """记录连接次数；fail 中的命令抛出异常。"""
+
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.connects = 0
+        self.connected = False
+
+    def connect(self, **kwargs):
+        self.connects += 1
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def execute(self, command, **kwargs):
+        if command in self.fail:
+            raise TimeoutError("prompt not found")
+        return OUTPUTS[command]
+
+
+def test_session_reused_between_jobs():
+    pool = SessionPool()
+    dev = FlakyDevice()
+    for _ in range(2):
+        collect_device(dev, list(OUTPUTS), "ts", sessions=pool)
+    assert dev.connects == 1 and dev.connected
+
+
+def test_failed_command_with_breaker_discards_session():
+    pool = SessionPool()
+    dev = FlakyDevice(fail={"show bench"})
+    failures = FailureLog()
+    result = collect_device(
+        dev, list(OUTPUTS), "ts", sessions=pool,
+        breaker=CircuitBreaker(threshold=5), failures=failures,
+    )
+    # 其余命令照常完成，但会话在归还时断开
+    assert list(result) == ["show_ip_interface_brief"]
+    assert [r["command"] for r in failures.rows] == ["show bench"]
+    assert not dev.connected
+
+    dev.fail.clear()
+    collect_device(dev, list(OUTPUTS), "ts", sessions=pool, breaker=CircuitBreaker(threshold=5))
+    assert dev.connects == 2 and dev.connected
@@ -0,0 +1,101 @@
+import csv
+
+from cmd2csv.flatten import clear_plans, record_key_columns
+from cmd2csv.health import FailureLog
+from cmd2csv.snapshot import DeltaExporter
+
+
+def genie_rows(hostname, interfaces):
+    return [
+        {
+            "hostname": hostname, "os": "iosxe", "command": "show vrf interfaces",
+            "parse_engine": "genie", "vrf": "default", "interface": name, "ip": ip,
+        }
+        for name, ip in interfaces.items()
+    ]
+
+
+def run(tmp_path, rows_by_host, **kwargs):
+    out = tmp_path / "out"
+    with DeltaExporter(str(out), str(tmp_path / "snap"), **kwargs) as exporter:
+        for rows in rows_by_host:
+            exporter.add_rows("show_vrf_interfaces", rows)
+    path = out / "show_vrf_interfaces.changes.csv"
+    if not path.exists():
+        return []
+    with path.open(newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_genie_rows_keyed_by_plan_key_columns(tmp_path):
+    clear_plans()
+    # ParseStage 从解析进程带回的键列
+    record_key_columns("iosxe", "show vrf interfaces", ["vrf", "interface"])
+    run(tmp_path, [genie_rows("r1", {"Gi0/0": "10.0.0.1", "Gi0/1": "10.0.0.2"})])
+
+    changes = run(tmp_path, [genie_rows("r1", {"Gi0/0": "10.0.0.9"})])
+    by_change = {c["change"]: c for c in changes}
+    # 按 vrf + interface 对齐：Gi0/0 是 changed 而不是 removed + added
+    assert by_change["changed"]["interface"] == "Gi0/0"
+    assert by_change["changed"]["ip"] == "10.0.0.9"
+    assert by_change["removed"]["interface"] == "Gi0/1"
+    assert by_change["removed"]["vrf"] == "default"
+    assert len(changes) == 2
+
+
+def test_failed_command_keeps_snapshot_and_reports_no_removals(tmp_path):
+    clear_plans()
+    record_key_columns("iosxe", "show vrf interfaces", ["vrf", "interface"])
+    r1 = genie_rows("r1", {"Gi0/0": "10.0.0.1"})
+    r2 = genie_rows("r2", {"Gi0/0": "10.0.1.1", "Gi0/1": "10.0.1.2"})
+    run(tmp_path, [r1, r2])
+
+    # r2 仍被采集（另一条命令有行），但这条命令失败了
+    failures = FailureLog()
+    failures.add("r2", "command", "timed out", command="show vrf interfaces")
+    out = tmp_path / "out2"
+    with DeltaExporter(str(out), str(tmp_path / "snap"), failures=failures) as exporter:
+        exporter.add_rows("show_vrf_interfaces", genie_rows("r1", {"Gi0/0": "10.0.0.1"}))
+        exporter.add_rows("show_version", [{"hostname": "r2", "command": "show version", "version": "17"}])
+    assert not (out / "show_vrf_interfaces.changes.csv").exists()
+
+    # 下次成功时仍与 r2 上次成功的结果比较
+    changes = run(tmp_path, [r1, genie_rows("r2", {"Gi0/0": "10.0.1.1"})])
+    assert [(c["hostname"], c["change"], c["interface"]) for c in changes] == [("r2", "removed", "Gi0/1")]
+
+
+def read_csv(path):
+    with path.open(newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_split_mode_added_changed_removed(tmp_path):
+    def rows(hostname, table):
+        return [
+            {"hostname": hostname, "timestamp": ts, "command": "show ip interface brief",
+             "parse_engine": "ntc", "intf": intf, "status": status}
+            for ts, (intf, status) in zip(("t1", "t2", "t3"), table.items())
+        ]
+
+    keys = {"show_ip_interface_brief": ["intf"]}
+
+    def export(out, batches):
+        with DeltaExporter(str(tmp_path / out), str(tmp_path / "snap"), mode="split", key_columns=keys) as exporter:
+            for batch in batches:
+                exporter.add_rows("show_ip_interface_brief", batch)
+        return tmp_path / out
+
+    first = export("run1", [rows("r1", {"Gi0/0": "up", "Gi0/1": "up"}), rows("r2", {"Gi0/0": "up"})])
+    assert len(read_csv(first / "show_ip_interface_brief.added.csv")) == 3
+
+    # r2 本次未采集：保留其快照，不输出 removed
+    second = export("run2", [rows("r1", {"Gi0/1": "down", "Gi0/2": "up"})])
+    added = read_csv(second / "show_ip_interface_brief.added.csv")
+    changed = read_csv(second / "show_ip_interface_brief.changed.csv")
+    removed = read_csv(second / "show_ip_interface_brief.removed.csv")
+    assert [(r["hostname"], r["intf"]) for r in added] == [("r1", "Gi0/2")]
+    assert [(r["hostname"], r["intf"], r["status"]) for r in changed] == [("r1", "Gi0/1", "down")]
+    assert removed == [{"hostname": "r1", "command": "show ip interface brief", "intf": "Gi0/0"}]
+
+    third = export("run3", [rows("r1", {"Gi0/1": "down", "Gi0/2": "up"}), rows("r2", {})])
+    assert not any(third.glob("*.csv"))
@@ -0,0 +1,70 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from cmd2csv import template_registry
+from cmd2csv.template_registry import TemplateRegistry, ntc_template_paths
+
+TEMPLATE = """\
+Value NAME (\\S+)
+Value STATE (\\S+)
+
+Start
+  ^${NAME}\\s+${STATE} -> Record
+"""
+
+
+def test_touched_template_is_recompiled(tmp_path):
+    path = tmp_path / "cisco_ios__show_bench.textfsm"
+    path.write_text(TEMPLATE)
+    registry = TemplateRegistry(str(tmp_path), recheck_interval=0)
+    first = registry.get("cisco_ios", "show_bench")
+    assert first.header == ["NAME", "STATE"]
+    assert registry.get("cisco_ios", "show_bench") is first
+
+    path.write_text(TEMPLATE.replace("STATE", "STATUS"))
+    mtime = first.mtime + 10
+    os.utime(path, (mtime, mtime))
+    second = registry.get("cisco_ios", "show_bench")
+    assert second is not first and second.header == ["NAME", "STATUS"]
+    assert second.parse("peer1 Estab\n") == [{"name": "peer1", "status": "Estab"}]
+
+
+class CountingIndex:
+    """代替 NTC clitable：记录 GetRowMatch 调用次数，不匹配任何命令。"""
+
+    def __init__(self):
+        self.lookups = 0
+        self.index = SimpleNamespace(GetRowMatch=self.match)
+
+    def match(self, attributes):
+        self.lookups += 1
+        return 0
+
+
+@pytest.fixture
+def ntc_index(monkeypatch):
+    index = CountingIndex()
+    monkeypatch.setattr(template_registry, "_ntc_template_dir", lambda: "/ntc")
+    monkeypatch.setattr(template_registry, "_ntc_index", lambda template_dir: index)
+    ntc_template_paths.cache_clear()
+    yield index
+    ntc_template_paths.cache_clear()
+
+
+def test_ntc_lookup_lru_evicts_least_recent_at_bound(ntc_index):
+    bound = ntc_template_paths.cache_info().maxsize
+    for i in range(bound):
+        assert ntc_template_paths("cisco_ios", f"show x{i}") is None
+    assert ntc_index.lookups == bound
+
+    # 命中 show x0 使其成为最近使用；超出上限时淘汰 show x1
+    ntc_template_paths("cisco_ios", "show x0")
+    ntc_template_paths("cisco_ios", "show new")
+    assert ntc_template_paths.cache_info().currsize == bound
+    assert ntc_index.lookups == bound + 1
+    ntc_template_paths("cisco_ios", "show x0")
+    assert ntc_index.lookups == bound + 1
+    ntc_template_paths("cisco_ios", "show x1")
+    assert ntc_index.lookups == bound + 2